@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+
+# Function to write a file next to path under a unique temporary name (deleted again if
+# write fails); returns the temporary path for the caller to rename into place
+def write_temp(path, write, mode='wb'):
+    directory, name = os.path.split(os.path.abspath(path))
+    encoding = None if 'b' in mode else 'utf-8'
+    with tempfile.NamedTemporaryFile(mode, encoding=encoding, dir=directory, prefix=name + '.', suffix='.tmp',
+                                     delete=False) as f:
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    return f.name
+
+
+# Function to replace path with what write(f) writes, atomically. Every call gets its own
+# temporary file, so workers saving the same file at once never write into each other's.
+def write_atomically(path, write, mode='wb'):
+    os.replace(write_temp(path, write, mode), path)
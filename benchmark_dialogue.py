@@ -0,0 +1,108 @@
+# Benchmark: per-message cost of the conversation logic, the old if-chain that rebuilds
+# QuickReply/TextSendMessage objects on every message vs the dialogue table with prebuilt
+# messages. LINE is not called; the reply message objects are built and discarded.
+#
+#   python benchmark_dialogue.py [--conversations 20000]
+import argparse
+import random
+import re
+import time
+
+from linebot.models import TextSendMessage, QuickReply, QuickReplyButton, MessageAction
+
+from dialogue import (
+    DialogueEngine, ANSWER, MAIN_MENU, PRICE_MENU, RAM_MENU, QUICK_REPLY_MENUS, STATIC_REPLIES, answer_reply
+)
+
+# One scripted conversation: greeting, brand, bad price, price, bad RAM, RAM, off-topic question
+SCRIPT = ["สวัสดี", "การ์ดจอ NVDIA", "ถูกๆ", "15000 บาท", "RAM 5 GB", "RAM 8 GB", "อากาศวันนี้เป็นไง"]
+
+
+def is_gpu_related(msg):
+    return 'การ์ดจอ' in msg or 'GPU' in msg
+
+
+def answer_question(msg):
+    return "คำตอบ"
+
+
+def quick_reply(options):
+    return QuickReply(items=[QuickReplyButton(action=MessageAction(label=option, text=option)) for option in options])
+
+
+# The if-chain line_main.py used before the dialogue table, reduced to building its replies
+def legacy_handle(state, msg):
+    if 'step' not in state:
+        state['step'] = 1
+        greeting = random.choice(['สวัสดีครับ', 'สวัสดีค่ะ'])
+        return [TextSendMessage(text=f"{greeting} g Test พร้อมใช้งานครับ สามารถเลือก spec การ์ดจอได้เลยครับ",
+                                quick_reply=quick_reply(MAIN_MENU))]
+    if msg == "แนะนำการ์ดจอ":
+        return []
+    if msg in ["การ์ดจอ NVDIA", "การ์ดจอ AMD"]:
+        state['gpu_type'] = msg
+        state['step'] = 2
+        return [TextSendMessage(text="ขอทราบราคาครับ", quick_reply=quick_reply(PRICE_MENU))]
+    if state['step'] == 0:
+        text = answer_question(msg) if is_gpu_related(msg) else "ผมไม่สามารถตอบคำถามนอกเหนือจาก GPU ได้ครับ"
+        return [TextSendMessage(text=text, quick_reply=quick_reply(MAIN_MENU))]
+    if state['step'] == 2:
+        price_match = re.search(r'(\d+)', msg)
+        if price_match and 5000 <= int(price_match.group(1)) <= 100000:
+            state['price'] = int(price_match.group(1))
+            state['step'] = 3
+            return [TextSendMessage(text="ขอทราบรายละเอียดเพิ่มเติมครับ", quick_reply=quick_reply(RAM_MENU))]
+        text = "กรุณาเลือกราคาภายในช่วง 5000-100000 บาทครับ" if price_match else "กรุณาระบุราคาเป็นตัวเลขครับ"
+        return [TextSendMessage(text=text, quick_reply=quick_reply(PRICE_MENU))]
+    if state['step'] == 3:
+        if msg in ["RAM 4 GB", "RAM 6 GB", "RAM 8 GB", "RAM 12 GB"]:
+            state['ram'] = msg
+            state['step'] = 0
+            return [TextSendMessage(text="กำลังค้นหาการ์ดจอที่ตรงกับความต้องการของคุณ...")]
+        return [TextSendMessage(text="กรุณาเลือกระหว่าง RAM 4 GB, 6 GB, 8 GB หรือ 12 GB ครับ",
+                                quick_reply=quick_reply(RAM_MENU))]
+    if not is_gpu_related(msg):
+        state['step'] = 0
+        return [TextSendMessage(text="ผมไม่สามารถตอบคำถามนอกเหนือจาก GPU ได้ครับ", quick_reply=quick_reply(MAIN_MENU))]
+    return []
+
+
+def table_handler():
+    quick_replies = {menu: quick_reply(menu) for menu in QUICK_REPLY_MENUS}
+    messages = {reply: TextSendMessage(text=reply.text, quick_reply=quick_replies.get(reply.quick_reply))
+                for reply in STATIC_REPLIES}
+    engine = DialogueEngine(is_gpu_related)
+
+    def handle(state, msg):
+        turn = engine.handle(state, msg)
+        replies = turn.replies + ((answer_reply(answer_question(msg)),) if turn.action == ANSWER else ())
+        return [messages.get(reply) or TextSendMessage(text=reply.text, quick_reply=quick_replies.get(reply.quick_reply))
+                for reply in replies]
+    return handle
+
+
+def run(handle, conversations):
+    start = time.perf_counter()
+    for _ in range(conversations):
+        state = {}
+        for msg in SCRIPT:
+            handle(state, msg)
+    elapsed = time.perf_counter() - start
+    return elapsed / (conversations * len(SCRIPT)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation logic per-message benchmark")
+    parser.add_argument("--conversations", type=int, default=20000)
+    args = parser.parse_args()
+
+    legacy = run(legacy_handle, args.conversations)
+    table = run(table_handler(), args.conversations)
+    print(f"{'variant':<12}{'us/message':>12}")
+    print(f"{'if-chain':<12}{legacy:>12.2f}")
+    print(f"{'table':<12}{table:>12.2f}")
+    print(f"speedup: {legacy / table:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
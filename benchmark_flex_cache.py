@@ -0,0 +1,79 @@
+# Benchmark: cost of producing the push body for a product carousel, rebuilding the bubble
+# dicts and serializing them through the LINE SDK on every call vs FlexCarouselCache
+# (precompiled bubbles, cached serialized carousel). Reports time and the peak memory
+# allocated (tracemalloc) per call; no request is sent.
+#
+#   python benchmark_flex_cache.py [--products 300] [--calls 5000]
+import argparse
+import json
+import time
+import tracemalloc
+
+from linebot.models import FlexSendMessage
+
+from flex_cache import FlexCarouselCache, product_bubble, MAX_BUBBLES
+
+
+def synthetic_products(count):
+    return [{
+        'name': f"การ์ดจอ BENCH-{i} RTX 4060 8GB GDDR6",
+        'price': f"฿{9000 + i * 50:,}",
+        'image': f"https://example.com/images/bench-{i}.jpg",
+        'url': f"https://example.com/product/bench-{i}",
+    } for i in range(count)]
+
+
+# The old send_flex_message path: new bubble dicts, SDK message objects, then the SDK's json.dumps
+def uncached_body(user_id, products):
+    bubbles = [product_bubble(product) for product in products[:MAX_BUBBLES]]
+    message = FlexSendMessage(alt_text="Product List", contents={"type": "carousel", "contents": bubbles})
+    return json.dumps({'to': user_id, 'messages': [message.as_json_dict()]})
+
+
+def cached_body(cache, user_id, products):
+    payload = cache.get_or_build(('recommend',), lambda: products)
+    return '{"to":' + json.dumps(user_id) + ',"messages":[' + payload + ']}'
+
+
+def measure(label, call, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(100):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    print(f"{label:<10}{elapsed / calls * 1e6:>12.1f}{sum(peaks) / len(peaks) / 1024:>16.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flex carousel cache benchmark")
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    products = synthetic_products(args.products)
+    carousel = products[:7]
+    user_id = 'U' + '0' * 32
+
+    start = time.perf_counter()
+    cache = FlexCarouselCache()
+    cache.compile(products, version=1)
+    print(f"precompiled {args.products} bubbles in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    assert json.loads(cached_body(cache, user_id, carousel)) == json.loads(uncached_body(user_id, carousel))
+
+    print(f"{'variant':<10}{'us/call':>12}{'allocated KiB':>16}")
+    measure("uncached", lambda: uncached_body(user_id, carousel), args.calls)
+    measure("cached", lambda: cached_body(cache, user_id, carousel), args.calls)
+    print(cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Benchmark: intent router accuracy on the labelled set in intent_test_set.json,
+# plus centroid build time and single/batched classification latency.
+#
+#   python benchmark_intent_router.py [--threshold 0.35]
+import argparse
+import json
+import time
+from collections import Counter
+
+from sentence_transformers import SentenceTransformer
+
+from intent_router import IntentRouter
+
+MODEL_NAME = 'sentence-transformers/distiluse-base-multilingual-cased-v2'
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent router benchmark")
+    parser.add_argument("--threshold", type=float, default=0.35)
+    parser.add_argument("--test-set", default="intent_test_set.json")
+    args = parser.parse_args()
+
+    with open(args.test_set, encoding='utf-8') as f:
+        test_set = json.load(f)
+    texts = [row['text'] for row in test_set]
+    labels = [row['intent'] for row in test_set]
+
+    model = SentenceTransformer(MODEL_NAME)
+    router = IntentRouter(lambda batch: model.encode(batch, convert_to_numpy=True, batch_size=64),
+                          threshold=args.threshold)
+
+    start = time.perf_counter()
+    router.centroids()
+    print(f"centroids built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # One message at a time, the way handle_message calls it
+    latencies, predictions = [], []
+    for text in texts:
+        start = time.perf_counter()
+        predictions.append(router.classify(text)[0])
+        latencies.append(time.perf_counter() - start)
+    print(f"single: p50={percentile(latencies, 0.5) * 1000:.2f} ms  p99={percentile(latencies, 0.99) * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    batch_predictions = [intent for intent, _ in router.classify_batch(texts)]
+    elapsed = time.perf_counter() - start
+    print(f"batch of {len(texts)}: {elapsed * 1000:.2f} ms ({elapsed / len(texts) * 1000:.2f} ms/message)")
+    assert batch_predictions == predictions
+
+    correct = sum(p == l for p, l in zip(predictions, labels))
+    print(f"accuracy: {correct}/{len(labels)} = {correct / len(labels):.2%}")
+    totals, hits = Counter(labels), Counter(l for p, l in zip(predictions, labels) if p == l)
+    for intent in router.intents:
+        print(f"  {intent:<13} recall {hits[intent]}/{totals[intent]}")
+    for text, p, l in zip(texts, predictions, labels):
+        if p != l:
+            print(f"  miss: {text!r} expected {l}, got {p}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Benchmark: LineMessagingClient against stub_line.py failing a share of calls with 500
+# and answering 429 above a request rate. Compares a client without retries or rate
+# limiting to the default one: pushes delivered, failed, retried, and latency per push.
+#
+#   python benchmark_line_client.py [--pushes 500] [--threads 16] [--error-rate 0.1] [--max-rps 200]
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from line_client import LineMessagingClient, LineApiError, serialize_message
+from metrics import Histogram
+from stub_line import start_stub_line
+
+MESSAGE = serialize_message({"type": "text", "text": "ต้องการค้นหาการ์ดจอเพิ่มเติมหรือไม่?"})
+
+
+def run(label, client, pushes, threads):
+    end_to_end = Histogram()
+
+    def push(i):
+        start = time.perf_counter()
+        try:
+            client.push(f"U{i:032d}", [MESSAGE])
+            return True
+        except LineApiError:
+            return False
+        finally:
+            end_to_end.observe(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        delivered = sum(pool.map(push, range(pushes)))
+    elapsed = time.perf_counter() - start
+    stats = client.stats()
+    latency = end_to_end.snapshot()
+    print(f"{label:<10}{delivered:>10}{pushes - delivered:>8}{stats['retries']:>9}"
+          f"{latency['p50_ms']:>9}{latency['p99_ms']:>9}{elapsed:>9.1f}")
+    client.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LINE client retry/rate-limit validation")
+    parser.add_argument("--pushes", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--max-rps", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.02, help="stub seconds per API call")
+    args = parser.parse_args()
+
+    print(f"{'variant':<10}{'delivered':>10}{'failed':>8}{'retries':>9}{'p50 ms':>9}{'p99 ms':>9}{'secs':>9}")
+    server, base_url = start_stub_line(delay=args.delay, error_rate=args.error_rate, max_rps=args.max_rps)
+    run("naive", LineMessagingClient('TEST_TOKEN', endpoint=base_url, max_retries=0, rate_limit=0),
+        args.pushes, args.threads)
+    server.shutdown()
+
+    server, base_url = start_stub_line(delay=args.delay, error_rate=args.error_rate, max_rps=args.max_rps)
+    stats = run("default", LineMessagingClient('TEST_TOKEN', endpoint=base_url, rate_limit=args.max_rps * 0.9),
+                args.pushes, args.threads)
+    handler = server.RequestHandlerClass
+    print(f"stub accepted {len(handler.calls)} pushes, rejected {handler.rejected}")
+    print(f"per-attempt latency: {stats['latency']['push']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
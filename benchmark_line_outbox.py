@@ -0,0 +1,71 @@
+# Benchmark: LINE API calls per event when every message is sent on its own (the old
+# reply + push + push after a search) vs collected in an Outbox, against stub_line.py.
+# Also checks the push fallback for an expired reply token and for more than 5 messages.
+#
+#   python benchmark_line_outbox.py [--events 200] [--delay 0.05]
+import argparse
+import time
+
+from line_client import LineMessagingClient, Outbox, serialize_message
+from stub_line import start_stub_line
+
+USER_ID = 'U' + '0' * 32
+
+# Messages of one search turn: the "searching" reply, the carousel and the quick-reply prompt
+SEARCH_TURN = [
+    {"type": "text", "text": "กำลังค้นหาการ์ดจอที่ตรงกับความต้องการของคุณ..."},
+    {"type": "flex", "altText": "Product List", "contents": {"type": "carousel", "contents": []}},
+    {"type": "text", "text": "ต้องการค้นหาการ์ดจอเพิ่มเติมหรือไม่?"},
+]
+
+
+def one_by_one(client, event):
+    messages = [serialize_message(message) for message in SEARCH_TURN]
+    client.reply(f"single-{event}", messages[:1])
+    for message in messages[1:]:
+        client.push(USER_ID, [message])
+
+
+def batched(client, event, reply_token=None):
+    outbox = Outbox(client, USER_ID, reply_token or f"batched-{event}", event_time=time.time() * 1000)
+    outbox.add(*SEARCH_TURN)
+    outbox.flush()
+
+
+def run(label, base_url, send, events):
+    client = LineMessagingClient('TEST_TOKEN', endpoint=base_url)
+    start = time.perf_counter()
+    for event in range(events):
+        send(client, event)
+    elapsed = time.perf_counter() - start
+    calls = client.calls
+    print(f"{label:<12}{(calls['reply'] + calls['push']) / events:>12.2f}{calls['push'] / events:>12.2f}"
+          f"{elapsed / events * 1000:>12.1f}")
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LINE outbound batching benchmark")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05, help="stub seconds per API call")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_line(delay=args.delay)
+    print(f"{'variant':<12}{'calls/event':>12}{'pushes':>12}{'ms/event':>12}")
+    run("one-by-one", base_url, lambda client, event: one_by_one(client, event), args.events)
+    run("outbox", base_url, lambda client, event: batched(client, event), args.events)
+
+    # Expired reply token: one failed reply, then everything is pushed
+    client = LineMessagingClient('TEST_TOKEN', endpoint=base_url)
+    batched(client, 0, reply_token="expired-token")
+    print(f"expired token: {client.calls}")
+
+    # Seven messages: five in the reply, two in one push
+    outbox = Outbox(client, USER_ID, "token-seven")
+    outbox.add(*(SEARCH_TURN * 3)[:7])
+    print(f"7 messages: {outbox.flush()} calls")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Benchmark: startup cost of the sentence-transformers model for each load mode and CPU
+# backend. Every combination runs in a fresh interpreter that imports line_main.py and then
+# classifies one message, the first thing a free-text webhook does. Reports the import
+# time, the time until that first answer, steady-state encode latency and peak RSS.
+# Neo4j is not needed (the catalog loads lazily).
+#
+#   python benchmark_model_startup.py [--loads lazy,background,eager] [--backends torch,quantized,onnx]
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = r'''
+import json, resource, time
+start = time.perf_counter()
+import line_main
+imported = time.perf_counter() - start
+line_main.is_gpu_related_question("การ์ดจอตัวไหนเล่นเกมลื่นสุด")
+first = time.perf_counter() - start
+timings = []
+for _ in range(20):
+    t = time.perf_counter()
+    line_main.model.encode(["RTX 4060 กับ RX 7600 ต่างกันยังไง"], convert_to_numpy=True)
+    timings.append(time.perf_counter() - t)
+timings.sort()
+print(json.dumps({
+    "import_s": imported,
+    "first_answer_s": first,
+    "load_s": line_main.model.load_seconds,
+    "encode_p50_ms": timings[len(timings) // 2] * 1000,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+
+def run(load, backend):
+    env = dict(os.environ, EMBEDDING_LOAD=load, EMBEDDING_BACKEND=backend,
+               INTENT_CACHE_PATH="")  # Build the intent centroids with this backend
+    result = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True)
+    if result.returncode:
+        print(f"{load}/{backend} failed:\n{result.stderr[-2000:]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model startup benchmark")
+    parser.add_argument("--loads", default="lazy,background,eager")
+    parser.add_argument("--backends", default="torch,quantized,onnx")
+    args = parser.parse_args()
+
+    print(f"{'load':<12}{'backend':<11}{'import s':>10}{'first answer s':>16}{'model load s':>14}"
+          f"{'encode p50 ms':>15}{'peak RSS MB':>13}")
+    for backend in args.backends.split(','):
+        for load in args.loads.split(','):
+            stats = run(load, backend)
+            if stats:
+                print(f"{load:<12}{backend:<11}{stats['import_s']:>10.2f}{stats['first_answer_s']:>16.2f}"
+                      f"{stats['load_s'] or 0:>14.2f}{stats['encode_p50_ms']:>15.2f}{stats['peak_rss_mb']:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
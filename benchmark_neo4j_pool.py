@@ -0,0 +1,88 @@
+# Benchmark: a new Neo4j driver per call (old behaviour) vs the shared pooled driver.
+#
+#   python benchmark_neo4j_pool.py               # against the Neo4j configured in neo4j_pool
+#   python benchmark_neo4j_pool.py --stand-in    # no database needed, simulated latencies
+import argparse
+import time
+from contextlib import contextmanager
+
+from neo4j import GraphDatabase
+import neo4j_pool
+
+QUERY = "RETURN 1 AS ok"
+
+
+# Stand-in for a Neo4j driver: creating one pays the TCP/Bolt handshake, auth and
+# routing-table fetch, every query pays one round trip.
+class StandInDriver:
+    def __init__(self, handshake_ms, query_ms):
+        self.query_ms = query_ms
+        time.sleep(handshake_ms / 1000)
+
+    @contextmanager
+    def session(self, **kwargs):
+        yield self
+
+    def run(self, query, parameters=None):
+        time.sleep(self.query_ms / 1000)
+        return self
+
+    def consume(self):
+        return None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def time_calls(label, func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {count} queries in {elapsed:.3f}s  "
+          f"{elapsed / count * 1000:.2f} ms/query  {count / elapsed:.1f} queries/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call vs pooled Neo4j driver benchmark")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--stand-in", action="store_true", help="use a simulated driver instead of Neo4j")
+    parser.add_argument("--handshake-ms", type=float, default=20.0, help="stand-in driver creation cost")
+    parser.add_argument("--query-ms", type=float, default=1.0, help="stand-in query round trip")
+    args = parser.parse_args()
+
+    if args.stand_in:
+        def new_driver():
+            return StandInDriver(args.handshake_ms, args.query_ms)
+        neo4j_pool._driver = new_driver()
+    else:
+        def new_driver():
+            return GraphDatabase.driver(neo4j_pool.URI, auth=neo4j_pool.AUTH)
+
+    # Old pattern: every query builds and tears down its own driver
+    def per_call():
+        with new_driver() as driver:
+            with driver.session() as session:
+                session.run(QUERY).consume()
+
+    # New pattern: every query borrows a connection from the shared pool
+    def pooled():
+        neo4j_pool.run_query(QUERY)
+
+    pooled()  # Open the pool before timing
+    per_call_time = time_calls("per-call driver", per_call, args.queries)
+    pooled_time = time_calls("pooled driver", pooled, args.queries)
+    print(f"speed-up: {per_call_time / pooled_time:.1f}x")
+
+    neo4j_pool.close_driver()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Benchmark: a burst of GPU questions against stub_ollama.py imitating a CPU-only host
+# (tokens slow down with every concurrent generation), sent straight to Ollama vs through
+# the scheduler's bounded slots and per-user queues. Reports latency of the answered
+# questions, busy replies and the peak number of generations at the stub. Then checks the
+# keep-alive pings: two bursts with a pause longer than the model's keep_alive in between.
+#
+#   python benchmark_ollama_scheduler.py [--users 12] [--questions 1] [--concurrency 2] [--deadline 3]
+import argparse
+import threading
+import time
+
+import ollama_client
+from ollama_scheduler import ModelKeepWarm, OllamaScheduler
+from stub_ollama import start_stub_ollama
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Function to have every user ask their questions one after another, all users at once;
+# returns (seconds to an answer, busy replies)
+def burst(users, questions, tag):
+    latencies, busy = [], []
+    lock = threading.Lock()
+
+    def ask(user):
+        for question in range(questions):
+            start = time.perf_counter()
+            # A distinct question each time, so the answer cache never helps
+            answer = ollama_client.ollama_response(f"การ์ดจอตัวไหนเล่นเกมลื่น {tag} {user} {question}",
+                                                   user_id=f"user-{user}")
+            with lock:
+                if isinstance(answer, ollama_client.FallbackReply):
+                    busy.append(answer)
+                else:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=ask, args=(user,)) for user in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, busy
+
+
+def run(label, scheduler, server, args):
+    while server.RequestHandlerClass.in_flight:
+        time.sleep(0.05)  # Let the stub notice the streams the last run closed early
+    ollama_client.scheduler = scheduler
+    server.RequestHandlerClass.max_in_flight = 0
+    start = time.perf_counter()
+    latencies, busy = burst(args.users, args.questions, label)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<11} answered={len(latencies):3d} busy={len(busy):3d}  "
+          f"p50={percentile(latencies, 0.50):6.2f} s  p95={percentile(latencies, 0.95):6.2f} s  "
+          f"max={max(latencies, default=0.0):6.2f} s  burst={elapsed:6.2f} s  "
+          f"peak generations={server.RequestHandlerClass.max_in_flight}")
+    for reply in sorted(set(busy)):
+        print(f"            busy reply: {reply}")
+
+
+# Function to time the first question after an idle pause longer than the model's keep_alive
+def after_pause(label, interval, server, args):
+    handler = server.RequestHandlerClass
+    ollama_client.scheduler = OllamaScheduler(concurrency=args.concurrency, deadline=args.deadline)
+    keep_warm = ModelKeepWarm(ollama_client.keep_alive_ping, ollama_client.scheduler, interval)
+    burst(1, 1, f"{label} before")
+    loads = handler.model_loads
+    keep_warm.start()
+    time.sleep(args.pause)
+    start = time.perf_counter()
+    burst(1, 1, f"{label} after")
+    elapsed = time.perf_counter() - start
+    keep_warm.stop()
+    print(f"{label:<17} first question after {args.pause:.0f} s idle: {elapsed:5.2f} s   "
+          f"model reloads={handler.model_loads - loads}  pings={keep_warm.pings}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama scheduler benchmark")
+    parser.add_argument("--users", type=int, default=12)
+    parser.add_argument("--questions", type=int, default=1, help="questions per user, asked one after another")
+    parser.add_argument("--concurrency", type=int, default=2, help="scheduler slots")
+    parser.add_argument("--deadline", type=float, default=3, help="seconds a question may wait for a slot")
+    parser.add_argument("--delay", type=float, default=0.2, help="stub time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="stub seconds per token, one generation")
+    parser.add_argument("--load-delay", type=float, default=2.0, help="stub seconds to load the model")
+    parser.add_argument("--pause", type=float, default=4.0, help="idle seconds between the keep-alive bursts")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_ollama(delay=args.delay, token_delay=args.token_delay, contention=True,
+                                         load_delay=args.load_delay)
+    ollama_client.OLLAMA_URL = base_url
+    ollama_client.response_cache.max_size = 0
+    burst(1, 1, "load")  # Load the model before timing anything
+
+    print(f"{args.users} users x {args.questions} questions, tokens slow down with every concurrent generation")
+    run("unbounded", OllamaScheduler(concurrency=args.users, deadline=3600), server, args)
+    run("scheduled", OllamaScheduler(concurrency=args.concurrency, deadline=args.deadline), server, args)
+
+    # The model is unloaded keep_alive seconds after the last request, unless pinged before
+    ollama_client.OLLAMA_KEEP_ALIVE = f"{args.pause / 2:g}s"
+    print(f"\nkeep_alive={ollama_client.OLLAMA_KEEP_ALIVE}, stub model load={args.load_delay:.1f} s")
+    after_pause("no keep-alive", 0, server, args)
+    after_pause("keep-alive pings", args.pause / 8, server, args)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Benchmark: buffered ("stream": false) vs streaming Ollama generation against stub_ollama.py.
+# Reports time-to-first-token and total latency.
+#
+#   python benchmark_ollama_stream.py [--runs 10] [--delay 0.3] [--token-delay 0.03]
+import argparse
+import json
+import time
+
+import requests
+
+import ollama_client
+from stub_ollama import start_stub_ollama
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(label, first_token, total):
+    print(f"{label:<11} first token p50={percentile(first_token, 0.5) * 1000:7.1f} ms   "
+          f"total p50={percentile(total, 0.5) * 1000:7.1f} ms  p95={percentile(total, 0.95) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming Ollama benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.3, help="stub time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub seconds per token")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_ollama(delay=args.delay, token_delay=args.token_delay)
+    ollama_client.OLLAMA_URL = base_url
+    question = "การ์ดจอตัวไหนเล่นเกมลื่น"
+
+    # Old client: one blocking POST, the answer arrives only when generation finishes
+    totals = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        response = requests.post(base_url + "/api/generate", data=json.dumps({
+            "model": ollama_client.OLLAMA_MODEL,
+            "prompt": ollama_client.build_prompt(question),
+            "stream": False,
+        }))
+        json.loads(response.text)
+        totals.append(time.perf_counter() - start)
+    report("buffered", totals, totals)
+
+    # New client: streamed chunks, stops at the word budget
+    first_tokens, totals = [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        stream = ollama_client.stream_generate(ollama_client.build_prompt(question))
+        next(stream)
+        first_tokens.append(time.perf_counter() - start)
+        stream.close()
+
+        start = time.perf_counter()
+        answer = ollama_client.generate(question)
+        totals.append(time.perf_counter() - start)
+    report("streaming", first_tokens, totals)
+    print(f"answer: {answer}")
+    print(f"streams cancelled early by the client: {server.RequestHandlerClass.cancelled}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
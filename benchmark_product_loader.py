@@ -0,0 +1,56 @@
+# Benchmark: products per second written by ProductBulkLoader at different batch sizes.
+# Writes synthetic "BENCH-" products to the Neo4j configured in neo4j_pool and removes them afterwards.
+#
+#   python benchmark_product_loader.py [--products 2000] [--batch-sizes 1 10 100 500 1000]
+import argparse
+import random
+import time
+
+from neo4j_pool import run_query, close_driver
+from product_loader import ProductBulkLoader, ensure_product_schema
+
+CHIPSETS = ["GEFORCE RTX 4060", "GEFORCE RTX 4070 SUPER", "RADEON RX 7600", "RADEON RX 7800 XT"]
+
+
+def synthetic_products(count, run):
+    for i in range(count):
+        chipset = random.choice(CHIPSETS)
+        vram = random.choice([8, 12, 16])
+        yield {
+            'name': f"BENCH-{run}-{i} ASUS DUAL {chipset} {vram}GB",
+            'price': f"฿{random.randint(5000, 60000):,}",
+            'img': f"https://example.com/{i}.jpg",
+            'url': f"https://example.com/product/{run}/{i}",
+            'additional_data': f"Brand: ASUS\nMemory Size: {vram}GB\nBus: PCIe 4.0\n",
+        }
+
+
+def delete_bench_products():
+    run_query("MATCH (p:Product) WHERE p.name STARTS WITH 'BENCH-' DETACH DELETE p")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk product loader benchmark")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 500, 1000])
+    args = parser.parse_args()
+
+    ensure_product_schema()
+    delete_bench_products()
+    try:
+        for batch_size in args.batch_sizes:
+            products = list(synthetic_products(args.products, batch_size))
+            start = time.perf_counter()
+            with ProductBulkLoader(batch_size) as loader:
+                for product in products:
+                    loader.add(product)
+            elapsed = time.perf_counter() - start
+            print(f"batch={batch_size:>5}  {args.products} products in {elapsed:6.2f}s  "
+                  f"{args.products / elapsed:8.0f} products/s")
+    finally:
+        delete_bench_products()
+        close_driver()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Benchmark: search ranking on a generated catalog. The legacy path builds a dict per
+# matching product, sorts all of them by price difference and keeps the first page; the
+# ranking engine filters and scores the NumPy columns in one pass and selects the page
+# with argpartition. Also times "more results" pages, which reuse the cached ranking.
+#
+#   python benchmark_product_ranking.py [--products 20000] [--searches 2000]
+import argparse
+import random
+import time
+
+from flex_cache import MAX_BUBBLES
+from product_ranking import RankingEngine
+from stub_neo4j import generate_products
+
+PRICES = (5000, 10000, 15000, 25000, 35000, 50000, 80000, 100000)
+VRAM_SIZES = (4, 6, 8, 12)
+
+
+def legacy_search(products, brand, max_price, min_vram):
+    matches = []
+    for product in products:
+        if product['brand'] == brand and product['price_thb'] <= max_price and product['vram_gb'] >= min_vram:
+            matches.append(dict(product, price_difference=max_price - product['price_thb']))
+    matches.sort(key=lambda product: product['price_difference'])
+    return matches[:MAX_BUBBLES]
+
+
+def timed(label, searches, run):
+    start = time.perf_counter()
+    for search in searches:
+        run(*search)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32}{elapsed / len(searches) * 1e6:>10.1f} us/search")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search ranking benchmark")
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--searches", type=int, default=2000)
+    args = parser.parse_args()
+
+    products = generate_products(args.products)
+    rng = random.Random(1)
+    searches = [(rng.choice(('NVIDIA', 'AMD')), float(rng.choice(PRICES)), rng.choice(VRAM_SIZES))
+                for _ in range(args.searches)]
+    engine = RankingEngine(cache_size=0)  # Every search scored from scratch
+
+    start = time.perf_counter()
+    engine.compile(products, version=1)
+    print(f"compiled {len(products)} products in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    timed("legacy (dicts + full sort)", searches, lambda *search: legacy_search(products, *search))
+    timed("ranking engine, first page", searches, lambda *search: engine.rank(*search).page(0, MAX_BUBBLES))
+
+    cached = RankingEngine()
+    cached.compile(products, version=1)
+    ranked = [cached.rank(*search) for search in searches]  # Users who asked for more results
+    start = time.perf_counter()
+    for results in ranked:
+        for offset in range(0, 5 * MAX_BUBBLES, MAX_BUBBLES):
+            results.page(offset, MAX_BUBBLES)
+    elapsed = time.perf_counter() - start
+    print(f"{'pages 1-5 (cached ranking)':<32}{elapsed / len(ranked) / 5 * 1e6:>10.1f} us/page")
+
+
+if __name__ == '__main__':
+    main()
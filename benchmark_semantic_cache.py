@@ -0,0 +1,112 @@
+# Benchmark: semantic cache hit rate and lookup latency as the cache grows.
+#
+#   python benchmark_semantic_cache.py               # real model, paraphrased GPU questions
+#   python benchmark_semantic_cache.py --synthetic   # random vectors, lookup latency only
+import argparse
+import random
+import time
+
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+MODEL_NAME = 'sentence-transformers/distiluse-base-multilingual-cased-v2'
+GPUS = ["RTX 4060", "RTX 4070", "RTX 3060", "RX 7600", "RX 7800 XT", "RTX 4090", "Arc A750"]
+QUESTIONS = [
+    "{gpu} เล่นเกมได้ลื่นไหม",
+    "{gpu} เหมาะกับงานตัดต่อวิดีโอหรือไม่",
+    "{gpu} กินไฟเท่าไหร่",
+    "{gpu} ใช้พาวเวอร์ซัพพลายกี่วัตต์",
+    "is the {gpu} good for 1440p gaming",
+]
+PARAPHRASES = [
+    "การ์ดจอ {gpu} เล่นเกมลื่นหรือเปล่า",
+    "{gpu} ตัดต่อวิดีโอได้ดีไหม",
+    "{gpu} ใช้ไฟกี่วัตต์",
+    "ต้องใช้ PSU กี่วัตต์สำหรับ {gpu}",
+    "{gpu} good for gaming at 1440p?",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def time_lookups(cache, queries):
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        answer, _, _ = cache.lookup(query)
+        latencies.append(time.perf_counter() - start)
+        hits += answer is not None
+    return hits / len(queries), latencies
+
+
+def run_model(args):
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME)
+    cache = SemanticCache(lambda texts: model.encode(texts, convert_to_numpy=True),
+                          threshold=args.threshold, max_size=max(args.sizes))
+
+    # Seed with the canonical questions, then pad with unrelated filler to grow the matrix
+    for template in QUESTIONS:
+        for gpu in GPUS:
+            cache.store(template.format(gpu=gpu), f"answer: {template.format(gpu=gpu)}")
+    queries = [template.format(gpu=gpu) for template in PARAPHRASES for gpu in GPUS]
+    filler_id = 0
+    for size in args.sizes:
+        filler = [f"คำถามอื่นหมายเลข {filler_id + i} เรื่องคีย์บอร์ดและเมาส์" for i in range(size - len(cache))]
+        filler_id += len(filler)
+        if filler:
+            for text, vector in zip(filler, cache.embed(filler)):
+                cache.store(text, "filler", vector)
+        hit_rate, latencies = time_lookups(cache, queries)
+        print(f"size={len(cache):>6}  hit_rate={hit_rate:.2%}  "
+              f"lookup p50={percentile(latencies, 0.5) * 1000:.2f}ms  p99={percentile(latencies, 0.99) * 1000:.2f}ms")
+
+
+def run_synthetic(args):
+    dim = 512
+    rng = np.random.default_rng(0)
+    vectors_by_text = {}
+
+    def encode(texts):
+        return np.stack([vectors_by_text[text] for text in texts])
+
+    cache = SemanticCache(encode, threshold=args.threshold, max_size=max(args.sizes))
+    stored = []
+    for size in args.sizes:
+        while len(cache) < size:
+            text = f"q{len(cache)}"
+            vectors_by_text[text] = rng.standard_normal(dim).astype(np.float32)
+            cache.store(text, "answer")
+            stored.append(text)
+
+        # Half the queries are slightly perturbed copies of stored questions (expected hits)
+        queries = []
+        for i in range(200):
+            base = vectors_by_text[random.choice(stored)]
+            noise = rng.standard_normal(dim).astype(np.float32) * (0.1 if i % 2 else 2.0)
+            vectors_by_text[f"query{i}"] = base + noise
+            queries.append(f"query{i}")
+        hit_rate, latencies = time_lookups(cache, queries)
+        print(f"size={len(cache):>6}  hit_rate={hit_rate:.2%}  "
+              f"lookup p50={percentile(latencies, 0.5) * 1000:.3f}ms  p99={percentile(latencies, 0.99) * 1000:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic cache benchmark")
+    parser.add_argument("--synthetic", action="store_true", help="random embeddings instead of the model")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    args = parser.parse_args()
+    if args.synthetic:
+        run_synthetic(args)
+    else:
+        run_model(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+from neo4j_pool import session, run_query, fetch_all
+import atexit
+import os
+import queue
+import threading
+import time
+
+# Write-behind settings (override with environment variables)
+HISTORY_QUEUE_SIZE = int(os.environ.get("HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_FLUSH_SIZE = int(os.environ.get("HISTORY_FLUSH_SIZE", "100"))  # Max turns per transaction
+HISTORY_FLUSH_INTERVAL = float(os.environ.get("HISTORY_FLUSH_INTERVAL", "1.0"))  # Max seconds a turn waits
+HISTORY_BLOCK_TIMEOUT = float(os.environ.get("HISTORY_BLOCK_TIMEOUT", "0"))  # >0 waits for space instead of dropping
+HISTORY_DAY_UTC_OFFSET = float(os.environ.get("HISTORY_DAY_UTC_OFFSET", "7"))  # Hours; days start at local midnight
+
+# Storage model: one Turn node per exchange, grouped under one HistoryDay bucket per user
+# and day, (:User)-[:HISTORY]->(:HistoryDay {day: 20240131})-[:HAS_TURN]->(:Turn).
+# Recent-history lookups only expand the buckets of the last few days, and retention
+# (chat_history_maintenance.py) archives and deletes whole days.
+HISTORY_SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT user_id_unique IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE",
+    "CREATE INDEX history_day IF NOT EXISTS FOR (d:HistoryDay) ON (d.day)",
+    "CREATE CONSTRAINT daily_rollup_unique IF NOT EXISTS FOR (r:DailyRollup) REQUIRE (r.day, r.intent) IS UNIQUE",
+]
+
+# One transaction writes a whole batch of turns
+SAVE_TURNS_QUERY = '''
+UNWIND $rows AS row
+MERGE (u:User {id: row.user_id})
+MERGE (u)-[:HISTORY]->(d:HistoryDay {day: row.day})
+ON CREATE SET d.user_id = row.user_id
+CREATE (d)-[:HAS_TURN]->(:Turn {user_id: row.user_id, message: row.user_message, response: row.bot_response,
+                                timestamp: row.timestamp, intent: row.intent})
+'''
+
+RECENT_TURNS_QUERY = '''
+MATCH (:User {id: $user_id})-[:HISTORY]->(d:HistoryDay)
+WHERE d.day >= $since_day
+MATCH (d)-[:HAS_TURN]->(t:Turn)
+RETURN t.message AS user_message, t.response AS bot_response, t.timestamp AS timestamp, t.intent AS intent
+ORDER BY t.timestamp DESC
+LIMIT $limit
+'''
+
+_STOP = object()
+
+
+# Function to turn a timestamp in milliseconds into its history day bucket (e.g. 20240131)
+def history_day(timestamp_ms, utc_offset_hours=HISTORY_DAY_UTC_OFFSET):
+    return int(time.strftime('%Y%m%d', time.gmtime(timestamp_ms / 1000 + utc_offset_hours * 3600)))
+
+
+# Background writer: handlers enqueue turns, a worker thread batches them into Neo4j
+class ChatHistoryWriter:
+    def __init__(self, max_queue=HISTORY_QUEUE_SIZE, flush_size=HISTORY_FLUSH_SIZE,
+                 flush_interval=HISTORY_FLUSH_INTERVAL, block_timeout=HISTORY_BLOCK_TIMEOUT,
+                 write_batch=None):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._block_timeout = block_timeout
+        self._write_batch = write_batch or write_turns
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._worker = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._worker.start()
+
+    # Function to queue one exchange; never waits on the database.
+    # intent labels the exchange in the daily rollups (e.g. 'gpu_question', 'recommend').
+    def save(self, user_id, user_message, bot_response, intent=None):
+        timestamp = int(time.time() * 1000)  # Same unit as Cypher timestamp()
+        row = {
+            'user_id': user_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'timestamp': timestamp,
+            'day': history_day(timestamp),
+            'intent': intent,
+        }
+        try:
+            if self._block_timeout > 0:
+                self._queue.put(row, timeout=self._block_timeout)  # Backpressure
+            else:
+                self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+
+            # Collect more turns until the batch is full or the flush interval passes
+            batch = [item]
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+        # Drain whatever is left so a clean exit loses nothing
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self._flush_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self._write_batch(batch)
+            with self._stats_lock:
+                self.written += len(batch)
+        except Exception as e:
+            with self._stats_lock:
+                self.failed += len(batch)
+            print(f"Failed to save {len(batch)} chat history rows: {e}")
+
+    # Function to report queue depth and write counters
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queued': self._queue.qsize(),
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+    # Function to give a forked worker process its own queue and writer thread.
+    # Threads do not survive fork, so without this a preloaded gunicorn worker would queue
+    # turns that nobody writes. Rows still queued in the parent stay with the parent.
+    def restart_after_fork(self):
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._worker = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._worker.start()
+
+    # Function to flush everything still queued and stop the worker
+    def close(self, timeout=10):
+        if not self._worker.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+
+# Function to write a batch of turns in a single transaction
+def write_turns(rows):
+    with session() as neo4j_session:
+        neo4j_session.execute_write(lambda tx: tx.run(SAVE_TURNS_QUERY, rows=rows).consume())
+
+
+# Function to create the constraints and indexes the history model relies on (idempotent)
+def ensure_history_schema():
+    for query in HISTORY_SCHEMA_QUERIES:
+        run_query(query)
+
+
+# Function to return a user's latest exchanges from the last `days` days, newest first
+def recent_turns(user_id, days=7, limit=20):
+    since_day = history_day(time.time() * 1000 - days * 86400 * 1000)
+    return fetch_all(RECENT_TURNS_QUERY, {'user_id': user_id, 'since_day': since_day, 'limit': limit})
+
+
+history_writer = ChatHistoryWriter()
+atexit.register(history_writer.close)
+os.register_at_fork(after_in_child=history_writer.restart_after_fork)
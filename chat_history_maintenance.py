@@ -0,0 +1,189 @@
+# Chat-history maintenance: daily rollups, retention and migration of the old model.
+#
+#   python chat_history_maintenance.py migrate [--batch-size 1000]   # Question/Answer nodes -> Turn nodes
+#   python chat_history_maintenance.py rollup [--days 2]              # (Re)compute the last days' rollups
+#   python chat_history_maintenance.py archive [--retention-days 90] [--format jsonl|parquet] [--archive-dir history_archive]
+#
+# archive first rolls up every day it is about to remove, then copies its turns to the
+# archive file batch by batch and deletes each batch only after it is on disk. A run
+# interrupted between the two may archive a batch twice, but never loses one.
+import argparse
+import gzip
+import json
+import os
+import time
+
+from chat_history import HISTORY_DAY_UTC_OFFSET, ensure_history_schema, history_day
+from neo4j_pool import run_query, fetch_all, fetch_one, close_driver
+
+# Old model: (:User)-[:ASKED]->(:Question)-[:HAS_ANSWER]->(:Answer), converted a batch at a time
+MIGRATE_BATCH_QUERY = '''
+MATCH (u:User)-[:ASKED]->(q:Question)
+WITH u, q LIMIT $batch_size
+OPTIONAL MATCH (q)-[:HAS_ANSWER]->(a:Answer)
+WITH u, q, a, datetime({epochMillis: q.timestamp + $utc_offset_ms}) AS at
+MERGE (u)-[:HISTORY]->(d:HistoryDay {day: at.year * 10000 + at.month * 100 + at.day})
+ON CREATE SET d.user_id = u.id
+CREATE (d)-[:HAS_TURN]->(:Turn {user_id: u.id, message: q.message, response: a.response, timestamp: q.timestamp})
+DETACH DELETE q, a
+RETURN count(*) AS migrated
+'''
+
+# Turns and distinct users per day and intent, for reporting without scanning the turns
+ROLLUP_QUERY = '''
+MATCH (d:HistoryDay {day: $day})-[:HAS_TURN]->(t:Turn)
+WITH coalesce(t.intent, 'unknown') AS intent, count(t) AS turns, count(DISTINCT d.user_id) AS users
+MERGE (r:DailyRollup {day: $day, intent: intent})
+// Never lower a count: rerunning on a partly archived day must not undercount it
+SET r.turns = CASE WHEN r.turns > turns THEN r.turns ELSE turns END,
+    r.users = CASE WHEN r.users > users THEN r.users ELSE users END,
+    r.updated_at = timestamp()
+RETURN sum(turns) AS turns
+'''
+
+DAYS_BEFORE_QUERY = '''
+MATCH (d:HistoryDay) WHERE d.day < $before_day
+RETURN DISTINCT d.day AS day ORDER BY day
+'''
+
+ARCHIVE_BATCH_QUERY = '''
+MATCH (d:HistoryDay {day: $day})-[:HAS_TURN]->(t:Turn)
+RETURN elementId(t) AS id, t.user_id AS user_id, t.message AS user_message, t.response AS bot_response,
+       t.timestamp AS timestamp, t.intent AS intent
+LIMIT $batch_size
+'''
+
+DELETE_TURNS_QUERY = '''
+UNWIND $ids AS id
+MATCH (t:Turn) WHERE elementId(t) = id
+DETACH DELETE t
+'''
+
+DELETE_EMPTY_DAYS_QUERY = '''
+MATCH (d:HistoryDay {day: $day})
+WHERE NOT (d)-[:HAS_TURN]->()
+DETACH DELETE d
+'''
+
+ARCHIVE_COLUMNS = ('user_id', 'user_message', 'bot_response', 'timestamp', 'intent')
+
+
+# Function to convert the old Question/Answer history in batches; returns the number of turns
+def migrate_legacy_history(batch_size=1000):
+    ensure_history_schema()
+    total = 0
+    while True:
+        record = fetch_one(MIGRATE_BATCH_QUERY, {'batch_size': batch_size,
+                                                 'utc_offset_ms': int(HISTORY_DAY_UTC_OFFSET * 3600 * 1000)})
+        migrated = record['migrated'] if record else 0
+        if not migrated:
+            return total
+        total += migrated
+        print(f"  migrated {total} turns")
+
+
+# Function to (re)compute the rollups of one day; safe to rerun
+def rollup_day(day):
+    record = fetch_one(ROLLUP_QUERY, {'day': day})
+    return record['turns'] if record and record['turns'] else 0
+
+
+# Function to list the days whose turns are older than the retention period
+def expired_days(retention_days):
+    before_day = history_day(time.time() * 1000 - retention_days * 86400 * 1000)
+    return [record['day'] for record in fetch_all(DAYS_BEFORE_QUERY, {'before_day': before_day})]
+
+
+# Appends archived turns to history-<day>.jsonl.gz; gzip members concatenate, so reruns can append
+class JsonlArchive:
+    def __init__(self, directory, day):
+        self.path = os.path.join(directory, f"history-{day}.jsonl.gz")
+        self._file = gzip.open(self.path, 'at', encoding='utf-8')
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps({column: row[column] for column in ARCHIVE_COLUMNS}, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# Writes archived turns to a zstd-compressed Parquet file per day and run (needs pyarrow)
+class ParquetArchive:
+    def __init__(self, directory, day):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([('user_id', pa.string()), ('user_message', pa.string()),
+                                 ('bot_response', pa.string()), ('timestamp', pa.int64()), ('intent', pa.string())])
+        self.path = os.path.join(directory, f"history-{day}-{int(time.time())}.parquet")
+        self._writer = pq.ParquetWriter(self.path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        columns = {column: [row[column] for row in rows] for column in ARCHIVE_COLUMNS}
+        self._writer.write_table(self._pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+ARCHIVE_FORMATS = {'jsonl': JsonlArchive, 'parquet': ParquetArchive}
+
+
+# Function to move one day's turns to an archive file and delete them from the graph in batches
+def archive_day(day, directory, archive_format='jsonl', batch_size=1000):
+    rollup_day(day)  # Reports keep the day's counts after its turns are gone
+    archive = None
+    archived = 0
+    try:
+        while True:
+            rows = fetch_all(ARCHIVE_BATCH_QUERY, {'day': day, 'batch_size': batch_size})
+            if not rows:
+                break
+            if archive is None:
+                os.makedirs(directory, exist_ok=True)
+                archive = ARCHIVE_FORMATS[archive_format](directory, day)
+            archive.write(rows)  # On disk before the delete
+            run_query(DELETE_TURNS_QUERY, {'ids': [row['id'] for row in rows]})
+            archived += len(rows)
+    finally:
+        if archive is not None:
+            archive.close()
+    run_query(DELETE_EMPTY_DAYS_QUERY, {'day': day})
+    return archived, archive.path if archive else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history rollups, retention and migration")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help="convert Question/Answer nodes to Turn nodes")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    rollup = commands.add_parser('rollup', help="compute the daily rollups of the last days")
+    rollup.add_argument("--days", type=int, default=2, help="days to compute, including today")
+    archive = commands.add_parser('archive', help="archive and delete turns older than the retention period")
+    archive.add_argument("--retention-days", type=int, default=int(os.environ.get("HISTORY_RETENTION_DAYS", "90")))
+    archive.add_argument("--format", choices=sorted(ARCHIVE_FORMATS), default='jsonl')
+    archive.add_argument("--archive-dir", default=os.environ.get("HISTORY_ARCHIVE_DIR", "history_archive"))
+    archive.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print(f"Migrated {migrate_legacy_history(args.batch_size)} turns.")
+    elif args.command == 'rollup':
+        now = time.time() * 1000
+        for offset in range(args.days):
+            day = history_day(now - offset * 86400 * 1000)
+            print(f"  {day}: {rollup_day(day)} turns")
+    else:
+        for day in expired_days(args.retention_days):
+            archived, path = archive_day(day, args.archive_dir, args.format, args.batch_size)
+            print(f"  {day}: archived {archived} turns to {path}")
+
+    close_driver()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+from collections import namedtuple
+import random
+import re
+
+# Conversation steps
+GREETED = 1  # Greeting sent, waiting for a menu choice
+MENU = 0  # Main menu / free-text GPU questions
+PRICE = 2  # Waiting for a budget
+RAM = 3  # Waiting for a VRAM size
+STEP_NAMES = {MENU: 'menu', GREETED: 'greeted', PRICE: 'price', RAM: 'ram'}  # Metric labels
+
+# Side effects the caller runs after sending the replies
+RECOMMEND = 'recommend'  # send_gpu_recommendations
+SEARCH = 'search'  # search_and_reply_with_results, which saves the exchange with what it sent
+ANSWER = 'answer'  # Answer the GPU question (Ollama), reply with answer_reply() and save the history
+
+# Quick-reply menus (tuples of button labels; the button text is the label)
+MAIN_MENU = ("แนะนำการ์ดจอ", "การ์ดจอ NVDIA", "การ์ดจอ AMD")
+PRICE_MENU = ("5000 บาท", "10000 บาท", "15000 บาท", "25000 บาท", "35000 บาท", "50000 บาท", "80000 บาท", "100000 บาท")
+RAM_MENU = ("RAM 4 GB", "RAM 6 GB", "RAM 8 GB", "RAM 12 GB")
+MORE_RESULTS = "ดูเพิ่มเติม"  # Next page of the last search
+MORE_RESULTS_MENU = (MORE_RESULTS,) + MAIN_MENU
+QUICK_REPLY_MENUS = (MAIN_MENU, PRICE_MENU, RAM_MENU, MORE_RESULTS_MENU)
+
+MIN_PRICE = 5000
+MAX_PRICE = 100000
+GREETINGS = ('สวัสดีครับ', 'สวัสดีค่ะ')
+
+# An outgoing text message: immutable, so identical replies can share one prebuilt LINE object
+Reply = namedtuple('Reply', 'text quick_reply')
+
+# What handling one message produced. history is the bot response to save (None = not saved).
+Turn = namedtuple('Turn', 'replies action history')
+
+ASK_PRICE = Reply("ขอทราบราคาครับ", PRICE_MENU)
+ASK_RAM = Reply("ขอทราบรายละเอียดเพิ่มเติมครับ", RAM_MENU)
+PRICE_OUT_OF_RANGE = Reply(f"กรุณาเลือกราคาภายในช่วง {MIN_PRICE}-{MAX_PRICE} บาทครับ", PRICE_MENU)
+PRICE_NOT_A_NUMBER = Reply("กรุณาระบุราคาเป็นตัวเลขครับ", PRICE_MENU)
+INVALID_RAM = Reply("กรุณาเลือกระหว่าง RAM 4 GB, 6 GB, 8 GB หรือ 12 GB ครับ", RAM_MENU)
+SEARCHING = Reply("กำลังค้นหาการ์ดจอที่ตรงกับความต้องการของคุณ...", None)
+NO_SEARCH_YET = Reply("กรุณาเลือกการ์ดจอที่ต้องการค้นหาก่อนครับ", MAIN_MENU)
+OUT_OF_SCOPE = Reply("ผมไม่สามารถตอบคำถามนอกเหนือจาก GPU ได้ครับ", MAIN_MENU)
+GREETING_REPLIES = tuple(
+    Reply(f"{greeting} g Test พร้อมใช้งานครับ สามารถเลือก spec การ์ดจอได้เลยครับ", MAIN_MENU)
+    for greeting in GREETINGS)
+
+# Every reply with fixed text, so callers can prebuild their message objects at startup
+STATIC_REPLIES = (ASK_PRICE, ASK_RAM, PRICE_OUT_OF_RANGE, PRICE_NOT_A_NUMBER, INVALID_RAM,
+                  SEARCHING, NO_SEARCH_YET, OUT_OF_SCOPE) + GREETING_REPLIES
+
+# Intent each saved exchange is labelled with in the chat-history rollups
+ACTION_INTENTS = {ANSWER: 'gpu_question', RECOMMEND: 'recommend', SEARCH: 'search'}
+REPLY_INTENTS = {ASK_PRICE: 'brand', OUT_OF_SCOPE: 'off_topic', **{reply: 'greeting' for reply in GREETING_REPLIES}}
+
+PRICE_PATTERN = re.compile(r'(\d+)')
+
+
+# Function to wrap a generated answer to a free-text question
+def answer_reply(answer):
+    return Reply(answer, MAIN_MENU)
+
+
+# Function to name the intent of a turn: by its action, else by its first reply (None if unknown)
+def turn_intent(turn):
+    if turn.action in ACTION_INTENTS:
+        return ACTION_INTENTS[turn.action]
+    return REPLY_INTENTS.get(turn.replies[0]) if turn.replies else None
+
+
+# Function to normalize user input before the table lookup (collapse whitespace)
+def normalize_input(msg):
+    return ' '.join(str(msg).split())
+
+
+# Table-driven conversation: transitions are looked up by input, then by (step, input),
+# then by step, so dispatch costs the same whatever the step or message.
+# Slow work (answering, searching) is returned as an action, so the same table serves
+# the threaded Flask app and the asyncio one.
+class DialogueEngine:
+    def __init__(self, is_gpu_related, choose=random.choice):
+        self._is_gpu_related = is_gpu_related
+        self._choose = choose
+
+        # Inputs that work at any step once the user has been greeted
+        self.commands = {
+            "แนะนำการ์ดจอ": self._recommend,
+            "การ์ดจอ NVDIA": self._choose_brand,
+            "การ์ดจอ AMD": self._choose_brand,
+            MORE_RESULTS: self._more_results,
+        }
+        # Quick-reply choices that are only valid at one step
+        self.choices = {(RAM, option): self._choose_ram for option in RAM_MENU}
+        # Free-text handling (validators) per step
+        self.fallbacks = {
+            MENU: self._free_text,
+            PRICE: self._enter_price,
+            RAM: self._invalid_ram,
+            GREETED: self._off_topic_check,
+        }
+
+    # Function to handle one message: updates state in place and returns a Turn
+    def handle(self, state, msg):
+        if 'step' not in state:
+            return self._greet(state, msg)
+        text = normalize_input(msg)
+        step = state['step']
+        transition = (self.commands.get(text)
+                      or self.choices.get((step, text))
+                      or self.fallbacks.get(step, self._off_topic_check))
+        return transition(state, text)
+
+    def _greet(self, state, text):
+        reply = self._choose(GREETING_REPLIES)
+        state['step'] = GREETED
+        return Turn((reply,), None, reply.text)
+
+    def _recommend(self, state, text):
+        return Turn((), RECOMMEND, None)  # send_gpu_recommendations saves the exchange with what it sent
+
+    def _choose_brand(self, state, text):
+        state['gpu_type'] = text  # Store the selected GPU type
+        state['result_offset'] = None  # New criteria: no search to page until the RAM step runs one
+        state['step'] = PRICE
+        return Turn((ASK_PRICE,), None, ASK_PRICE.text)
+
+    def _free_text(self, state, text):
+        if self._is_gpu_related(text):
+            return Turn((), ANSWER, None)
+        return Turn((OUT_OF_SCOPE,), None, OUT_OF_SCOPE.text)
+
+    def _enter_price(self, state, text):
+        price_match = PRICE_PATTERN.search(text)
+        if not price_match:
+            return Turn((PRICE_NOT_A_NUMBER,), None, None)
+        price_value = int(price_match.group(1))
+        if not MIN_PRICE <= price_value <= MAX_PRICE:
+            return Turn((PRICE_OUT_OF_RANGE,), None, None)
+        state['price'] = price_value
+        state['result_offset'] = None
+        state['step'] = RAM
+        return Turn((ASK_RAM,), None, None)
+
+    def _choose_ram(self, state, text):
+        state['ram'] = text
+        state['result_offset'] = 0  # First page; "more results" continues from the offset
+        state['step'] = MENU  # Reset the conversation once the search runs
+        return Turn((SEARCHING,), SEARCH, None)
+
+    def _more_results(self, state, text):
+        if state.get('result_offset') is None:
+            return Turn((NO_SEARCH_YET,), None, None)
+        return Turn((), SEARCH, None)  # Same search, next page
+
+    def _invalid_ram(self, state, text):
+        return Turn((INVALID_RAM,), None, None)
+
+    def _off_topic_check(self, state, text):
+        if self._is_gpu_related(text):
+            return Turn((), None, None)
+        state['step'] = MENU
+        return Turn((OUT_OF_SCOPE,), None, None)
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/distiluse-base-multilingual-cased-v2")
+# When the model is loaded: lazy (first encode), background (thread started at import), eager (at import),
+# preload (weights at import, without an encode; the caller warms it up later, e.g. after forking)
+EMBEDDING_LOAD = os.environ.get("EMBEDDING_LOAD", "background")
+# How it runs on CPU: torch, quantized (int8 dynamic quantization of the linear layers), onnx
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+
+# Function to build the SentenceTransformer for a backend (imports torch only when called)
+def build_model(name=MODEL_NAME, backend=EMBEDDING_BACKEND):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(name, device="cpu")
+    if backend == "quantized":
+        import torch
+        model = SentenceTransformer(name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return SentenceTransformer(name, backend="onnx")  # Exported on first use if the repo has no ONNX file
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+
+# Stands in for the SentenceTransformer: the model is built on the first encode() (or by
+# warm_up() in the background), so importing the bot does not wait for torch and the weights.
+# Concurrent first callers wait for a single load.
+class LazyModel:
+    def __init__(self, name=MODEL_NAME, backend=EMBEDDING_BACKEND, factory=build_model):
+        self.name = name
+        self.backend = backend
+        self._factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    # Function to return the loaded model, loading it once if needed
+    def get(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    self._model = self._factory(self.name, self.backend)
+                    self.load_seconds = time.perf_counter() - start
+                    print(f"Loaded {self.name} ({self.backend}) in {self.load_seconds:.1f}s")
+                model = self._model
+        return model
+
+    # Function to give a forked worker process a fresh lock (a parent thread may have held it);
+    # an already loaded model is inherited and shared copy-on-write
+    def restart_after_fork(self):
+        self._lock = threading.Lock()
+
+    def encode(self, *args, **kwargs):
+        return self.get().encode(*args, **kwargs)
+
+    # Function to load the model and run one encode, so the first real request pays neither
+    def warm_up(self):
+        self.encode(["warm up"], convert_to_numpy=True)
+
+    # Function to warm up on a daemon thread while the server already accepts requests
+    def warm_up_in_background(self):
+        def run():
+            try:
+                self.warm_up()
+            except Exception as e:
+                print(f"Model warm-up failed: {e}")  # The next encode() retries the load
+
+        thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+
+# Function to create the process-wide model according to EMBEDDING_LOAD.
+# Under gunicorn with preload_app, "preload" loads the weights once in the master and forked
+# workers share them copy-on-write; the first encode starts torch's OpenMP thread pool, which
+# does not survive fork, so the workers run it themselves (see gunicorn.conf.py).
+def load_embedding_model(mode=EMBEDDING_LOAD):
+    model = LazyModel()
+    os.register_at_fork(after_in_child=model.restart_after_fork)
+    if mode == "eager":
+        model.warm_up()
+    elif mode == "preload":
+        model.get()
+    elif mode == "background":
+        model.warm_up_in_background()
+    elif mode != "lazy":
+        raise ValueError(f"Unknown EMBEDDING_LOAD: {mode}")
+    return model
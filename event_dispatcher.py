@@ -0,0 +1,97 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+# Number of threads handling webhook events (override with an environment variable)
+DISPATCH_WORKERS = int(os.environ.get("DISPATCH_WORKERS", "8"))
+LATENCY_WINDOW = 1000  # Recent events kept for latency percentiles
+
+
+# Function to pick the ordering key of a LINE event
+def event_user_id(event):
+    source = getattr(event, 'source', None)
+    return getattr(source, 'user_id', None) or 'anonymous'
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Runs webhook events on a thread pool. Events for the same user run one at a time,
+# in arrival order; different users run in parallel.
+class EventDispatcher:
+    def __init__(self, workers=DISPATCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="line-event")
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> deque of (enqueued_at, func, args)
+        self._depth = 0
+        self._in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self._wait_times = deque(maxlen=LATENCY_WINDOW)  # Seconds between enqueue and start
+        self._run_times = deque(maxlen=LATENCY_WINDOW)  # Seconds spent in the handler
+
+    # Function to queue func(*args) behind any earlier work for the same user
+    def submit(self, user_id, func, *args):
+        with self._lock:
+            self._depth += 1
+            user_queue = self._pending.get(user_id)
+            if user_queue is not None:
+                user_queue.append((time.perf_counter(), func, args))
+                return
+            self._pending[user_id] = deque([(time.perf_counter(), func, args)])
+        self._executor.submit(self._drain, user_id)
+
+    def _drain(self, user_id):
+        while True:
+            with self._lock:
+                user_queue = self._pending[user_id]
+                if not user_queue:
+                    del self._pending[user_id]
+                    return
+                enqueued_at, func, args = user_queue.popleft()
+                self._depth -= 1
+                self._in_flight += 1
+
+            started = time.perf_counter()
+            try:
+                func(*args)
+                failed = False
+            except Exception as e:
+                failed = True
+                print(f"Error: {e}")  # Log handler errors, keep draining this user's events
+            finished = time.perf_counter()
+
+            with self._lock:
+                self._in_flight -= 1
+                self.processed += 1
+                self.failed += failed
+                self._wait_times.append(started - enqueued_at)
+                self._run_times.append(finished - started)
+
+    # Function to report queue depth and processing latency
+    def stats(self):
+        with self._lock:
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            stats = {
+                'queue_depth': self._depth,
+                'active_users': len(self._pending),
+                'in_flight': self._in_flight,
+                'processed': self.processed,
+                'failed': self.failed,
+            }
+        for name, values in (('wait', wait_times), ('handle', run_times)):
+            stats[f'{name}_p50_ms'] = round(_percentile(values, 0.50) * 1000, 2)
+            stats[f'{name}_p95_ms'] = round(_percentile(values, 0.95) * 1000, 2)
+            stats[f'{name}_p99_ms'] = round(_percentile(values, 0.99) * 1000, 2)
+        return stats
+
+    # Function to finish queued events and stop the workers
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+import json
+import threading
+
+from product_retrieval import product_key
+
+MAX_BUBBLES = 6  # Products shown per carousel
+
+
+# Function to build the Flex bubble for one product, with a button linking to the product URL
+def product_bubble(product):
+    return {
+        "type": "bubble",
+        "hero": {
+            "type": "image",
+            "url": product['image'],  # Use the image URL fetched from Neo4j
+            "size": "full",
+            "aspectRatio": "20:13",
+            "aspectMode": "cover"
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": product['name'], "weight": "bold", "size": "md", "wrap": True},
+                {"type": "text", "text": f"Price: {product['price']}", "size": "sm", "color": "#999999"}
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "sm",
+            "contents": [
+                {
+                    "type": "button",
+                    "style": "primary",
+                    "height": "sm",
+                    "color": "#992c34",
+                    "action": {
+                        "type": "uri",
+                        "label": "More Details",
+                        "uri": product['url']  # Link to product page
+                    }
+                }
+            ],
+            "flex": 0
+        }
+    }
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+# Serialized Flex carousel messages. Each catalog product's bubble is serialized once
+# when the catalog loads; whole carousels are cached by (query parameters, catalog
+# version) so identical requests skip both the product lookup and the serialization.
+# compile() with a new catalog version drops every cached carousel.
+class FlexCarouselCache:
+    def __init__(self, max_size=256, alt_text="Product List"):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._fragments = {}  # product key -> serialized bubble
+        self._payloads = OrderedDict()  # (params, version) -> serialized message, or None for no products
+        self._prefix = '{"type":"flex","altText":' + _dumps(alt_text) + ',"contents":{"type":"carousel","contents":['
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    # Function to precompile the bubbles of a freshly loaded catalog (the catalog refresh hook)
+    def compile(self, products, version):
+        fragments = {product_key(product): _dumps(product_bubble(product)) for product in products}
+        with self._lock:
+            self._fragments = fragments
+            self._payloads.clear()
+            self.version = version
+
+    # Function to get a product's serialized bubble; products outside the catalog are serialized on the spot
+    def fragment(self, product):
+        fragment = self._fragments.get(product_key(product))
+        if fragment is None:
+            fragment = _dumps(product_bubble(product))
+        return fragment
+
+    # Function to serialize a carousel message for a list of products (None if the list is empty)
+    def build(self, products):
+        if not products:
+            return None
+        return self._prefix + ','.join(self.fragment(product) for product in products[:MAX_BUBBLES]) + ']}}'
+
+    # Function to return the cached carousel for params, calling find_products() only on a miss.
+    # params must be hashable and identify the query (e.g. ('search', brand, price, ram)).
+    def get_or_build(self, params, find_products):
+        key = (params, self.version)
+        found, payload = self._lookup(key)
+        if found:
+            return payload
+        payload = self.build(find_products())
+        self._store(key, payload)
+        return payload
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._payloads:
+                self._payloads.move_to_end(key)
+                self.hits += 1
+                return True, self._payloads[key]
+            self.misses += 1
+            return False, None
+
+    def _store(self, key, payload):
+        with self._lock:
+            if key[1] == self.version:  # Not stale: the catalog did not change meanwhile
+                self._payloads[key] = payload
+                while len(self._payloads) > self.max_size:
+                    self._payloads.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._payloads),
+                'max_size': self.max_size,
+                'fragments': len(self._fragments),
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,39 @@
+# gunicorn settings for line_main.py: the master imports the app and loads the model once,
+# then forks the workers, which share the model weights copy-on-write instead of each
+# loading its own copy.
+#
+#   gunicorn -c gunicorn.conf.py line_main:app
+import gc
+import os
+
+# Load the model weights in the master (before forking) instead of lazily in every worker;
+# the master never encodes, the warm-up encode runs in each worker after the fork
+os.environ.setdefault("EMBEDDING_LOAD", "preload")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = True
+# The webhook is acknowledged before handling, so requests are short; graceful shutdown
+# gives the dispatcher and chat-history writer time to finish
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", "0"))  # 0 keeps torch's default
+
+
+def when_ready(server):
+    # Move everything the app allocated into the permanent generation, so the garbage
+    # collector in the workers does not touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Several workers on one machine: split the cores between them instead of each using all
+    if TORCH_THREADS:
+        import torch
+        torch.set_num_threads(TORCH_THREADS)
+    # Already imported by the master (preload_app); the first encode starts torch's thread
+    # pool in this worker, after the thread count is set
+    from line_main import model
+    model.warm_up_in_background()
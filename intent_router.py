@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from atomic_file import write_atomically
+
+GPU_QUESTION = 'gpu_question'
+BRAND = 'brand'
+PRICE = 'price'
+RAM = 'ram'
+OFF_TOPIC = 'off_topic'
+
+# Cheap prefilter: messages containing one of these are GPU questions without embedding them
+GPU_KEYWORDS = [
+    "gpu",
+    "กราฟิกการ์ด", "วีจีเอ", "การเลือกซื้อการ์ดจอ",
+]
+
+# Example phrasings per intent; each intent's centroid is the mean of its example embeddings
+INTENT_EXAMPLES = {
+    GPU_QUESTION: [
+        "การ์ดจอตัวไหนเล่นเกมลื่นที่สุด",
+        "การ์ดจอรุ่นนี้กินไฟเยอะไหม",
+        "ต้องใช้พาวเวอร์ซัพพลายกี่วัตต์กับการ์ดจอ",
+        "การ์ดจอสำหรับตัดต่อวิดีโอควรเลือกแบบไหน",
+        "เล่นเกม 2K ต้องใช้การ์ดจออะไร",
+        "การ์ดจอร้อนเกินไปทำยังไงดี",
+        "ray tracing คืออะไร",
+        "which graphics card is best for gaming",
+        "is this video card good for 4K",
+        "การ์ดจอเก่าอัปเกรดเป็นรุ่นไหนดี",
+    ],
+    BRAND: [
+        "อยากได้การ์ดจอ NVIDIA",
+        "ขอดูการ์ดจอ AMD",
+        "GeForce หรือ Radeon ดีกว่ากัน",
+        "มีการ์ดจอ RTX ไหม",
+        "ขอการ์ดจอค่ายเขียว",
+        "ขอการ์ดจอค่ายแดง",
+        "nvidia or amd which is better",
+    ],
+    PRICE: [
+        "การ์ดจองบ 10000 บาท",
+        "มีงบประมาณ 15000 ซื้อการ์ดจออะไรดี",
+        "การ์ดจอราคาไม่เกินห้าพัน",
+        "การ์ดจอราคาถูกที่สุดเท่าไหร่",
+        "การ์ดจอรุ่นนี้ราคาเท่าไหร่",
+        "budget 20000 baht graphics card",
+    ],
+    RAM: [
+        "การ์ดจอแรม 8GB",
+        "อยากได้การ์ดจอหน่วยความจำ 12 GB",
+        "VRAM เท่าไหร่ถึงจะพอ",
+        "การ์ดจอแรมเยอะๆ",
+        "การ์ดจอ 6 กิ๊ก",
+        "how much vram do I need",
+    ],
+    OFF_TOPIC: [
+        "วันนี้อากาศเป็นยังไง",
+        "กินข้าวหรือยัง",
+        "แนะนำร้านอาหารหน่อย",
+        "ช่วยแต่งกลอนให้หน่อย",
+        "คีย์บอร์ดตัวไหนดี",
+        "ราคาทองวันนี้",
+        "เล่าเรื่องตลกให้ฟังหน่อย",
+        "what time is it",
+    ],
+}
+
+
+# Classifies messages by cosine similarity to per-intent centroid embeddings.
+# Centroids are built once (one batched encode) and optionally cached on disk.
+class IntentRouter:
+    def __init__(self, encode, examples=INTENT_EXAMPLES, threshold=0.35, keywords=GPU_KEYWORDS,
+                 cache_path=None):
+        self._encode = encode  # list of texts -> 2D array of embeddings
+        self.examples = examples
+        self.threshold = threshold  # Below this similarity a message is off-topic
+        self.keywords = [keyword.lower() for keyword in keywords]
+        # np.savez names its files .npz; the same name is written and read
+        if cache_path and not cache_path.endswith('.npz'):
+            cache_path += '.npz'
+        self.cache_path = cache_path
+        self.intents = list(examples)
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def _embed(self, texts):
+        vectors = np.asarray(self._encode(list(texts)), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _examples_hash(self):
+        return hashlib.sha1(json.dumps(self.examples, sort_keys=True).encode('utf-8')).hexdigest()
+
+    # Function to build (or load) the intents x dim centroid matrix
+    def centroids(self):
+        if self._centroids is not None:
+            return self._centroids
+        with self._lock:
+            if self._centroids is not None:
+                return self._centroids
+            centroids = self._load_centroids()
+            if centroids is None:
+                texts = [text for intent in self.intents for text in self.examples[intent]]
+                vectors = self._embed(texts)  # One batch for every example
+                rows, start = [], 0
+                for intent in self.intents:
+                    count = len(self.examples[intent])
+                    rows.append(vectors[start:start + count].mean(axis=0))
+                    start += count
+                centroids = np.stack(rows)
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+                self._save_centroids(centroids)
+            self._centroids = centroids
+            return centroids
+
+    def _load_centroids(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                if str(data['examples_hash']) != self._examples_hash():
+                    return None  # Examples changed since the cache was written
+                return data['centroids']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # Function to write the cache through a temp file, so no worker reads a half-written one
+    def _save_centroids(self, centroids):
+        if self.cache_path:
+            examples_hash = self._examples_hash()
+            write_atomically(self.cache_path, lambda f: np.savez(f, centroids=centroids, examples_hash=examples_hash))
+
+    # Function for the keyword prefilter (lower-cases the message once)
+    def has_gpu_keyword(self, msg):
+        text = msg.lower()
+        return any(keyword in text for keyword in self.keywords)
+
+    # Function to classify several messages with one encode and one matrix multiply.
+    # Returns a list of (intent, confidence).
+    def classify_batch(self, messages):
+        results = [None] * len(messages)
+        pending = []
+        for i, msg in enumerate(messages):
+            if self.has_gpu_keyword(msg):
+                results[i] = (GPU_QUESTION, 1.0)
+            else:
+                pending.append(i)
+        if pending:
+            scores = self._embed([messages[i] for i in pending]) @ self.centroids().T
+            best = scores.argmax(axis=1)
+            for row, i in enumerate(pending):
+                confidence = float(scores[row, best[row]])
+                intent = self.intents[best[row]]
+                results[i] = (intent if confidence >= self.threshold else OFF_TOPIC, confidence)
+        return results
+
+    # Function to classify a single message
+    def classify(self, msg):
+        return self.classify_batch([msg])[0]
+
+    # Function to tell whether a message is anything the GPU bot should answer
+    def is_gpu_related(self, msg):
+        return self.classify(msg)[0] != OFF_TOPIC
@@ -0,0 +1,214 @@
+# asyncio entry point for the same LINE webhook as line_main.py (Flask). Ollama and LINE
+# are awaited instead of holding a thread per request; model encoding, session edits and
+# the (in-memory) catalog searches run in the default thread pool. The model, caches,
+# session store and dialogue table are shared with line_main.py.
+#
+#   uvicorn line_asgi:app --port 5000
+from contextlib import asynccontextmanager
+import asyncio
+import os
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import MessageEvent, TextMessage, TextSendMessage
+
+import line_main as bot
+from dialogue import ANSWER, RECOMMEND, SEARCH, STEP_NAMES, answer_reply, turn_intent
+from metrics import current_step, stage_metrics
+from line_client_async import AsyncLineMessagingClient, AsyncOutbox
+from neo4j_pool import health_check
+from ollama_async import AsyncOllamaClient
+from ollama_client import is_cacheable
+
+SHUTDOWN_GRACE = float(os.environ.get("SHUTDOWN_GRACE", "10"))  # Seconds to finish in-flight events
+
+ollama = None  # AsyncOllamaClient, created on startup
+line_api = None  # AsyncLineMessagingClient, created on startup
+_user_locks = {}  # user_id -> [asyncio.Lock, events holding or waiting for it]
+_tasks = set()
+
+
+# Function to load everything the first webhook would otherwise wait for (runs in a thread)
+def warm_up():
+    bot.model.encode(["warm up"], convert_to_numpy=True)
+    bot.intent_router.centroids()
+    try:
+        bot.catalog.load()  # Also precompiles the carousel bubbles and the ranking columns
+    except Exception as e:
+        print(f"Catalog warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global ollama, line_api
+    ollama = AsyncOllamaClient()
+    line_api = AsyncLineMessagingClient(bot.access_token)
+    await asyncio.gather(asyncio.to_thread(warm_up), ollama.warm_up())
+    yield
+    if _tasks:
+        await asyncio.wait(list(_tasks), timeout=SHUTDOWN_GRACE)
+    await ollama.aclose()
+    await line_api.aclose()
+    bot.history_writer.close()
+
+
+async def webhook(request):
+    body = (await request.body()).decode('utf-8')
+    signature = request.headers.get('X-Line-Signature')
+
+    # Verify the signature
+    if not signature:
+        return PlainTextResponse('Bad Request', status_code=400)
+
+    try:
+        events = bot.handler.parser.parse(body, signature)  # Verify and parse the webhook body
+    except InvalidSignatureError:
+        return PlainTextResponse('Bad Request', status_code=400)
+    except Exception as e:
+        print(f"Error: {e}")  # Malformed body: log it and reject the request
+        return PlainTextResponse('Bad Request', status_code=400)
+
+    # Handle the events in the background and acknowledge LINE right away
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+            task = asyncio.create_task(handle_message(event))
+            _tasks.add(task)
+            task.add_done_callback(_tasks.discard)
+
+    return PlainTextResponse('OK')
+
+
+# Neo4j is only queried on catalog loads, which run in threads, so the check uses the same pool
+async def health(request):
+    if not await asyncio.to_thread(health_check):
+        return PlainTextResponse('Neo4j unavailable', status_code=503)
+    return PlainTextResponse('OK')
+
+
+async def stats(request):
+    return JSONResponse({
+        'in_flight': len(_tasks),
+        'ollama_cache': bot.response_cache.stats(),
+        'ollama_scheduler': bot.ollama_scheduler.stats(),
+        'semantic_cache': bot.semantic_cache.stats(),
+        'flex_cache': bot.flex_cache.stats(),
+        'ranking': bot.ranking.stats(),
+        'line_api': line_api.stats(),
+        'stages': stage_metrics.snapshot(),
+    })
+
+
+async def prometheus_metrics(request):
+    ollama_stats = bot.ollama_scheduler.stats()
+    history_stats = bot.history_writer.stats()
+    gauges = (('event_tasks_in_flight', "Webhook events being handled", len(_tasks)),
+              ('chat_history_queued', "Chat history rows waiting to be written", history_stats['queued']),
+              ('ollama_in_flight', "Ollama generations running", ollama_stats['in_flight']),
+              ('ollama_queued', "GPU questions waiting for an Ollama slot", ollama_stats['queued']))
+    counters = (('chat_history_dropped', "Chat history rows dropped because the queue was full", history_stats['dropped']),
+                ('ollama_timed_out', "GPU questions dropped after waiting past the deadline", ollama_stats['timed_out']),
+                ('ollama_rejected', "GPU questions turned away because the queue was too long", ollama_stats['rejected']))
+    return Response(stage_metrics.prometheus(gauges=gauges, counters=counters), media_type='text/plain; version=0.0.4')
+
+
+# Function to handle one message event; events of the same user run one at a time, in order
+async def handle_message(event):
+    user_id = event.source.user_id
+    entry = _user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            with stage_metrics.track('handle_message') as stage:
+                outbox = AsyncOutbox(line_api, user_id, event.reply_token, event.timestamp)
+                try:
+                    await handle_message_with_state(event, outbox, stage)
+                finally:
+                    await outbox.flush()
+    except Exception as e:
+        print(f"Error: {e}")  # Log handler errors, like the Flask dispatcher
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _user_locks[user_id]
+
+
+async def handle_message_with_state(event, outbox, stage):
+    user_id = event.source.user_id
+    msg = event.message.text  # Get the user's message
+
+    step, turn, search_messages = await asyncio.to_thread(handle_turn, user_id, msg)
+    stage.set_step(step)
+
+    outbox.add(*[bot.render(reply) for reply in turn.replies])
+    if turn.history is not None:
+        bot.save_chat_history(user_id, msg, turn.history, turn_intent(turn))
+
+    if turn.action == ANSWER:
+        answer = await answer_gpu_question(msg, user_id)
+        outbox.add(bot.render(answer_reply(answer)))
+        bot.save_chat_history(user_id, msg, answer, turn_intent(turn))
+    elif turn.action == RECOMMEND:
+        outbox.add(*await asyncio.to_thread(gpu_recommendation_messages, user_id))
+    elif turn.action == SEARCH:
+        outbox.add(*search_messages)
+
+
+# Function to apply a message to the user's state under the session store's user lock, which
+# the Flask workers take as well, so no process overwrites another's update (runs in a thread:
+# the store may be SQLite and the classifier may encode the message). A search advances the
+# page offset, so it runs under the same lock; answers and recommendations do not touch the state.
+# Returns the step the message arrived in, the Turn, and the search result messages.
+def handle_turn(user_id, msg):
+    with bot.sessions.edit(user_id) as state:
+        step = STEP_NAMES.get(state.get('step'), 'new')
+        current_step.set(step)  # Stages timed in this thread are labelled with it too
+        turn = bot.conversation.handle(state, msg)
+        search_messages = search_result_messages(user_id, state, msg) if turn.action == SEARCH else ()
+    return step, turn, search_messages
+
+
+# Function to answer a free-text GPU question, from the semantic cache when possible
+async def answer_gpu_question(msg, user_id=None):
+    answer, similarity, vector = await asyncio.to_thread(bot.semantic_cache.lookup, msg)
+    if answer is not None:
+        return answer
+    context = await asyncio.to_thread(bot.retrieve_product_context, vector)
+    answer = await ollama.response(msg, context, user_id)
+    if is_cacheable(answer):
+        bot.semantic_cache.store(msg, answer, vector)  # Reuse the embedding from the lookup
+    return answer
+
+
+# Function to build the recommendation messages (runs in a thread: the catalog may have to load)
+def gpu_recommendation_messages(user_id):
+    payload = bot.flex_cache.get_or_build(('recommend',), bot.find_gpu_recommendations)
+    if payload:
+        bot.save_chat_history(user_id, "แนะนำการ์ดจอ", "Here are GPU recommendations based on your request.", 'recommend')
+        return [payload, bot.MORE_PROMPT_MESSAGE]
+    bot_response = "ไม่มีการ์ดจอที่แนะนำในช่วงนี้"
+    bot.save_chat_history(user_id, "แนะนำการ์ดจอ", bot_response, 'recommend')
+    return [TextSendMessage(text=bot_response)]
+
+
+# Function to build the next page of search results, advancing state['result_offset']
+def search_result_messages(user_id, state, msg):
+    payload, more = bot.next_search_page(state)
+    bot.save_chat_history(user_id, msg, bot.search_history_response(payload, state), 'search')
+    if payload:
+        return [payload, bot.MORE_RESULTS_PROMPT_MESSAGE if more else bot.MORE_PROMPT_MESSAGE]
+    if state.get('result_offset'):
+        return [bot.NO_MORE_RESULTS_MESSAGE]
+    return [bot.NO_MATCH_MESSAGE]
+
+
+app = Starlette(
+    routes=[
+        Route("/", webhook, methods=['POST']),
+        Route("/health", health, methods=['GET']),
+        Route("/stats", stats, methods=['GET']),
+        Route("/metrics", prometheus_metrics, methods=['GET']),
+    ],
+    lifespan=lifespan,
+)
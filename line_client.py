@@ -0,0 +1,239 @@
+from requests.adapters import HTTPAdapter
+from metrics import Histogram, stage_metrics
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+
+# LINE Messaging API (override with LINE_API_URL, e.g. to point at stub_line.py)
+LINE_API_URL = os.environ.get("LINE_API_URL", "https://api.line.me")
+
+MAX_MESSAGES_PER_CALL = 5  # Limit for both reply and push
+# Reply tokens expire shortly after the event; older events go straight to push
+REPLY_TOKEN_WINDOW = float(os.environ.get("LINE_REPLY_TOKEN_WINDOW", "50"))
+
+# Transport settings
+LINE_POOL_SIZE = int(os.environ.get("LINE_POOL_SIZE", "16"))  # Keep-alive connections (>= event workers)
+LINE_CONNECT_TIMEOUT = float(os.environ.get("LINE_CONNECT_TIMEOUT", "3"))
+LINE_READ_TIMEOUT = float(os.environ.get("LINE_READ_TIMEOUT", "10"))
+LINE_MAX_RETRIES = int(os.environ.get("LINE_MAX_RETRIES", "3"))  # Push retries on 429/5xx/network errors
+LINE_BACKOFF_BASE = float(os.environ.get("LINE_BACKOFF_BASE", "0.5"))  # Seconds, doubled per attempt
+LINE_BACKOFF_MAX = float(os.environ.get("LINE_BACKOFF_MAX", "8"))
+LINE_RATE_LIMIT = float(os.environ.get("LINE_RATE_LIMIT", "1000"))  # Calls per second (0 = unlimited)
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class LineApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"LINE API {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+# Function to turn a message into its JSON text: SDK message objects, dicts, or already-serialized JSON
+def serialize_message(message):
+    if isinstance(message, str):
+        return message
+    if hasattr(message, 'as_json_dict'):
+        message = message.as_json_dict()
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+
+# Function to tell an expired/used reply token apart from other failures
+def is_invalid_reply_token(error):
+    return error.status == 400 and 'reply token' in str(error.message).lower()
+
+
+# Token bucket shared by every worker thread, so bursts stay under LINE's per-second limit
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Function to take one token, sleeping until one is available; returns the seconds waited
+    def acquire(self):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1  # May go negative: later callers queue up behind this one
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+# Function to compute the delay before a retry: exponential backoff with full jitter,
+# or the server's Retry-After when it sent one
+def backoff_delay(attempt, retry_after=None, base=LINE_BACKOFF_BASE, maximum=LINE_BACKOFF_MAX):
+    if retry_after is not None:
+        return min(maximum, retry_after)
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+# Reply/push client on one pooled keep-alive session, with explicit timeouts, a shared
+# rate limit, and retries for pushes. Pushes carry an X-Line-Retry-Key, so LINE drops
+# the duplicate when a retried request had in fact been delivered. Replies are never
+# retried: a reply token can only be used once.
+class LineMessagingClient:
+    def __init__(self, access_token, endpoint=LINE_API_URL, pool_size=LINE_POOL_SIZE,
+                 timeout=(LINE_CONNECT_TIMEOUT, LINE_READ_TIMEOUT), max_retries=LINE_MAX_RETRIES,
+                 rate_limit=LINE_RATE_LIMIT):
+        self.endpoint = endpoint.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            'Authorization': f"Bearer {access_token}",
+            'Content-Type': 'application/json; charset=UTF-8',
+        })
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.latency = {'reply': Histogram(), 'push': Histogram()}  # Seconds per HTTP attempt
+        self._lock = threading.Lock()
+        self.calls = {'reply': 0, 'push': 0}
+        self.retries = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+
+    def _count(self, field, value=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    # Function to make one HTTP attempt; returns the response, or raises requests.RequestException
+    def _attempt(self, kind, path, body, headers=None):
+        waited = self.rate_limiter.acquire()
+        if waited:
+            self._count('throttled_seconds', waited)
+        start = time.perf_counter()
+        try:
+            return self.session.post(self.endpoint + path, data=body, headers=headers, timeout=self.timeout)
+        finally:
+            self.latency[kind].observe(time.perf_counter() - start)
+
+    def _post(self, kind, path, body, retry=False):
+        with self._lock:
+            self.calls[kind] += 1
+        data = body.encode('utf-8')
+        # The same key on every attempt lets LINE deduplicate a push we retry
+        headers = {'X-Line-Retry-Key': str(uuid.uuid4())} if retry else None
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = self._attempt(kind, path, data, headers)
+            except requests.RequestException as e:
+                if not retry or attempt >= self.max_retries:
+                    self._count('errors')
+                    raise LineApiError(None, str(e))
+            else:
+                if response.status_code == 200:
+                    return
+                if retry and attempt and response.status_code == 409:
+                    return  # An earlier attempt with this retry key was accepted
+                if not retry or attempt >= self.max_retries or response.status_code not in RETRYABLE_STATUSES:
+                    self._count('errors')
+                    raise LineApiError(response.status_code, error_message(response))
+                retry_after = retry_after_seconds(response)
+            self._count('retries')
+            time.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    # Function to answer an event with up to 5 serialized messages (one call, no quota used)
+    @stage_metrics.instrument('reply_message')
+    def reply(self, reply_token, messages):
+        self._post('reply', '/v2/bot/message/reply',
+                   '{"replyToken":' + json.dumps(reply_token) + ',"messages":[' + ','.join(messages) + ']}')
+
+    # Function to push up to 5 serialized messages to a user (counts against the monthly quota)
+    @stage_metrics.instrument('push_message')
+    def push(self, to, messages):
+        self._post('push', '/v2/bot/message/push',
+                   '{"to":' + json.dumps(to) + ',"messages":[' + ','.join(messages) + ']}', retry=True)
+
+    def stats(self):
+        with self._lock:
+            counters = {'calls': dict(self.calls), 'retries': self.retries, 'errors': self.errors,
+                        'throttled_seconds': round(self.throttled_seconds, 3)}
+        counters['latency'] = {kind: histogram.snapshot() for kind, histogram in self.latency.items()}
+        return counters
+
+    def close(self):
+        self.session.close()
+
+
+def error_message(response):
+    try:
+        return response.json().get('message', response.text)
+    except ValueError:
+        return response.text
+
+
+# Collects every message produced while handling one event and sends them in as few
+# calls as possible: the first 5 with the reply token, the rest (or everything, once the
+# token has expired) with push.
+class Outbox:
+    def __init__(self, client, to, reply_token=None, event_time=None, reply_window=REPLY_TOKEN_WINDOW):
+        self.client = client
+        self.to = to
+        self.reply_token = reply_token
+        self.event_time = event_time  # Webhook event timestamp in ms
+        self.reply_window = reply_window
+        self._messages = []
+
+    def add(self, *messages):
+        self._messages.extend(serialize_message(message) for message in messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def _reply_usable(self):
+        if not self.reply_token:
+            return False
+        return self.event_time is None or time.time() - self.event_time / 1000 < self.reply_window
+
+    # Function to take the collected messages in API-sized chunks, plus the reply token if it is still usable
+    def _take(self):
+        messages, self._messages = self._messages, []
+        chunks = [messages[i:i + MAX_MESSAGES_PER_CALL] for i in range(0, len(messages), MAX_MESSAGES_PER_CALL)]
+        reply_token = None
+        if chunks and self._reply_usable():
+            reply_token, self.reply_token = self.reply_token, None  # A reply token works only once
+        return reply_token, chunks
+
+    # Function to send the collected messages; returns the number of API calls made
+    def flush(self):
+        reply_token, chunks = self._take()
+        calls = 0
+        if reply_token:
+            try:
+                self.client.reply(reply_token, chunks[0])
+                chunks = chunks[1:]
+            except LineApiError as e:
+                if not is_invalid_reply_token(e):
+                    raise
+                print(f"Reply token expired, pushing instead: {e}")
+            calls += 1
+        for chunk in chunks:
+            self.client.push(self.to, chunk)
+            calls += 1
+        return calls
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from line_client import (
+    LINE_API_URL, LINE_POOL_SIZE, LINE_CONNECT_TIMEOUT, LINE_READ_TIMEOUT, LINE_MAX_RETRIES, LINE_RATE_LIMIT,
+    RETRYABLE_STATUSES, LineApiError, Outbox, backoff_delay, is_invalid_reply_token, error_message, retry_after_seconds
+)
+from metrics import Histogram, stage_metrics
+
+
+# Token bucket for coroutines on one event loop: waiting callers sleep without blocking the loop
+class AsyncTokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1  # May go negative: later callers queue up behind this one
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+# asyncio counterpart of LineMessagingClient: same pool size, timeouts, rate limit, push
+# retries with X-Line-Retry-Key, and latency histograms. Create it inside the running event loop.
+class AsyncLineMessagingClient:
+    def __init__(self, access_token, endpoint=LINE_API_URL, pool_size=LINE_POOL_SIZE,
+                 timeout=(LINE_CONNECT_TIMEOUT, LINE_READ_TIMEOUT), max_retries=LINE_MAX_RETRIES,
+                 rate_limit=LINE_RATE_LIMIT):
+        self.max_retries = max_retries
+        self.http = httpx.AsyncClient(
+            base_url=endpoint.rstrip('/'),
+            headers={'Authorization': f"Bearer {access_token}", 'Content-Type': 'application/json; charset=UTF-8'},
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.rate_limiter = AsyncTokenBucket(rate_limit)
+        self.latency = {'reply': Histogram(), 'push': Histogram()}  # Seconds per HTTP attempt
+        self.calls = {'reply': 0, 'push': 0}
+        self.retries = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+
+    async def _attempt(self, kind, path, body, headers=None):
+        self.throttled_seconds += await self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            return await self.http.post(path, content=body, headers=headers)
+        finally:
+            self.latency[kind].observe(time.perf_counter() - start)
+
+    async def _post(self, kind, path, body, retry=False):
+        self.calls[kind] += 1
+        data = body.encode('utf-8')
+        headers = {'X-Line-Retry-Key': str(uuid.uuid4())} if retry else None
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = await self._attempt(kind, path, data, headers)
+            except httpx.HTTPError as e:
+                if not retry or attempt >= self.max_retries:
+                    self.errors += 1
+                    raise LineApiError(None, str(e))
+            else:
+                if response.status_code == 200:
+                    return
+                if retry and attempt and response.status_code == 409:
+                    return  # An earlier attempt with this retry key was accepted
+                if not retry or attempt >= self.max_retries or response.status_code not in RETRYABLE_STATUSES:
+                    self.errors += 1
+                    raise LineApiError(response.status_code, error_message(response))
+                retry_after = retry_after_seconds(response)
+            self.retries += 1
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    @stage_metrics.instrument('reply_message')
+    async def reply(self, reply_token, messages):
+        await self._post('reply', '/v2/bot/message/reply',
+                         '{"replyToken":' + json.dumps(reply_token) + ',"messages":[' + ','.join(messages) + ']}')
+
+    @stage_metrics.instrument('push_message')
+    async def push(self, to, messages):
+        await self._post('push', '/v2/bot/message/push',
+                         '{"to":' + json.dumps(to) + ',"messages":[' + ','.join(messages) + ']}', retry=True)
+
+    def stats(self):
+        return {'calls': dict(self.calls), 'retries': self.retries, 'errors': self.errors,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'latency': {kind: histogram.snapshot() for kind, histogram in self.latency.items()}}
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+# Outbox whose flush() is awaited: reply first, push for the rest or once the token expired
+class AsyncOutbox(Outbox):
+    async def flush(self):
+        reply_token, chunks = self._take()
+        calls = 0
+        if reply_token:
+            try:
+                await self.client.reply(reply_token, chunks[0])
+                chunks = chunks[1:]
+            except LineApiError as e:
+                if not is_invalid_reply_token(e):
+                    raise
+                print(f"Reply token expired, pushing instead: {e}")
+            calls += 1
+        for chunk in chunks:
+            await self.client.push(self.to, chunk)
+            calls += 1
+        return calls
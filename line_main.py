@@ -1,104 +1,194 @@
-from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
+from flask import Flask, Response, request, abort, jsonify
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage, QuickReply, QuickReplyButton, MessageAction
 )
-from sentence_transformers import SentenceTransformer, util
-from neo4j import GraphDatabase
-from linebot.models import FlexSendMessage
-import json
-import random
+from product_catalog import ProductCatalog
+from neo4j_pool import fetch_all, fetch_one, health_check
+from chat_history import history_writer
+from event_dispatcher import EventDispatcher, event_user_id
+from ollama_client import ollama_response, response_cache, scheduler as ollama_scheduler, keep_warm, is_cacheable
+from semantic_cache import SemanticCache
+from intent_router import IntentRouter
+from session_store import create_session_store
+from product_retrieval import ProductIndex, build_product_context
+from flex_cache import FlexCarouselCache, MAX_BUBBLES
+from product_ranking import RankingEngine
+from embedding_model import load_embedding_model
+from line_client import LineMessagingClient, Outbox, serialize_message
+from dialogue import (
+    DialogueEngine, ANSWER, MAIN_MENU, MORE_RESULTS_MENU, QUICK_REPLY_MENUS, RECOMMEND, SEARCH, STATIC_REPLIES, STEP_NAMES, answer_reply, turn_intent
+)
+from metrics import stage_metrics
+from sampling_profiler import SlowRequestProfiler
+from contextlib import contextmanager
+import atexit
+import os
 import re
-import requests
+import threading
 
 # Access Token and Secret for LINE API
 access_token = 'ACCESS_TOKEN'
 secret = 'secret'
-line_bot_api = LineBotApi(access_token)
+line_client = LineMessagingClient(access_token)
 handler = WebhookHandler(secret)
+atexit.register(line_client.close)
+
+# Messages produced while handling the current event (one outbox per dispatcher thread)
+_outbound = threading.local()
 
 # Flask app
 app = Flask(__name__)
 
-# Dictionary to store user states
-user_data = {}
+# Stack profiles of a sample of slow events (off unless PROFILE_SAMPLE_RATE > 0)
+profiler = SlowRequestProfiler()
 
-# Load the sentence-transformers model
-model = SentenceTransformer('sentence-transformers/distiluse-base-multilingual-cased-v2')
+# Worker pool that handles webhook events after LINE has been acknowledged
+dispatcher = EventDispatcher()
+atexit.register(dispatcher.close)
 
-# Neo4j connection details
-URI = "neo4j://localhost"
-AUTH = ("neo4j", "PASSWORD")
+# Per-user conversation state (in-process LRU/TTL store, or SQLite shared by several workers)
+sessions = create_session_store()
 
-# Function to run a query in Neo4j
-def run_query(query, parameters=None):
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        with driver.session() as session:
-            session.run(query, parameters)
+# The sentence-transformers model, loaded lazily or in the background (EMBEDDING_LOAD), so
+# importing the app does not wait for torch and the weights
+model = load_embedding_model()
+
+# Answers to earlier questions with the same meaning, so repeat questions skip Ollama
+semantic_cache = SemanticCache(
+    encode=lambda texts: model.encode(texts, convert_to_numpy=True),
+    threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.85")),
+    max_size=int(os.environ.get("SEMANTIC_CACHE_SIZE", "2000")),
+    ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", "86400")),
+    path=os.environ.get("SEMANTIC_CACHE_PATH") or None,  # e.g. semantic_cache to keep it across restarts
+)
+atexit.register(semantic_cache.save)
+
+# Intent classifier built on the same model (GPU question, brand, price, RAM, off-topic)
+intent_router = IntentRouter(
+    encode=lambda texts: model.encode(texts, convert_to_numpy=True, batch_size=64),
+    threshold=float(os.environ.get("INTENT_THRESHOLD", "0.35")),
+    cache_path=os.environ.get("INTENT_CACHE_PATH") or None,  # e.g. intent_centroids.npz
+)
+
+# Vector index over product names/specs for grounding Ollama answers in the catalog
+product_index = ProductIndex(
+    encode=lambda texts: model.encode(texts, convert_to_numpy=True, batch_size=64),
+    path=os.environ.get("PRODUCT_INDEX_PATH", "product_index"),
+)
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "3"))
+
+# Quick-reply GPU type -> Product.brand
+GPU_TYPE_BRANDS = {
+    "การ์ดจอ NVDIA": "NVIDIA",
+    "การ์ดจอ AMD": "AMD",
+}
+
+# Function to build a quick reply whose buttons send their own label
+def build_quick_reply(options):
+    return QuickReply(items=[QuickReplyButton(action=MessageAction(label=option, text=option)) for option in options])
+
+# Quick replies and fixed-text messages are built once and reused for every user
+QUICK_REPLIES = {menu: build_quick_reply(menu) for menu in QUICK_REPLY_MENUS}
+STATIC_MESSAGES = {
+    reply: serialize_message(TextSendMessage(text=reply.text, quick_reply=QUICK_REPLIES.get(reply.quick_reply)))
+    for reply in STATIC_REPLIES
+}
+
+# Function to turn a dialogue Reply into a LINE message, prebuilt unless the text is an answer
+def render(reply):
+    message = STATIC_MESSAGES.get(reply)
+    if message is None:
+        message = TextSendMessage(text=reply.text, quick_reply=QUICK_REPLIES.get(reply.quick_reply))
+    return message
 
 # Function to fetch all products from Neo4j
+@stage_metrics.instrument()
 def get_all_products_from_neo4j():
     query = '''
     MATCH (p:Product)
-    RETURN p.name AS name, p.price AS price, p.additional_data AS additional_data, p.img AS image, p.url AS url
+    RETURN p.name AS name, p.price AS price, p.price_thb AS price_thb, p.brand AS brand, p.vram_gb AS vram_gb,
+           p.vendor AS vendor, p.additional_data AS additional_data, p.img AS image, p.url AS url
     '''
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        with driver.session() as session:
-            results = session.run(query)
-            return [{'name': record['name'],
-                     'price': record['price'],
-                     'additional_data': record['additional_data'],
-                     'image': record['image'],  # Fetching the image URL
-                     'url': record['url']} for record in results]
-
-# Function to save chat history to Neo4j
-def save_chat_history(user_id, user_message, bot_response):
+    return fetch_all(query)
+
+# Function to fetch the catalog version the scraper bumps whenever products change
+@stage_metrics.instrument()
+def get_catalog_version():
     query = '''
-    MERGE (u:User {id: $user_id})
-    CREATE (q:Question {message: $user_message, timestamp: timestamp()})
-    CREATE (a:Answer {response: $bot_response, timestamp: timestamp()})
-    CREATE (u)-[:ASKED]->(q)
-    CREATE (q)-[:HAS_ANSWER]->(a)
+    MATCH (c:CatalogVersion {id: 'products'})
+    RETURN c.version AS version
     '''
-    parameters = {
-        'user_id': user_id,
-        'user_message': user_message,
-        'bot_response': bot_response
-    }
-    run_query(query, parameters)
-
-def ollama_response(user_message):
-    ollama_api_url = "http://localhost:11434/api/generate"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "supachai/llama-3-typhoon-v1.5",
-        "prompt": user_message + "สรุปคำตอบโดยไม่เกิน30คำ",
-        "stream": False
-    }
-    
-    response = requests.post(ollama_api_url, headers=headers, data=json.dumps(payload))
-    if response.status_code == 200:
-        data = json.loads(response.text)
-        return data.get("response", "") + " คำตอบจาก Ollama"
-    else:
-        return "ไม่สามารถตอบคำถามได้ในขณะนี้."
+    record = fetch_one(query)
+    return record['version'] if record else None
+
+# Serialized product carousels; bubbles are precompiled on every catalog load, which also
+# drops the carousels cached for the previous catalog version
+flex_cache = FlexCarouselCache(max_size=int(os.environ.get("FLEX_CACHE_SIZE", "256")))
+
+# Columnar copy of the catalog that searches are filtered, scored and paged on
+ranking = RankingEngine()
+
+# Function to rebuild everything derived from the catalog after it is (re)loaded
+def on_catalog_refresh(products, version):
+    flex_cache.compile(products, version)
+    ranking.compile(products, version)
+    semantic_cache.set_version(version)  # Cached answers may quote the old prices
+    product_index.sync_in_background(products, version)  # Re-encodes changed products off the request path
+
+# Process-wide product catalog index, reloaded when the scraper writes new data
+catalog = ProductCatalog(get_all_products_from_neo4j, version_loader=get_catalog_version,
+                         on_refresh=on_catalog_refresh)
+catalog.start_auto_refresh()
+os.register_at_fork(after_in_child=catalog.restart_after_fork)
+os.register_at_fork(after_in_child=product_index.restart_after_fork)
+
+# Keep the Ollama model loaded between bursts of questions
+keep_warm.start()
+os.register_at_fork(after_in_child=keep_warm.restart_after_fork)
+atexit.register(keep_warm.stop)
+
+# Function to save chat history to Neo4j (queued, written in batches in the background)
+def save_chat_history(user_id, user_message, bot_response, intent=None):
+    history_writer.save(user_id, user_message, bot_response, intent)
+
+# Function to answer a free-text GPU question, from the semantic cache when possible
+@stage_metrics.instrument()
+def answer_gpu_question(msg, user_id=None):
+    answer, similarity, vector = semantic_cache.lookup(msg)
+    if answer is not None:
+        return answer
+    answer = ollama_response(msg, retrieve_product_context(vector), user_id)
+    if is_cacheable(answer):
+        semantic_cache.store(msg, answer, vector)  # Reuse the embedding from the lookup
+    return answer
+
+# Function to fetch the products most relevant to an embedded question as prompt context
+def retrieve_product_context(vector):
+    try:
+        if not product_index.synced or product_index.version != catalog.version:
+            # Not built for this catalog yet (e.g. a worker forked mid-sync): answer from what the
+            # index has until the background sync finishes
+            product_index.sync_in_background(catalog.all_products(), catalog.version)
+        return build_product_context(product_index.search_vector(vector, RETRIEVAL_TOP_K))
+    except Exception as e:
+        print(f"Product retrieval failed: {e}")
+        return None
 
 def is_gpu_related_question(msg):
-    # Define a list of GPU-related keywords
-    gpu_keywords = [
-        "GPU", 
-        "กราฟิกการ์ด", "วีจีเอ", "การเลือกซื้อการ์ดจอ" ,
-    ]
-    
-    # Check if any of the GPU-related keywords are in the user's message
-    for keyword in gpu_keywords:
-        if keyword.lower() in msg.lower():
-            return True  # Return True if the message is GPU-related
-    
-    return False  # Return False if the message is not related to GPU
+    # Keyword prefilter first, then the embedding-based intent classifier
+    return intent_router.is_gpu_related(msg)
+
+# Conversation state machine (states, transitions and validators live in dialogue.py)
+conversation = DialogueEngine(is_gpu_related_question)
+
+# Health check for load balancers and container probes
+@app.route("/health", methods=['GET'])
+def health():
+    if not health_check():
+        return 'Neo4j unavailable', 503
+    return 'OK'
 
 @app.route("/", methods=['POST'])
 def linebot():
@@ -110,465 +200,221 @@ def linebot():
         abort(400)
 
     try:
-        handler.handle(body, signature)  # Handle the webhook event
+        events = handler.parser.parse(body, signature)  # Verify and parse the webhook body
     except InvalidSignatureError:
         abort(400)
     except Exception as e:
-        print(f"Error: {e}")  # Log any other errors
+        print(f"Error: {e}")  # Malformed body: log it and reject the request
+        abort(400)
+
+    # Hand the events to the worker pool and acknowledge LINE right away
+    for event in events:
+        dispatcher.submit(event_user_id(event), handle_event, event)
 
     return 'OK'
 
+# Worker pool queue depth/latency and Ollama cache hit rate
+@app.route("/stats", methods=['GET'])
+def stats():
+    return jsonify({
+        'dispatcher': dispatcher.stats(),
+        'ollama_cache': response_cache.stats(),
+        'ollama_scheduler': ollama_scheduler.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'flex_cache': flex_cache.stats(),
+        'ranking': ranking.stats(),
+        'line_api': line_client.stats(),
+        'stages': stage_metrics.snapshot(),
+        'profiler': profiler.stats(),
+    })
+
+# Per-stage latency histograms, call/error counters and in-flight gauges for Prometheus
+@app.route("/metrics", methods=['GET'])
+def prometheus_metrics():
+    dispatcher_stats = dispatcher.stats()
+    history_stats = history_writer.stats()
+    ollama_stats = ollama_scheduler.stats()
+    gauges = (
+        ('dispatcher_queue_depth', "Webhook events waiting for a worker", dispatcher_stats['queue_depth']),
+        ('dispatcher_in_flight', "Webhook events being handled", dispatcher_stats['in_flight']),
+        ('chat_history_queued', "Chat history rows waiting to be written", history_stats['queued']),
+        ('ollama_in_flight', "Ollama generations running", ollama_stats['in_flight']),
+        ('ollama_queued', "GPU questions waiting for an Ollama slot", ollama_stats['queued']),
+    )
+    counters = (
+        ('chat_history_dropped', "Chat history rows dropped because the queue was full", history_stats['dropped']),
+        ('ollama_timed_out', "GPU questions dropped after waiting past the deadline", ollama_stats['timed_out']),
+        ('ollama_rejected', "GPU questions turned away because the queue was too long", ollama_stats['rejected']),
+    )
+    return Response(stage_metrics.prometheus(gauges=gauges, counters=counters), mimetype='text/plain; version=0.0.4')
+
+# Function to route one webhook event to its handler (runs on a dispatcher thread)
+def handle_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
+    # Load the user's state, handle the message, and save the state back under the user's lock.
+    # Every stage timed while handling it (including the reply) is labelled with the step it arrived in.
+    with profiler.profile('handle_message'), stage_metrics.track('handle_message') as stage, \
+            collect_outbound(event), sessions.edit(event.source.user_id) as state:
+        stage.set_step(STEP_NAMES.get(state.get('step'), 'new'))
+        handle_message_with_state(event, state)
+
+# Function to collect every message sent while handling an event and send them together on exit
+@contextmanager
+def collect_outbound(event):
+    outbox = Outbox(line_client, event.source.user_id, event.reply_token, event.timestamp)
+    _outbound.outbox = outbox
+    try:
+        yield outbox
+    finally:
+        _outbound.outbox = None
+        outbox.flush()  # Reply token for the first 5 messages, push for the rest or once it expired
+
+# Function to send messages to a user: batched into the current event's reply when there is one
+def send_messages(user_id, *messages):
+    outbox = getattr(_outbound, 'outbox', None)
+    if outbox is not None and outbox.to == user_id:
+        outbox.add(*messages)
+        return
+    outbox = Outbox(line_client, user_id)
+    outbox.add(*messages)
+    outbox.flush()
+
+def handle_message_with_state(event, state):
     user_id = event.source.user_id
     msg = event.message.text  # Get the user's message
-    reply_token = event.reply_token  # Get the reply token
 
-    # Check if user exists in the session
-    if user_id not in user_data:
-        user_data[user_id] = {}
+    # Look up the transition for (step, message) and apply it to the state
+    turn = conversation.handle(state, msg)
 
-    # Step 0: Respond with a random greeting message and initial quick replies
-    if 'step' not in user_data[user_id]:
-        user_data[user_id]['step'] = 0
+    # Reply with the prebuilt messages for this step
+    if turn.replies:
+        send_messages(user_id, *[render(reply) for reply in turn.replies])
 
-        # Pick a random greeting from the list
-        random_greeting = random.choice(['สวัสดีครับ', 'สวัสดีค่ะ'])
-        welcome_message = f"{random_greeting} g Test พร้อมใช้งานครับ สามารถเลือก spec การ์ดจอได้เลยครับ"
-
-        quick_reply = QuickReply(
-            items=[
-                QuickReplyButton(action=MessageAction(label="แนะนำการ์ดจอ", text="แนะนำการ์ดจอ")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ NVDIA", text="การ์ดจอ NVDIA")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ AMD", text="การ์ดจอ AMD")),
-            ]
-        )
-
-        # Reply to the user
-        bot_response = welcome_message
-        line_bot_api.reply_message(reply_token, TextSendMessage(text=bot_response, quick_reply=quick_reply))
-
-        # Save chat history
-        save_chat_history(user_id, msg, bot_response)
-
-        user_data[user_id]['step'] = 1
-        return
-
-    # Step 1: If user selects "แนะนำการ์ดจอ"
-    if msg == "แนะนำการ์ดจอ":
-        bot_response = "Here are some GPU recommendations..."
+    # Save chat history
+    if turn.history is not None:
+        save_chat_history(user_id, msg, turn.history, turn_intent(turn))
+
+    if turn.action == ANSWER:
+        answer = answer_gpu_question(msg, user_id)
+        send_messages(user_id, render(answer_reply(answer)))
+        save_chat_history(user_id, msg, answer, turn_intent(turn))
+    elif turn.action == RECOMMEND:
         send_gpu_recommendations(user_id)
+    elif turn.action == SEARCH:
+        search_and_reply_with_results(user_id, state, msg)
 
-        # Save chat history
-        save_chat_history(user_id, msg, bot_response)
-        return
-
-    
-    # Step 2: If user selects "การ์ดจอ NVDIA" or "การ์ดจอ AMD"
-    if msg in ["การ์ดจอ NVDIA", "การ์ดจอ AMD"]:
-        user_data[user_id]['gpu_type'] = msg  # Store the selected GPU type
-
-        bot_response = "ขอทราบราคาครับ"
-        quick_reply = QuickReply(
-            items=[
-                QuickReplyButton(action=MessageAction(label="5000 บาท", text="5000 บาท")),
-                QuickReplyButton(action=MessageAction(label="10000 บาท", text="10000 บาท")),
-                QuickReplyButton(action=MessageAction(label="15000 บาท", text="15000 บาท")),
-                QuickReplyButton(action=MessageAction(label="25000 บาท", text="25000 บาท")),
-                QuickReplyButton(action=MessageAction(label="35000 บาท", text="35000 บาท")),
-                QuickReplyButton(action=MessageAction(label="50000 บาท", text="50000 บาท")),
-                QuickReplyButton(action=MessageAction(label="80000 บาท", text="80000 บาท")),
-                QuickReplyButton(action=MessageAction(label="100000 บาท", text="100000 บาท")),
-            ]
-        )
-        line_bot_api.reply_message(reply_token, TextSendMessage(text=bot_response, quick_reply=quick_reply))
-
-        # Save chat history
-        save_chat_history(user_id, msg, bot_response)
-
-        user_data[user_id]['step'] = 2
-        return
-    # Step 0 Continued: Handle messages outside quick replies in step 0
-    if user_data[user_id]['step'] == 0:
-        quick_reply = QuickReply(
-            items=[
-                QuickReplyButton(action=MessageAction(label="แนะนำการ์ดจอ", text="แนะนำการ์ดจอ")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ NVDIA", text="การ์ดจอ NVDIA")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ AMD", text="การ์ดจอ AMD")),
-            ]
-        )
-
-        if is_gpu_related_question(msg):
-            # Use Ollama to respond if the question is within the GPU scope but not in quick replies
-            bot_response = ollama_response(msg)
-        else:
-            # If the question is outside the GPU scope, reply with the message and show quick replies again
-            bot_response = "ผมไม่สามารถตอบคำถามนอกเหนือจาก GPU ได้ครับ"
-
-        # Always display the response with quick replies in step 0
-        line_bot_api.reply_message(reply_token, TextSendMessage(text=bot_response, quick_reply=quick_reply))
-
-        # Save chat history
-        save_chat_history(user_id, msg, bot_response)
-        return
-    # Step 3: If user selects a price
-    if user_data[user_id]['step'] == 2:
-        # Try to extract a numeric value from the user's input (e.g., "5000 บาท")
-        if isinstance(msg, str):  # Ensure msg is a string
-            price_match = re.search(r'(\d+)', msg)  # Extract numeric value from message
-            
-            if price_match:
-                price_value = int(price_match.group(1))
-                
-                # Validate the price is in the correct range
-                if 5000 <= price_value <= 100000:
-                    user_data[user_id]['price'] = price_value  # Store the valid price
-                    bot_response = "ขอทราบรายละเอียดเพิ่มเติมครับ"  # Proceed to RAM selection
-                    
-                    quick_reply = QuickReply(
-                        items=[
-                            QuickReplyButton(action=MessageAction(label="RAM 4 GB", text="RAM 4 GB")),
-                            QuickReplyButton(action=MessageAction(label="RAM 6 GB", text="RAM 6 GB")),
-                            QuickReplyButton(action=MessageAction(label="RAM 8 GB", text="RAM 8 GB")),
-                            QuickReplyButton(action=MessageAction(label="RAM 12 GB", text="RAM 12 GB")),
-                        ]
-                    )
-                    
-                    line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response), quick_reply=quick_reply))
-                    user_data[user_id]['step'] = 3  # Proceed to the next step (RAM selection)
-                else:
-                    # Reset step if price is out of range and ask again
-                    user_data[user_id]['step'] = 2  # Stay at price selection
-                    bot_response = "กรุณาเลือกราคาภายในช่วง 5000-100000 บาทครับ"
-                    
-                    quick_reply = QuickReply(
-                        items=[
-                            QuickReplyButton(action=MessageAction(label="5000 บาท", text="5000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="10000 บาท", text="10000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="15000 บาท", text="15000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="25000 บาท", text="25000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="35000 บาท", text="35000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="50000 บาท", text="50000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="80000 บาท", text="80000 บาท")),
-                            QuickReplyButton(action=MessageAction(label="100000 บาท", text="100000 บาท")),
-                        ]
-                    )
-                    
-                    line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response), quick_reply=quick_reply))
-            else:
-                # Handle case when no numeric value was found and ask again
-                user_data[user_id]['step'] = 2  # Stay at price selection
-                bot_response = "กรุณาระบุราคาเป็นตัวเลขครับ"
-                
-                quick_reply = QuickReply(
-                    items=[
-                        QuickReplyButton(action=MessageAction(label="5000 บาท", text="5000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="10000 บาท", text="10000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="15000 บาท", text="15000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="25000 บาท", text="25000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="35000 บาท", text="35000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="50000 บาท", text="50000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="80000 บาท", text="80000 บาท")),
-                        QuickReplyButton(action=MessageAction(label="100000 บาท", text="100000 บาท")),
-                    ]
-                )
-                
-                line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response), quick_reply=quick_reply))
-        else:
-            # Invalid input, reset and ask for price again
-            user_data[user_id]['step'] = 2
-            bot_response = "ผมไม่สามารถตอบคำถามนอกเหนือจาก GPU ได้ครับ"
-            quick_reply = QuickReply(
-            items=[
-                QuickReplyButton(action=MessageAction(label="แนะนำการ์ดจอ", text="แนะนำการ์ดจอ")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ NVDIA", text="การ์ดจอ NVDIA")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ AMD", text="การ์ดจอ AMD")),
-            ]
-        )
-            line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response), quick_reply=quick_reply))
-        return
-
-    # Step 4: If user selects RAM
-    if user_data[user_id]['step'] == 3:
-        valid_ram_options = ["RAM 4 GB", "RAM 6 GB", "RAM 8 GB", "RAM 12 GB"]
-        
-        if msg in valid_ram_options:
-            user_data[user_id]['ram'] = msg  # Store the valid RAM
-            bot_response = "กำลังค้นหาการ์ดจอที่ตรงกับความต้องการของคุณ..."
-            line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response)))
-            
-            # Proceed with the GPU search
-            search_and_reply_with_results(user_id)
-            
-            user_data[user_id]['step'] = 0  # Reset the conversation state
-        else:
-            # Invalid RAM input, reset and ask again
-            user_data[user_id]['step'] = 3  # Stay at RAM selection
-            bot_response = "กรุณาเลือกระหว่าง RAM 4 GB, 6 GB, 8 GB หรือ 12 GB ครับ"
-            
-            quick_reply = QuickReply(
-                items=[
-                    QuickReplyButton(action=MessageAction(label="RAM 4 GB", text="RAM 4 GB")),
-                    QuickReplyButton(action=MessageAction(label="RAM 6 GB", text="RAM 6 GB")),
-                    QuickReplyButton(action=MessageAction(label="RAM 8 GB", text="RAM 8 GB")),
-                    QuickReplyButton(action=MessageAction(label="RAM 12 GB", text="RAM 12 GB")),
-                ]
-            )
-            
-            line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response), quick_reply=quick_reply))
-        return
-
-    # If user asks something outside of GPU-related questions
-    if not is_gpu_related_question(msg):
-        user_data[user_id]['step'] = 0  # Reset the conversation
-        bot_response = "ผมไม่สามารถตอบคำถามนอกเหนือจาก GPU ได้ครับ"
-        quick_reply = QuickReply(
-            items=[
-                QuickReplyButton(action=MessageAction(label="แนะนำการ์ดจอ", text="แนะนำการ์ดจอ")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ NVDIA", text="การ์ดจอ NVDIA")),
-                QuickReplyButton(action=MessageAction(label="การ์ดจอ AMD", text="การ์ดจอ AMD")),
-            ]
-        )
-        line_bot_api.reply_message(reply_token, TextSendMessage(text=str(bot_response), quick_reply=quick_reply))
-        return
 
+# Price tiers for "แนะนำการ์ดจอ", one product each
+RECOMMENDATION_PRICE_RANGES = (5000, 10000, 15000, 20000, 35000, 50000, 100000)
 
-def send_gpu_recommendations(user_id):
-    # Define the price ranges
-    price_ranges = [5000, 10000, 15000, 20000, 35000, 50000, 100000]
-    
-    # Initialize an empty list to store one product per price range
+@stage_metrics.instrument()
+def find_gpu_recommendations():
     all_recommendations = []
-
-    for price in price_ranges:
+    for price in RECOMMENDATION_PRICE_RANGES:
         # Fetch the best GPU for the current price range
         product_in_range = get_one_product_for_price_range(price)
         if product_in_range:
             all_recommendations.append(product_in_range)  # Only one product per price range
+    return all_recommendations
+
+@stage_metrics.instrument()
+def send_gpu_recommendations(user_id):
+    # The same for every user until the catalog changes, so normally served from the cache
+    payload = flex_cache.get_or_build(('recommend',), find_gpu_recommendations)
 
     bot_response = "Here are GPU recommendations based on your request."
     
     # Send a Flex message containing the recommendations for all price ranges
-    if all_recommendations:
-        send_flex_message(user_id, all_recommendations)
+    if payload:
+        send_flex_payload(user_id, payload)
     else:
         bot_response = "ไม่มีการ์ดจอที่แนะนำในช่วงนี้"
-        line_bot_api.push_message(user_id, TextSendMessage(text=bot_response))
+        send_messages(user_id, TextSendMessage(text=bot_response))
 
     # Save chat history
-    save_chat_history(user_id, "แนะนำการ์ดจอ", bot_response)
+    save_chat_history(user_id, "แนะนำการ์ดจอ", bot_response, 'recommend')
 
 def get_one_product_for_price_range(max_price):
-    query = '''
-    MATCH (p:Product)
-    RETURN p.name AS name, p.price AS price, p.additional_data AS additional_data, p.img AS image, p.url AS url
-    '''
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        with driver.session() as session:
-            results = session.run(query)
-            closest_product = None
-            min_price_diff = float('inf')  # To track the product closest to the max_price
-            
-            for record in results:
-                price_value = float(re.sub(r'[^\d.]', '', record['price']))  # Clean price
-                if price_value <= max_price:
-                    price_diff = abs(max_price - price_value)  # Calculate price difference
-                    if price_diff < min_price_diff:  # Check if it's the closest to max_price
-                        closest_product = {
-                            'name': record['name'],
-                            'price': record['price'],
-                            'image': record['image'],
-                            'additional_data': record['additional_data'],
-                            'url': record['url']
-                        }
-                        min_price_diff = price_diff  # Update the closest product
-
-            return closest_product  # Return the closest product in the price range
-    return None
-
-
-def get_products_for_price_range(max_price):
-    query = '''
-    MATCH (p:Product)
-    RETURN p.name AS name, p.price AS price, p.additional_data AS additional_data, p.img AS image, p.url AS url
-    '''
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        with driver.session() as session:
-            results = session.run(query)
-            products = []
-            for record in results:
-                price_value = float(re.sub(r'[^\d.]', '', record['price']))
-                if price_value <= max_price:
-                    products.append({
-                        'name': record['name'],
-                        'price': record['price'],
-                        'image': record['image'],
-                        'additional_data': record['additional_data'],
-                        'url': record['url']
-                    })
-            return products
-    return []
-
-def search_and_reply_with_results(user_id):
+    # Closest product at or below max_price, looked up in the in-memory catalog index
+    return catalog.closest_at_or_below(max_price)
+
+# Function to turn the conversation state into search arguments: (brand, max_price, min_vram)
+def search_parameters(state):
     # Prepare search query based on user input
-    user_price_str = str(user_data[user_id]['price'])  # Ensure it's a string
-    user_ram = str(user_data[user_id]['ram'])  # Ensure RAM is a string
-    gpu_type = user_data[user_id].get('gpu_type', '')  # Get the GPU type
-    
-    print(f"Searching for products with Price: {user_price_str}, RAM: {user_ram}, GPU Type: {gpu_type}")
+    user_price_str = str(state['price'])  # Ensure it's a string
+    user_ram = str(state['ram'])  # Ensure RAM is a string
+    gpu_type = state.get('gpu_type', '')  # Get the GPU type
 
     # Convert user's price to a float for comparison
     try:
         user_price = float(re.sub(r'[^\d.]', '', user_price_str))  # Remove non-numeric characters
     except ValueError:
         user_price = 0
-
-    # Fetch all products from Neo4j to compare
-    all_products = get_all_products_from_neo4j()
-    if not all_products:
-        print("No products found from the database.")
-        return
-
-    print(f"Total products fetched: {len(all_products)}")
-
-    # Find the best matches based on price proximity and ensure no overpricing
-    matches = []
-    for product in all_products:
-        # Ensure all product data is present and a string
-        product_name = str(product.get('name', ''))
-        product_price_str = str(product.get('price', ''))
-        product_image = str(product.get('image', ''))
-        product_additional_data = str(product.get('additional_data', ''))
-        product_url = str(product.get('url', ''))
-
-        # Clean the price for comparison
-        try:
-            product_price = float(re.sub(r'[^\d.]', '', product_price_str))  # Remove non-numeric characters
-        except ValueError:
-            product_price = 0
-        
-        # Extract RAM size from additional_data
-        ram_match = re.search(r'Memory Size\s*(\d+GB)', product_additional_data, re.IGNORECASE)
-        if ram_match:
-            product_ram_size = ram_match.group(1)  # e.g., "8GB"
-            product_ram_size_value = int(product_ram_size.replace('GB', '').strip())
-
-            # Check if product meets the RAM, price, and GPU type criteria
-            if (product_price <= user_price and  # Ensure product price is less than or equal to user price
-                product_ram_size_value >= int(user_ram.split()[1]) and
-                ((gpu_type == "การ์ดจอ NVDIA" and "GEFORCE" in product_name.upper()) or
-                 (gpu_type == "การ์ดจอ AMD" and "RADEON" in product_name.upper()))):
-                 
-                print(f"Matched product: {product_name}, Price: {product_price_str}, RAM: {product_ram_size}")
-
-                # Calculate the price difference and store the product with its price difference
-                price_difference = abs(product_price - user_price)  # How close the product's price is to the user price
-                matches.append({
-                    'name': product_name,
-                    'price': product_price_str,
-                    'image': product_image,
-                    'url': product_url,
-                    'additional_data': product_additional_data,
-                    'price_difference': price_difference  # Store the price difference for sorting
-                })
-
-    # Sort the products by how close they are to the user's selected price
-    matches.sort(key=lambda x: x['price_difference'])
-
-    # Debugging output to check matches
-    print(f"Total matched products: {len(matches)}")
-
-    # Send Flex messages for the closest GPUs (within the price range)
-    if matches:
-        send_flex_message(user_id, matches)
+    return GPU_TYPE_BRANDS.get(gpu_type), user_price, int(user_ram.split()[1])
+
+# Function to take the next page of the user's search and advance state['result_offset'].
+# Returns (serialized carousel or None, whether more pages are left).
+@stage_metrics.instrument()
+def next_search_page(state):
+    brand, user_price, min_vram = search_parameters(state)
+    offset = state.get('result_offset') or 0
+    catalog.load()  # The ranking columns are compiled when the catalog loads
+    ranked = ranking.rank(brand, user_price, min_vram)  # Scored once per search; pages reuse it
+    shown = min(MAX_BUBBLES, len(ranked) - offset)
+    if shown <= 0:
+        return None, False
+    # Keyed on the catalog version the page was ranked from, so a refresh never serves old products
+    payload = flex_cache.get_or_build(('search', ranked.version, brand, user_price, min_vram, offset),
+                                      lambda: ranked.page(offset, MAX_BUBBLES))
+    state['result_offset'] = offset + shown
+    return payload, state['result_offset'] < len(ranked)
+
+# Function to describe a search reply in the chat history
+def search_history_response(payload, state):
+    if payload:
+        return "Here are GPUs matching your search."
+    return NO_MORE_RESULTS_TEXT if state.get('result_offset') else NO_MATCH_TEXT
+
+@stage_metrics.instrument()
+def search_and_reply_with_results(user_id, state, msg):
+    # Best matches within the user's budget first (price, VRAM and price per GB), one carousel per page
+    payload, more = next_search_page(state)
+    if payload:
+        send_flex_payload(user_id, payload, more)
+    elif state.get('result_offset'):
+        send_messages(user_id, NO_MORE_RESULTS_MESSAGE)
     else:
-        bot_response = "ไม่พบสินค้าที่ตรงกับความต้องการของคุณ."
-        line_bot_api.push_message(user_id, TextSendMessage(text=str(bot_response)))
-
-def send_flex_message(user_id, products):
-    if not products:
-        text_message = TextSendMessage(
-            text="ไม่พบสินค้าตามที่ค้นหา.",
-            quick_reply=main_quick_reply()  # Add Quick Reply when no product is found
-        )
-        line_bot_api.push_message(user_id, text_message)
-        return
-
-    # Limit the number of products to 6 for the Flex Message
-    limited_products = products[:6]
-
-    # Generate Flex Message bubbles with button linking to the product URL
-    bubbles = []
-    for prod in limited_products:
-        bubble = {
-            "type": "bubble",
-            "hero": {
-                "type": "image",
-                "url": prod['image'],  # Use the image URL fetched from Neo4j
-                "size": "full",
-                "aspectRatio": "20:13",
-                "aspectMode": "cover"
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {"type": "text", "text": prod['name'], "weight": "bold", "size": "md", "wrap": True},
-                    {"type": "text", "text": f"Price: {prod['price']}", "size": "sm", "color": "#999999"}
-                ]
-            },
-            "footer": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "sm",
-                "contents": [
-                    {
-                        "type": "button",
-                        "style": "primary",
-                        "height": "sm",
-                        "color": "#992c34",
-                        "action": {
-                            "type": "uri",
-                            "label": "More Details",
-                            "uri": prod['url']  # Link to product page
-                        }
-                    }
-                ],
-                "flex": 0
-            }
-        }
-        bubbles.append(bubble)
-
-    # Create Flex Message content
-    contents = {"type": "carousel", "contents": bubbles}
-
-    flex_message = FlexSendMessage(
-        alt_text="Product List",
-        contents=contents
-    )
-
-    # Push the Flex Message to the user
-    line_bot_api.push_message(user_id, flex_message)
-
-    # After sending the Flex Message, push a TextSendMessage with the main quick reply
-    text_message = TextSendMessage(
-        text="ต้องการค้นหาการ์ดจอเพิ่มเติมหรือไม่?",  # Message prompting further interaction
-        quick_reply=main_quick_reply()  # Add the main quick reply options here
-    )
-
-    # Push the main quick reply message
-    line_bot_api.push_message(user_id, text_message)
+        send_messages(user_id, NO_MATCH_MESSAGE)
 
+    # Save chat history
+    save_chat_history(user_id, msg, search_history_response(payload, state), 'search')
 
+# Function to send a serialized carousel followed by the main quick reply (with "more results" if more is True)
+@stage_metrics.instrument()
+def send_flex_payload(user_id, payload, more=False):
+    # The cached JSON goes out as-is, in the same call as the other messages of this event
+    send_messages(user_id, payload, MORE_RESULTS_PROMPT_MESSAGE if more else MORE_PROMPT_MESSAGE)
 
 def main_quick_reply():
-    return QuickReply(
-        items=[
-            QuickReplyButton(action=MessageAction(label="แนะนำการ์ดจอ", text="แนะนำการ์ดจอ")),
-            QuickReplyButton(action=MessageAction(label="การ์ดจอ NVDIA", text="การ์ดจอ NVDIA")),
-            QuickReplyButton(action=MessageAction(label="การ์ดจอ AMD", text="การ์ดจอ AMD")),
-        ]
-    )
+    return QUICK_REPLIES[MAIN_MENU]
+
+# Reply when a search finds nothing
+NO_MATCH_TEXT = "ไม่พบสินค้าที่ตรงกับความต้องการของคุณ."
+NO_MATCH_MESSAGE = serialize_message(TextSendMessage(text=NO_MATCH_TEXT))
+# Reply when "more results" is asked for after the last page
+NO_MORE_RESULTS_TEXT = "ไม่มีผลการค้นหาเพิ่มเติมแล้วครับ"
+NO_MORE_RESULTS_MESSAGE = serialize_message(
+    TextSendMessage(text=NO_MORE_RESULTS_TEXT, quick_reply=main_quick_reply()))
+# Prompt sent after every carousel (message prompting further interaction)
+MORE_PROMPT_MESSAGE = serialize_message(
+    TextSendMessage(text="ต้องการค้นหาการ์ดจอเพิ่มเติมหรือไม่?", quick_reply=main_quick_reply()))
+# The same prompt when the search has more pages: its first button asks for the next one
+MORE_RESULTS_PROMPT_MESSAGE = serialize_message(
+    TextSendMessage(text="ต้องการค้นหาการ์ดจอเพิ่มเติมหรือไม่?", quick_reply=QUICK_REPLIES[MORE_RESULTS_MENU]))
 
 if __name__ == '__main__':
     app.run(port=5000)
@@ -0,0 +1,242 @@
+# Conversation replay load test for the Flask app (line_main.py). Scripted multi-step
+# conversations (greeting -> brand -> price -> RAM -> results, recommendations, free-text
+# GPU questions) are sent as signed webhooks to "/", each message waiting for the bot's
+# reply before the next. LINE and Ollama are stub_line.py / stub_ollama.py servers and
+# Neo4j is stub_neo4j.py inside the bot process, all with configurable latency.
+#
+# Reports messages/s, p50/p95/p99 from webhook to reply per conversation step, the bot's
+# peak RSS and its own per-stage timings (/stats). Results can be saved as a baseline and
+# later runs compared against it; regressions beyond --tolerance exit with status 1.
+#
+#   python loadtest_conversations.py [--users 20] [--conversations 200] [--save-baseline loadtest_baseline.json]
+#   python loadtest_conversations.py --baseline loadtest_baseline.json
+#   python loadtest_conversations.py --script conversations.json  # Replay recorded conversations
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from loadtest_webhook import ReplyWaiter, percentile, wait_until_up, webhook_body
+from stub_line import start_stub_line
+from stub_ollama import start_stub_ollama
+
+GREETING = ('greeting', "สวัสดีครับ")
+# Scripted conversations: (weight, [(step label, message), ...])
+SCRIPTS = {
+    'search_nvidia': (3, [GREETING, ('brand', "การ์ดจอ NVDIA"), ('price', "15000 บาท"), ('ram', "RAM 8 GB")]),
+    'search_amd': (2, [GREETING, ('brand', "การ์ดจอ AMD"), ('price', "25000 บาท"), ('ram', "RAM 12 GB")]),
+    'recommend': (2, [GREETING, ('recommend', "แนะนำการ์ดจอ")]),
+    # The off-topic message moves the conversation to the step that answers free-text questions
+    'question': (3, [GREETING, ('off_topic', "วันนี้อากาศเป็นยังไงบ้าง"),
+                     ('question', "การ์ดจอ RTX 4060 เล่นเกม 1440p ไหวไหม"),
+                     ('question', "RX 7800 XT กับ RTX 4070 ต่างกันยังไง")]),
+}
+# Lower is better for these; throughput (higher is better) is compared separately
+COMPARED_STEP_FIELDS = ('p95_ms', 'p99_ms')
+
+
+# Function to load conversations to replay: a JSON list of [[step, message], ...] lists
+def load_script(path):
+    with open(path, encoding='utf-8') as f:
+        return [[tuple(turn) for turn in conversation] for conversation in json.load(f)]
+
+
+# Function to draw a conversation mix from SCRIPTS (same seed, same mix)
+def generate_conversations(count, seed):
+    rng = random.Random(seed)
+    names = list(SCRIPTS)
+    weights = [SCRIPTS[name][0] for name in names]
+    return [SCRIPTS[name][1] for name in rng.choices(names, weights, k=count)]
+
+
+# Function to read the peak resident set size of a process in MB (Linux only)
+def peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to run in the bot process: stub Neo4j, then serve the Flask app
+def serve(port, neo4j_delay):
+    from stub_neo4j import install_stub_neo4j
+    install_stub_neo4j(delay=neo4j_delay)
+    import line_main
+    line_main.app.run(port=port, threaded=True)
+
+
+def run_conversations(base_url, conversations, users, waiter, reply_timeout):
+    latencies, lost = {}, {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def converse(conversation):
+        http = getattr(local, 'http', None) or requests.Session()
+        local.http = http
+        user_id = f"U{uuid.uuid4().hex}"
+        for step, text in conversation:
+            token = uuid.uuid4().hex
+            arrived, arrival = waiter.expect(token)
+            body, signature = webhook_body(user_id, text, token)
+            sent = time.perf_counter()
+            response = http.post(base_url + '/', data=body, timeout=30,
+                                 headers={'X-Line-Signature': signature, 'Content-Type': 'application/json'})
+            response.raise_for_status()
+            replied = arrived.wait(reply_timeout)
+            with lock:
+                if replied:
+                    latencies.setdefault(step, []).append(arrival[0] - sent)
+                else:
+                    lost[step] = lost.get(step, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(converse, conversations))
+    return latencies, lost, time.perf_counter() - start
+
+
+def run(args):
+    conversations = load_script(args.script) if args.script else generate_conversations(args.conversations, args.seed)
+    waiter = ReplyWaiter()
+    ollama_server, ollama_url = start_stub_ollama(delay=args.ollama_delay, token_delay=args.token_delay)
+    line_server, line_url = start_stub_line(delay=args.line_delay, on_call=waiter.on_call)
+    env = dict(os.environ, OLLAMA_URL=ollama_url, LINE_API_URL=line_url,
+               PRODUCT_INDEX_PATH=os.path.join(tempfile.mkdtemp(), 'product_index'),
+               OLLAMA_POOL_SIZE=str(args.users), LINE_POOL_SIZE=str(args.users))
+    if not args.with_caches:
+        env.update(SEMANTIC_CACHE_THRESHOLD="2", OLLAMA_CACHE_SIZE="0")  # Every question reaches Ollama
+
+    process = subprocess.Popen([sys.executable, __file__, '--serve', '--port', str(args.port),
+                                '--neo4j-delay', str(args.neo4j_delay)], env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(base_url, process)
+        # One of each script first, so loading the model, catalog and product index is not measured
+        run_conversations(base_url, [script for _, script in SCRIPTS.values()], len(SCRIPTS), waiter,
+                          args.reply_timeout)
+        latencies, lost, elapsed = run_conversations(base_url, conversations, args.users, waiter, args.reply_timeout)
+        server_stats = requests.get(base_url + '/stats', timeout=10).json()
+        rss = peak_rss_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(30)
+        ollama_server.shutdown()
+        line_server.shutdown()
+
+    messages = sum(len(values) for values in latencies.values()) + sum(lost.values())
+    return {
+        'version': git_version(),
+        'config': {name: getattr(args, name) for name in (
+            'users', 'conversations', 'seed', 'script', 'ollama_delay', 'token_delay', 'line_delay',
+            'neo4j_delay', 'with_caches')},
+        'messages': messages,
+        'messages_per_s': messages / elapsed,
+        'conversations_per_s': len(conversations) / elapsed,
+        'peak_rss_mb': rss,
+        'steps': {step: {
+            'count': len(values),
+            'lost': lost.get(step, 0),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        } for step, values in ((step, latencies.get(step, [])) for step in sorted(set(latencies) | set(lost)))},
+        'server_stages': {stage: {step: {'calls': entry['calls'], 'errors': entry['errors'],
+                                         'p50_ms': entry['latency']['p50_ms'], 'p99_ms': entry['latency']['p99_ms']}
+                                  for step, entry in steps.items()}
+                          for stage, steps in server_stats.get('stages', {}).get('stages', {}).items()},
+    }
+
+
+def print_results(results):
+    print(f"{results['messages']} messages, {results['messages_per_s']:.1f} msg/s, "
+          f"{results['conversations_per_s']:.1f} conversations/s, peak RSS {results['peak_rss_mb'] or 0:.0f} MB")
+    print(f"{'step':<12}{'count':>7}{'lost':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, stats in results['steps'].items():
+        print(f"{step:<12}{stats['count']:>7}{stats['lost']:>6}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+# Function to list what got worse than the baseline by more than tolerance (a fraction)
+def compare(results, baseline, tolerance):
+    regressions = []
+    if results['messages_per_s'] < baseline['messages_per_s'] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['messages_per_s']:.1f} -> {results['messages_per_s']:.1f} msg/s")
+    if results['peak_rss_mb'] and baseline.get('peak_rss_mb') and \
+            results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']:.0f} -> {results['peak_rss_mb']:.0f} MB")
+    for step, stats in results['steps'].items():
+        before = baseline['steps'].get(step)
+        if not before:
+            continue
+        for field in COMPARED_STEP_FIELDS:
+            if stats[field] > before[field] * (1 + tolerance):
+                regressions.append(f"{step} {field} {before[field]:.1f} -> {stats[field]:.1f}")
+        if stats['lost'] > before['lost']:
+            regressions.append(f"{step} lost replies {before['lost']} -> {stats['lost']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation replay load test")
+    parser.add_argument("--users", type=int, default=20, help="concurrent conversations")
+    parser.add_argument("--conversations", type=int, default=200, help="generated conversations to run")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated conversation mix")
+    parser.add_argument("--script", help="JSON file of conversations to replay instead")
+    parser.add_argument("--ollama-delay", type=float, default=0.5, help="stub seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="stub seconds per token")
+    parser.add_argument("--line-delay", type=float, default=0.05, help="stub seconds per LINE API call")
+    parser.add_argument("--neo4j-delay", type=float, default=0.005, help="stub seconds per Neo4j query")
+    parser.add_argument("--with-caches", action="store_true", help="keep the semantic and answer caches on")
+    parser.add_argument("--reply-timeout", type=float, default=60)
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed fraction of slowdown")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)  # Bot process
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.neo4j_delay)
+        return
+
+    results = run(args)
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"Compared with {args.baseline} ({baseline.get('version')}):")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if not regressions:
+            print("  no regressions")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
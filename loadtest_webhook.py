@@ -0,0 +1,168 @@
+# Load test: the Flask app (line_main.py) vs the asyncio app (line_asgi.py) under the same
+# traffic. Both run as subprocesses against stub_ollama.py and stub_line.py; every user
+# sends a greeting, an off-topic message and then GPU questions, each as a signed
+# webhook, waiting for the bot's reply before the next message. Reports webhook
+# requests/s and ack latency, plus the end-to-end time from webhook to reply arriving
+# at the LINE stub (p50/p99). Neo4j is not needed: without it, answers have no
+# product context.
+#
+#   python loadtest_webhook.py [--users 50] [--questions 4] [--ollama-delay 0.5]
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stub_line import start_stub_line
+from stub_ollama import start_stub_ollama
+
+CHANNEL_SECRET = 'secret'  # line_main.py's channel secret
+# Greeting, then an off-topic message, which moves the conversation to the free-question step
+OPENING = ["สวัสดี", "วันนี้อากาศเป็นยังไงบ้าง"]
+QUESTIONS = ["การ์ดจอ RTX 4060 เล่นเกม 1440p ไหวไหม", "GPU ตัวไหนคุ้มสุดสำหรับตัดต่อวิดีโอ",
+             "RX 7800 XT กับ RTX 4070 ต่างกันยังไง", "การ์ดจอ 8GB พอสำหรับเกมใหม่ไหม"]
+
+MODES = {
+    'flask': lambda port: [sys.executable, '-c', f"import line_main; line_main.app.run(port={port}, threaded=True)"],
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'line_asgi:app', '--port', str(port),
+                          '--log-level', 'warning'],
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+# Function to build a signed webhook request body for one text message
+def webhook_body(user_id, text, reply_token):
+    body = json.dumps({
+        'destination': 'U' + '0' * 32,
+        'events': [{
+            'type': 'message', 'mode': 'active', 'timestamp': int(time.time() * 1000),
+            'source': {'type': 'user', 'userId': user_id},
+            'webhookEventId': uuid.uuid4().hex, 'deliveryContext': {'isRedelivery': False},
+            'replyToken': reply_token,
+            'message': {'id': uuid.uuid4().hex[:16], 'type': 'text', 'quoteToken': 'q', 'text': text},
+        }],
+    }, ensure_ascii=False)
+    signature = base64.b64encode(hmac.new(CHANNEL_SECRET.encode(), body.encode('utf-8'), hashlib.sha256).digest())
+    return body.encode('utf-8'), signature.decode()
+
+
+class ReplyWaiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}  # reply token -> (threading.Event, [arrival time])
+
+    def expect(self, token):
+        with self._lock:
+            entry = self._events[token] = (threading.Event(), [None])
+        return entry
+
+    def on_call(self, path, payload):
+        with self._lock:
+            entry = self._events.get(payload.get('replyToken'))
+        if entry:
+            entry[1][0] = time.perf_counter()
+            entry[0].set()
+
+
+def wait_until_up(base_url, process, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            requests.get(base_url + '/health', timeout=1)  # 503 without Neo4j still means it is serving
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError("server did not start")
+
+
+def run_mode(mode, args, env, waiter):
+    port = args.port
+    process = subprocess.Popen(MODES[mode](port), env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url, process)
+        ack_times, end_to_end, lost = [], [], [0]
+        local = threading.local()
+
+        def converse(user_index):
+            http = getattr(local, 'http', None) or requests.Session()
+            local.http = http
+            user_id = f"U{mode}{user_index:030d}"
+            for text in OPENING + [QUESTIONS[(user_index + i) % len(QUESTIONS)] for i in range(args.questions)]:
+                token = uuid.uuid4().hex
+                arrived, arrival = waiter.expect(token)
+                body, signature = webhook_body(user_id, text, token)
+                sent = time.perf_counter()
+                response = http.post(base_url + '/', data=body, timeout=30,
+                                     headers={'X-Line-Signature': signature, 'Content-Type': 'application/json'})
+                ack_times.append(time.perf_counter() - sent)
+                response.raise_for_status()
+                if arrived.wait(args.reply_timeout):
+                    end_to_end.append(arrival[0] - sent)
+                else:
+                    lost[0] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            list(pool.map(converse, range(args.users)))
+        elapsed = time.perf_counter() - start
+        requests_sent = len(ack_times)
+        return {
+            'mode': mode,
+            'rps': requests_sent / elapsed,
+            'ack_p99_ms': percentile(ack_times, 0.99) * 1000,
+            'e2e_p50_ms': percentile(end_to_end, 0.50) * 1000,
+            'e2e_p99_ms': percentile(end_to_end, 0.99) * 1000,
+            'lost': lost[0],
+        }
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flask vs asyncio webhook load test")
+    parser.add_argument("--users", type=int, default=50, help="concurrent conversations")
+    parser.add_argument("--questions", type=int, default=4, help="GPU questions per user after the greeting")
+    parser.add_argument("--ollama-delay", type=float, default=0.5, help="stub seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="stub seconds per token")
+    parser.add_argument("--line-delay", type=float, default=0.05, help="stub seconds per LINE API call")
+    parser.add_argument("--reply-timeout", type=float, default=60)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--modes", default="flask,asgi")
+    args = parser.parse_args()
+
+    waiter = ReplyWaiter()
+    ollama_server, ollama_url = start_stub_ollama(delay=args.ollama_delay, token_delay=args.token_delay)
+    line_server, line_url = start_stub_line(delay=args.line_delay, on_call=waiter.on_call)
+    env = dict(os.environ, OLLAMA_URL=ollama_url, LINE_API_URL=line_url,
+               SEMANTIC_CACHE_THRESHOLD="2",  # Every question goes to the Ollama stub
+               OLLAMA_CACHE_SIZE="0", OLLAMA_POOL_SIZE=str(args.users), LINE_POOL_SIZE=str(args.users),
+               DISPATCH_WORKERS=os.environ.get("DISPATCH_WORKERS", "8"))
+
+    results = [run_mode(mode, args, env, waiter) for mode in args.modes.split(',')]
+    print(f"{'mode':<8}{'req/s':>10}{'ack p99 ms':>12}{'e2e p50 ms':>12}{'e2e p99 ms':>12}{'lost':>6}")
+    for result in results:
+        print(f"{result['mode']:<8}{result['rps']:>10.1f}{result['ack_p99_ms']:>12.1f}"
+              f"{result['e2e_p50_ms']:>12.1f}{result['e2e_p99_ms']:>12.1f}{result['lost']:>6}")
+    ollama_server.shutdown()
+    line_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+# Upper bounds in seconds, from a fast API call up to a slow model answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Conversation step of the event being handled; every stage recorded meanwhile is labelled with it
+current_step = contextvars.ContextVar('current_step', default='none')
+
+
+# Fixed-bucket latency histogram: constant memory however many observations it gets
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    # Function to estimate a quantile as the upper bound of the bucket that contains it
+    def quantile(self, fraction, counts=None):
+        counts = counts or self._counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = fraction * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+    # Function to return (per-bucket counts with +Inf last, sum of observations)
+    def counts(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+    def snapshot(self):
+        counts, total_seconds = self.counts()
+        count = sum(counts)
+        return {
+            'count': count,
+            'sum': round(total_seconds, 6),
+            'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], counts)),
+            'p50_ms': round(self.quantile(0.50, counts) * 1000, 1),
+            'p95_ms': round(self.quantile(0.95, counts) * 1000, 1),
+            'p99_ms': round(self.quantile(0.99, counts) * 1000, 1),
+        }
+
+
+# One timed run of a stage. set_step() labels it, and every stage nested in it, with the conversation step.
+class Span:
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self.stage = stage
+        self._token = None
+        self._start = None
+
+    def set_step(self, step):
+        if self._token is not None:
+            current_step.reset(self._token)
+        self._token = current_step.set(step)
+
+    def __enter__(self):
+        self._metrics._enter(self.stage)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics._exit(self.stage, current_step.get(), time.perf_counter() - self._start, exc_type is not None)
+        if self._token is not None:
+            current_step.reset(self._token)
+            self._token = None
+        return False
+
+
+# Latency histograms and call/error counters per (stage, step), plus in-flight gauges per stage
+class StageMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._latency = {}  # (stage, step) -> Histogram
+        self._calls = {}  # (stage, step) -> calls
+        self._errors = {}  # (stage, step) -> calls that raised
+        self._in_flight = {}  # stage -> calls running now
+
+    # Function to time a block: with stage_metrics.track('stage'): ...
+    def track(self, stage):
+        return Span(self, stage)
+
+    # Decorator to time every call of a function or coroutine function (named after it by default)
+    def instrument(self, stage=None):
+        def decorate(func):
+            name = stage or func.__name__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with Span(self, name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with Span(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _enter(self, stage):
+        with self._lock:
+            self._in_flight[stage] = self._in_flight.get(stage, 0) + 1
+
+    def _exit(self, stage, step, seconds, failed):
+        key = (stage, step)
+        with self._lock:
+            self._in_flight[stage] -= 1
+            self._calls[key] = self._calls.get(key, 0) + 1
+            if failed:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            keys = sorted(self._calls)
+            calls, errors, in_flight = dict(self._calls), dict(self._errors), dict(self._in_flight)
+            latency = dict(self._latency)
+        stages = {}
+        for stage, step in keys:
+            stages.setdefault(stage, {})[step] = {
+                'calls': calls[(stage, step)],
+                'errors': errors.get((stage, step), 0),
+                'latency': latency[(stage, step)].snapshot(),
+            }
+        return {'stages': stages, 'in_flight': in_flight}
+
+    # Function to render the metrics in the Prometheus text exposition format.
+    # gauges: extra (name, help, value) samples that go up and down, e.g. queue depths.
+    # counters: extra (name, help, value) totals that only grow; exported as name_total.
+    def prometheus(self, namespace='linebot', gauges=(), counters=()):
+        with self._lock:
+            keys = sorted(self._calls)
+            calls, errors, in_flight = dict(self._calls), dict(self._errors), dict(self._in_flight)
+            latency = dict(self._latency)
+
+        name = f"{namespace}_stage_seconds"
+        lines = [f"# HELP {name} Time spent in each pipeline stage, by conversation step",
+                 f"# TYPE {name} histogram"]
+        for stage, step in keys:
+            labels = f'stage="{_label(stage)}",step="{_label(step)}"'
+            histogram = latency[(stage, step)]
+            counts, total_seconds = histogram.counts()
+            cumulative = 0
+            for bound, count in zip([str(bound) for bound in histogram.buckets] + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total_seconds}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+        for suffix, help_text, values in (('calls_total', "Calls of each pipeline stage", calls),
+                                          ('errors_total', "Calls of each pipeline stage that raised", errors)):
+            name = f"{namespace}_stage_{suffix}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for stage, step in keys:
+                lines.append(f'{name}{{stage="{_label(stage)}",step="{_label(step)}"}} {values.get((stage, step), 0)}')
+
+        name = f"{namespace}_stage_in_flight"
+        lines += [f"# HELP {name} Calls of each pipeline stage running now", f"# TYPE {name} gauge"]
+        for stage in sorted(in_flight):
+            lines.append(f'{name}{{stage="{_label(stage)}"}} {in_flight[stage]}')
+
+        for gauge_name, help_text, value in gauges:
+            name = f"{namespace}_{gauge_name}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        for counter_name, help_text, value in counters:
+            name = f"{namespace}_{counter_name}_total"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide stage metrics shared by the webhook, Neo4j, Ollama and LINE API code
+stage_metrics = StageMetrics()
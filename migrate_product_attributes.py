@@ -0,0 +1,47 @@
+# One-shot migration: add price_thb, vram_gb, brand, vendor and chipset to Product nodes
+# scraped before those properties existed, and create their indexes.
+#
+#   python migrate_product_attributes.py [--batch-size 500] [--all]
+import argparse
+
+from neo4j_pool import run_query, fetch_all, close_driver
+from product_attributes import parse_product_attributes, create_product_indexes
+
+SELECT_QUERY = '''
+MATCH (p:Product)
+WHERE $all OR p.price_thb IS NULL
+RETURN elementId(p) AS id, p.name AS name, p.price AS price, p.additional_data AS additional_data
+'''
+
+UPDATE_QUERY = '''
+UNWIND $rows AS row
+MATCH (p:Product) WHERE elementId(p) = row.id
+SET p.price_thb = row.price_thb, p.vram_gb = row.vram_gb, p.brand = row.brand,
+    p.vendor = row.vendor, p.chipset = row.chipset
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill typed Product attributes")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--all", action="store_true", help="re-parse every product, not just unmigrated ones")
+    args = parser.parse_args()
+
+    create_product_indexes(run_query)
+
+    products = fetch_all(SELECT_QUERY, {'all': args.all})
+    print(f"Migrating {len(products)} products...")
+    for start in range(0, len(products), args.batch_size):
+        rows = []
+        for product in products[start:start + args.batch_size]:
+            attributes = parse_product_attributes(product['name'], product['price'], product['additional_data'])
+            rows.append({'id': product['id'], **attributes})
+        run_query(UPDATE_QUERY, {'rows': rows})
+        print(f"  {start + len(rows)}/{len(products)}")
+
+    close_driver()
+    print("Migration finished.")
+
+
+if __name__ == '__main__':
+    main()
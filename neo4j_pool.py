@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+from neo4j import GraphDatabase
+from metrics import stage_metrics
+import atexit
+import os
+import threading
+
+# Neo4j connection details (override with environment variables)
+URI = os.environ.get("NEO4J_URI", "neo4j://localhost")
+AUTH = (os.environ.get("NEO4J_USER", "neo4j"), os.environ.get("NEO4J_PASSWORD", "PASSWORD"))
+
+# Connection pool settings
+MAX_POOL_SIZE = int(os.environ.get("NEO4J_MAX_POOL_SIZE", "50"))
+ACQUISITION_TIMEOUT = float(os.environ.get("NEO4J_ACQUISITION_TIMEOUT", "30"))  # Seconds to wait for a free connection
+MAX_CONNECTION_LIFETIME = float(os.environ.get("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+LIVENESS_CHECK_TIMEOUT = float(os.environ.get("NEO4J_LIVENESS_CHECK_TIMEOUT", "60"))  # Ping connections idle longer than this
+
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def _pool_settings():
+    return dict(
+        auth=AUTH,
+        max_connection_pool_size=MAX_POOL_SIZE,
+        connection_acquisition_timeout=ACQUISITION_TIMEOUT,
+        max_connection_lifetime=MAX_CONNECTION_LIFETIME,
+        liveness_check_timeout=LIVENESS_CHECK_TIMEOUT,
+    )
+
+
+# Function to get the single long-lived driver shared by the whole process
+def get_driver():
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(URI, **_pool_settings())
+    return _driver
+
+
+# Function to make the pool use an existing driver object (e.g. stub_neo4j in load tests)
+def use_driver(driver):
+    global _driver
+    with _driver_lock:
+        _driver = driver
+
+
+# Function to drop the driver inherited from the parent in a forked worker process.
+# Its sockets belong to the parent, so it is abandoned rather than closed; the
+# worker opens its own pool on first use.
+def _forget_drivers_after_fork():
+    global _driver, _driver_lock
+    _driver = None
+    _driver_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_drivers_after_fork)
+
+
+# Function to borrow a session backed by a pooled connection
+@contextmanager
+def session(**kwargs):
+    with get_driver().session(**kwargs) as neo4j_session:
+        yield neo4j_session
+
+
+# Function to run a write query and discard its results
+@stage_metrics.instrument()
+def run_query(query, parameters=None):
+    with session() as neo4j_session:
+        neo4j_session.run(query, parameters).consume()
+
+
+# Function to run a read query and return every record as a dict
+@stage_metrics.instrument()
+def fetch_all(query, parameters=None):
+    with session() as neo4j_session:
+        return [record.data() for record in neo4j_session.run(query, parameters)]
+
+
+# Function to run a read query and return the first record as a dict (or None)
+@stage_metrics.instrument()
+def fetch_one(query, parameters=None):
+    with session() as neo4j_session:
+        record = neo4j_session.run(query, parameters).single()
+        return record.data() if record else None
+
+
+# Function to check that the database is reachable through the pool
+def health_check():
+    try:
+        get_driver().verify_connectivity()
+        return True
+    except Exception as e:
+        print(f"Neo4j health check failed: {e}")
+        return False
+
+
+# Function to close the pool on shutdown
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+atexit.register(close_driver)
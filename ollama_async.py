@@ -0,0 +1,69 @@
+import json
+
+import httpx
+
+from metrics import stage_metrics
+from ollama_client import (
+    OLLAMA_URL, OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_POOL_SIZE,
+    FALLBACK_REPLY, AnswerBudget, build_prompt, busy_reply, generate_payload, response_cache, scheduler
+)
+from ollama_scheduler import OllamaBusy
+
+
+# asyncio counterpart of ollama_client: same prompt, word budget and answer cache,
+# but waiting on Ollama does not hold a thread. Create it inside the running event loop.
+class AsyncOllamaClient:
+    def __init__(self, base_url=OLLAMA_URL, pool_size=OLLAMA_POOL_SIZE):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    # Function to ask Ollama for an answer, stopping once the word/token budget is reached.
+    # Leaving the stream early closes the connection, which makes Ollama stop generating.
+    async def generate(self, user_message, context=None):
+        budget = AnswerBudget()
+        async with self.http.stream("POST", "/api/generate",
+                                    json=generate_payload(build_prompt(user_message, context))) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response") and budget.add(chunk["response"]):
+                    break
+                if chunk.get("done"):
+                    break
+        return budget.answer()
+
+    # Function to answer a GPU question, reusing earlier answers to the same question.
+    # Generations take a slot from the same scheduler as the threaded client.
+    @stage_metrics.instrument('ollama_response')
+    async def response(self, user_message, context=None, user_id=None):
+        async def scheduled_generate(msg):
+            async with scheduler.slot_async(user_id):
+                return await self.generate(msg, context)
+
+        try:
+            return await response_cache.get_or_compute_async(user_message, scheduled_generate, context)
+        except OllamaBusy as busy:
+            print(f"Ollama request not scheduled: {busy}")
+            return busy_reply(busy)
+        except Exception as e:
+            print(f"Ollama request failed: {e}")
+            return FALLBACK_REPLY
+
+    # Function to have Ollama load the model into memory (an empty prompt only loads it)
+    async def warm_up(self):
+        try:
+            response = await self.http.post("/api/generate", json={"model": OLLAMA_MODEL, "prompt": "",
+                                                                 "keep_alive": OLLAMA_KEEP_ALIVE})
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Ollama warm-up failed: {e}")
+
+    async def aclose(self):
+        await self.http.aclose()
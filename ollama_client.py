@@ -0,0 +1,196 @@
+from requests.adapters import HTTPAdapter
+from response_cache import ResponseCache
+from metrics import stage_metrics
+from ollama_scheduler import OllamaBusy, OllamaScheduler, ModelKeepWarm
+import atexit
+import json
+import math
+import os
+import requests
+import time
+
+# Ollama connection details (override with environment variables, e.g. to point at stub_ollama.py)
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "supachai/llama-3-typhoon-v1.5")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  # How long Ollama keeps the model loaded after a request
+
+# Generation budget: the prompt asks for at most 30 words, so stop reading once we have them
+OLLAMA_MAX_WORDS = int(os.environ.get("OLLAMA_MAX_WORDS", "30"))
+OLLAMA_MAX_TOKENS = int(os.environ.get("OLLAMA_MAX_TOKENS", "120"))  # Thai text has few spaces
+
+# Timeouts in seconds
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "3"))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "30"))  # Max wait between two chunks
+OLLAMA_TOTAL_TIMEOUT = float(os.environ.get("OLLAMA_TOTAL_TIMEOUT", "60"))
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "8"))
+
+
+# Replies that are not answers from the model, so callers know not to cache them
+class FallbackReply(str):
+    pass
+
+
+FALLBACK_REPLY = FallbackReply("ไม่สามารถตอบคำถามได้ในขณะนี้.")
+
+
+# An answer the model did not finish (cut off by the total timeout, or empty): it is sent,
+# but not cached, so later askers get a fresh generation
+class IncompleteAnswer(str):
+    pass
+
+
+# Function to tell whether an answer may be cached and served to later askers
+def is_cacheable(answer):
+    return bool(answer) and not isinstance(answer, (FallbackReply, IncompleteAnswer))
+
+# Persistent HTTP session so requests reuse pooled keep-alive connections
+http = requests.Session()
+http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE))
+http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE))
+
+# Cache of generated answers keyed by the normalized question
+response_cache = ResponseCache(
+    max_size=int(os.environ.get("OLLAMA_CACHE_SIZE", "1000")),
+    ttl=float(os.environ.get("OLLAMA_CACHE_TTL", "86400")),
+    path=os.environ.get("OLLAMA_CACHE_PATH") or None,  # e.g. ollama_cache.json to survive restarts
+    cacheable=is_cacheable,
+)
+atexit.register(response_cache.save)
+atexit.register(http.close)
+
+# Slots for concurrent generations, shared by the Flask and asyncio apps
+scheduler = OllamaScheduler()
+
+
+# Function to build the prompt sent to the model, optionally grounded in catalog products
+def build_prompt(user_message, context=None):
+    if not context:
+        return user_message + "สรุปคำตอบโดยไม่เกิน30คำ"
+    return ("สินค้าในร้าน (ชื่อ | ราคา | สเปค):\n" + context + "\n"
+            "คำถาม: " + user_message + "\n"
+            "ตอบโดยอ้างอิงสินค้าข้างต้นเมื่อเกี่ยวข้อง สรุปคำตอบโดยไม่เกิน30คำ")
+
+
+# Function to build the streaming /api/generate request body
+def generate_payload(prompt):
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_predict": OLLAMA_MAX_TOKENS},
+    }
+
+
+# Function to have Ollama load the model, or keep it loaded (an empty prompt generates nothing)
+def keep_alive_ping():
+    response = http.post(OLLAMA_URL + "/api/generate",
+                         json={"model": OLLAMA_MODEL, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE},
+                         timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TOTAL_TIMEOUT))  # Loading the model can take a while
+    response.raise_for_status()
+
+
+# Pings Ollama between bursts of questions; started by the app (see line_main.py)
+keep_warm = ModelKeepWarm(keep_alive_ping, scheduler)
+
+
+# Function to stream response pieces from /api/generate as Ollama produces them.
+# Closing the generator early drops the connection, which makes Ollama stop generating.
+def stream_generate(prompt):
+    payload = generate_payload(prompt)
+    with http.post(OLLAMA_URL + "/api/generate", json=payload, stream=True,
+                   timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                return
+
+
+# Function to cut text down to its first max_words words
+def truncate_words(text, max_words):
+    words = text.split()
+    if len(words) <= max_words:
+        return text.strip()
+    return " ".join(words[:max_words])
+
+
+# Collects streamed pieces until the word/token budget or the total timeout is used up
+class AnswerBudget:
+    def __init__(self):
+        self.pieces = []
+        self.tokens = 0
+        self.words = 0
+        self.deadline = time.monotonic() + OLLAMA_TOTAL_TIMEOUT
+        self.cut_short = False  # Stopped by the total timeout rather than the budget or the end
+
+    # Function to add one streamed piece; returns True once no more are needed
+    def add(self, piece):
+        self.pieces.append(piece)
+        self.tokens += 1
+        if piece[:1].isspace():
+            self.words += 1  # A leading space starts a new word
+        if self.tokens >= OLLAMA_MAX_TOKENS or self.words >= OLLAMA_MAX_WORDS:
+            return True
+        # Keep the partial answer; the read timeout covers a silent Ollama
+        self.cut_short = time.monotonic() > self.deadline
+        return self.cut_short
+
+    def answer(self):
+        text = truncate_words("".join(self.pieces), OLLAMA_MAX_WORDS)
+        if self.cut_short or not text:
+            return IncompleteAnswer(text + " คำตอบจาก Ollama")
+        return text + " คำตอบจาก Ollama"
+
+
+# Function to ask Ollama for an answer, stopping once the word/token budget is reached.
+# Raises if Ollama cannot be reached or goes silent for longer than the read timeout.
+def generate(user_message, context=None):
+    budget = AnswerBudget()
+    stream = stream_generate(build_prompt(user_message, context))
+    try:
+        for piece in stream:
+            if budget.add(piece):
+                break
+    finally:
+        stream.close()  # Cancel the rest of the generation
+
+    return budget.answer()
+
+
+# Function to tell a user whose question was not answered because Ollama is busy how long
+# the queue was, so they know whether to ask again soon or later
+def busy_reply(busy):
+    if busy.position is None:
+        return FallbackReply("ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาถามใหม่อีกครั้งในภายหลังครับ")
+    if busy.position <= scheduler.concurrency:
+        return FallbackReply("ระบบกำลังตอบคำถามอื่นอยู่ กรุณาถามใหม่อีกครั้งในอีกสักครู่ครับ")
+    minutes = max(1, math.ceil(busy.estimated_wait / 60))
+    return FallbackReply(f"ขณะนี้มีคำถามรออยู่ก่อนหน้า {busy.position - 1} คำถาม "
+                         f"กรุณาถามใหม่อีกครั้งในอีกประมาณ {minutes} นาทีครับ")
+
+
+# Function to answer a GPU question, reusing earlier answers to the same question with the
+# same context. context is the retrieved product list to ground the answer in (see
+# product_retrieval); it is part of the cache key, so a catalog change gives new answers.
+# Generations wait for a scheduler slot in user_id's queue; cached answers do not.
+@stage_metrics.instrument()
+def ollama_response(user_message, context=None, user_id=None):
+    def scheduled_generate(msg):
+        with scheduler.slot(user_id):
+            return generate(msg, context)
+
+    try:
+        return response_cache.get_or_compute(user_message, scheduled_generate, context)
+    except OllamaBusy as busy:
+        print(f"Ollama request not scheduled: {busy}")
+        return busy_reply(busy)
+    except Exception as e:
+        print(f"Ollama request failed: {e}")
+        return FALLBACK_REPLY
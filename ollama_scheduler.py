@@ -0,0 +1,238 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import math
+import os
+import threading
+import time
+
+from metrics import stage_metrics
+
+# Generations run against Ollama at once; on a CPU-only host more than 1-2 only slows every one down
+OLLAMA_CONCURRENCY = int(os.environ.get("OLLAMA_CONCURRENCY", "2"))
+OLLAMA_QUEUE_DEADLINE = float(os.environ.get("OLLAMA_QUEUE_DEADLINE", "20"))  # Seconds a question may wait for a slot
+OLLAMA_MAX_QUEUE = int(os.environ.get("OLLAMA_MAX_QUEUE", "50"))  # Waiting questions before new ones are turned away
+OLLAMA_KEEP_ALIVE_INTERVAL = float(os.environ.get("OLLAMA_KEEP_ALIVE_INTERVAL", "240"))  # Seconds between pings; 0 = off
+
+SERVICE_TIME_SMOOTHING = 0.2  # Weight of the latest generation in the moving average
+
+
+# Raised instead of waiting for a slot that would come too late (or never: the queue is full)
+class OllamaBusy(Exception):
+    def __init__(self, position, estimated_wait):
+        super().__init__(f"Ollama busy (queue position {position}, about {estimated_wait:.0f}s to wait)")
+        self.position = position  # Place in the queue when given up, 1 = next; None when the queue was full
+        self.estimated_wait = estimated_wait
+
+
+# One question waiting for a slot; wake() is called (under the scheduler lock) once it has one
+class _Waiter:
+    def __init__(self, user_id, wake):
+        self.user_id = user_id
+        self.wake = wake
+        self.granted = False
+
+
+def _resolve(future):
+    if not future.done():  # Cancelled meanwhile: the waiter gives the slot back itself
+        future.set_result(None)
+
+
+# Bounded pool of Ollama generation slots with a fair queue: waiting questions are granted
+# round-robin across users, so one user sending many questions cannot starve the others.
+# A question that would wait longer than the deadline is turned away with OllamaBusy, either
+# up front (from the queue position and the average generation time) or when the deadline
+# passes. Threads use slot(), coroutines slot_async(); both share the same slots.
+class OllamaScheduler:
+    def __init__(self, concurrency=OLLAMA_CONCURRENCY, deadline=OLLAMA_QUEUE_DEADLINE, max_queue=OLLAMA_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._free = concurrency
+        self._queues = OrderedDict()  # user_id -> deque of _Waiter; key order is the round-robin turn
+        self._queued = 0
+        self._service_time = None  # Moving average of the seconds a slot is held
+        self.last_used = time.monotonic()  # When a generation last finished
+        self.served = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+    # Function to hold a slot for the duration of a block, waiting in the user's queue if needed
+    @contextmanager
+    def slot(self, user_id=None):
+        granted = threading.Event()
+        waiter = _Waiter(user_id, granted.set)
+        with stage_metrics.track('ollama_queue'):
+            self._enqueue(waiter)
+            if not granted.wait(self.deadline):
+                busy = self._give_up(waiter, timed_out=True)
+                if busy is not None:
+                    raise busy
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    # Function to hold a slot for the duration of an async with block (same queue as slot())
+    @asynccontextmanager
+    async def slot_async(self, user_id=None):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        waiter = _Waiter(user_id, lambda: loop.call_soon_threadsafe(_resolve, granted))
+        with stage_metrics.track('ollama_queue'):
+            self._enqueue(waiter)
+            try:
+                await asyncio.wait_for(granted, self.deadline)
+            except asyncio.TimeoutError:
+                busy = self._give_up(waiter, timed_out=True)
+                if busy is not None:
+                    raise busy
+            except asyncio.CancelledError:
+                if self._give_up(waiter, timed_out=False) is None:
+                    self._release(None)  # Granted just before the cancellation: pass it on
+                raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    # Function to take a free slot or join the user's queue; raises OllamaBusy if waiting is pointless
+    def _enqueue(self, waiter):
+        with self._lock:
+            if self._free:  # Free slots only exist while nobody is waiting
+                self._free -= 1
+                waiter.granted = True
+                waiter.wake()
+                return
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise OllamaBusy(None, self._estimate_locked(self._queued + 1))
+            self._queues.setdefault(waiter.user_id, deque()).append(waiter)
+            self._queued += 1
+            position = self._position_locked(waiter)
+            estimated_wait = self._estimate_locked(position)
+            if estimated_wait > self.deadline:
+                self._remove_locked(waiter)
+                self.rejected += 1
+                raise OllamaBusy(position, estimated_wait)
+
+    # Function to leave the queue after the deadline or a cancellation. Returns the OllamaBusy
+    # to raise, or None if the slot was granted meanwhile (the caller then holds it).
+    def _give_up(self, waiter, timed_out):
+        with self._lock:
+            if waiter.granted:
+                return None
+            position = self._position_locked(waiter)
+            self._remove_locked(waiter)
+            if timed_out:
+                self.timed_out += 1
+            return OllamaBusy(position, self._estimate_locked(position))
+
+    # Function to hand a slot to the next user in turn, or free it; held is None if it was not used
+    def _release(self, held):
+        with self._lock:
+            if held is not None:
+                self.served += 1
+                self.last_used = time.monotonic()
+                if self._service_time is None:
+                    self._service_time = held
+                else:
+                    self._service_time += SERVICE_TIME_SMOOTHING * (held - self._service_time)
+            if not self._queues:
+                self._free += 1
+                return
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)  # The user's next question waits for its next turn
+            else:
+                del self._queues[user_id]
+            waiter.granted = True
+            waiter.wake()
+
+    def _remove_locked(self, waiter):
+        queue = self._queues[waiter.user_id]
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[waiter.user_id]
+
+    # Function to count the slots granted before a waiter, plus one. Turns go round the users in
+    # order, one question each, so from every user's queue at most as many questions as stand
+    # before the waiter in its own queue go first (one more for users ahead of it in the turn).
+    def _position_locked(self, waiter):
+        index = self._queues[waiter.user_id].index(waiter)
+        ahead = 0
+        before = True
+        for user_id, queue in self._queues.items():
+            if user_id == waiter.user_id:
+                before = False
+                continue
+            ahead += min(len(queue), index + before)
+        return ahead + index + 1
+
+    # Function to estimate the seconds until a queue position gets a slot (0 before any generation)
+    def _estimate_locked(self, position):
+        if self._service_time is None:
+            return 0.0
+        return math.ceil(position / self.concurrency) * self._service_time
+
+    # Function to report slot usage, queue depth and outcomes
+    def stats(self):
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'in_flight': self.concurrency - self._free,
+                'queued': self._queued,
+                'waiting_users': len(self._queues),
+                'served': self.served,
+                'timed_out': self.timed_out,
+                'rejected': self.rejected,
+                'generation_avg_ms': round((self._service_time or 0.0) * 1000, 1),
+                'idle_seconds': round(time.monotonic() - self.last_used, 1),
+            }
+
+
+# Pings Ollama every interval while no question has been answered, so the model stays
+# loaded between bursts instead of being unloaded and reloaded for the next question
+class ModelKeepWarm:
+    def __init__(self, ping, scheduler, interval=OLLAMA_KEEP_ALIVE_INTERVAL):
+        self._ping = ping
+        self._scheduler = scheduler
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.pings = 0
+        self.failures = 0
+
+    # Function to start the background pings (does nothing if the interval is 0)
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-keep-warm", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if time.monotonic() - self._scheduler.last_used < self.interval:
+                continue  # A generation ran since the last ping and kept the model loaded
+            try:
+                self._ping()
+                self.pings += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"Ollama keep-alive ping failed: {e}")
+
+    # Function to start a fresh thread in a forked worker (threads do not survive fork)
+    def restart_after_fork(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,61 @@
+from product_catalog import parse_price
+import re
+
+# Board partners as they appear at the start of ihavecpu product names
+VENDORS = [
+    "ASUS", "MSI", "GIGABYTE", "ZOTAC", "GALAX", "INNO3D", "PALIT", "COLORFUL", "PNY",
+    "SAPPHIRE", "POWERCOLOR", "XFX", "ASROCK", "INTEL", "NVIDIA", "AMD", "PELADN", "MANLI",
+]
+
+CHIPSET_PATTERN = re.compile(
+    r'\b(RTX|GTX|GT|RX|ARC)\s*-?\s*([A-Z]?\d{3,4})(?:\s*(TI\s*SUPER|TI|SUPER|XTX|XT|GRE))?\b')
+VRAM_PATTERN = re.compile(r'Memory Size\s*:?\s*(\d+)\s*GB', re.IGNORECASE)
+
+# Neo4j indexes the structured search filters and sorts on
+PRODUCT_SCHEMA_QUERIES = [
+    "CREATE INDEX product_price_thb IF NOT EXISTS FOR (p:Product) ON (p.price_thb)",
+    "CREATE INDEX product_vram_gb IF NOT EXISTS FOR (p:Product) ON (p.vram_gb)",
+    "CREATE INDEX product_brand_price IF NOT EXISTS FOR (p:Product) ON (p.brand, p.price_thb)",
+    "CREATE INDEX product_chipset IF NOT EXISTS FOR (p:Product) ON (p.chipset)",
+]
+
+
+# Function to derive typed, queryable properties from the scraped strings
+def parse_product_attributes(name, price, additional_data):
+    name_upper = str(name or '').upper()
+
+    vram_match = VRAM_PATTERN.search(str(additional_data or ''))
+    vram_gb = int(vram_match.group(1)) if vram_match else None
+
+    chipset = None
+    family = None
+    chipset_match = CHIPSET_PATTERN.search(name_upper)
+    if chipset_match:
+        family = chipset_match.group(1)
+        suffix = ' ' + re.sub(r'\s+', ' ', chipset_match.group(3)) if chipset_match.group(3) else ''
+        chipset = f"{family} {chipset_match.group(2)}{suffix}"
+
+    if "GEFORCE" in name_upper or family in ("RTX", "GTX", "GT"):
+        brand = "NVIDIA"
+    elif "RADEON" in name_upper or family == "RX":
+        brand = "AMD"
+    elif family == "ARC":
+        brand = "INTEL"
+    else:
+        brand = None
+
+    vendor = next((v for v in VENDORS if re.search(r'\b' + v + r'\b', name_upper)), None)
+
+    return {
+        'price_thb': parse_price(price),
+        'vram_gb': vram_gb,
+        'brand': brand,
+        'vendor': vendor,
+        'chipset': chipset,
+    }
+
+
+# Function to create the indexes on the typed properties (idempotent)
+def create_product_indexes(run_query):
+    for query in PRODUCT_SCHEMA_QUERIES:
+        run_query(query)
@@ -0,0 +1,112 @@
+import bisect
+import re
+import threading
+import time
+
+
+# Function to turn a scraped price string (e.g. "฿12,990") into a number
+def parse_price(price):
+    try:
+        return float(re.sub(r'[^\d.]', '', str(price)))
+    except ValueError:
+        return None
+
+
+# Process-wide, price-sorted view of the Product nodes.
+# Products are loaded once, prices are parsed once, and lookups are bisect-based.
+class ProductCatalog:
+    def __init__(self, loader, version_loader=None, refresh_interval=60, on_refresh=None):
+        self._loader = loader  # Returns a list of product dicts
+        self._version_loader = version_loader  # Returns a value that changes whenever the scraper writes
+        self._refresh_interval = refresh_interval
+        self._on_refresh = on_refresh  # Called with (products, version) after every load
+        self._lock = threading.Lock()
+        self._snapshot = None  # (prices, products, version), swapped atomically
+        self._refresher = None
+
+    # Function to (re)load the catalog from the database
+    def refresh(self):
+        version = self._version_loader() if self._version_loader else None
+        entries = []
+        for product in self._loader():
+            price_value = product.get('price_thb')  # Parsed at scrape time when available
+            if price_value is None:
+                price_value = parse_price(product.get('price'))
+            if price_value is None:
+                continue  # Skip products without a usable price
+            entries.append((price_value, product))
+        entries.sort(key=lambda entry: entry[0])
+
+        prices = [price_value for price_value, _ in entries]
+        products = [product for _, product in entries]
+        self._snapshot = (prices, products, version)
+        if self._on_refresh:
+            self._on_refresh(products, version)
+        return len(products)
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.refresh()
+                snapshot = self._snapshot
+        return snapshot
+
+    # Function to load the catalog now if it has not been loaded yet (lookups do it on first use),
+    # which also runs the on_refresh hook
+    def load(self):
+        self._get_snapshot()
+
+    @property
+    def version(self):
+        return self._get_snapshot()[2]
+
+    # Function to return every product, cheapest first
+    def all_products(self):
+        return list(self._get_snapshot()[1])
+
+    # Function to find the product priced closest to max_price without going over
+    def closest_at_or_below(self, max_price):
+        prices, products, _ = self._get_snapshot()
+        index = bisect.bisect_right(prices, max_price)
+        return products[index - 1] if index else None
+
+    # Function to find every product priced at or below max_price, cheapest first
+    def all_at_or_below(self, max_price):
+        prices, products, _ = self._get_snapshot()
+        return products[:bisect.bisect_right(prices, max_price)]
+
+    # Function to reload the catalog only if the scraper published new data
+    def refresh_if_changed(self):
+        if self._version_loader is None:
+            return False
+        if self._snapshot is not None and self._version_loader() == self._snapshot[2]:
+            return False
+        with self._lock:
+            self.refresh()
+        return True
+
+    # Function to poll for catalog changes in a background thread
+    def start_auto_refresh(self):
+        if self._refresher is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(self._refresh_interval)
+                try:
+                    self.refresh_if_changed()
+                except Exception as e:
+                    print(f"Catalog refresh failed: {e}")
+
+        self._refresher = threading.Thread(target=poll, name="catalog-refresh", daemon=True)
+        self._refresher.start()
+
+    # Function to recreate the lock and polling thread in a forked worker process
+    # (threads do not survive fork; the loaded snapshot is inherited as is)
+    def restart_after_fork(self):
+        self._lock = threading.Lock()
+        if self._refresher is not None:
+            self._refresher = None
+            self.start_auto_refresh()
@@ -0,0 +1,137 @@
+# Bulk ingestion of scraped products: buffered rows written with one UNWIND per chunk,
+# optionally captured to JSONL so one crawl can be loaded many times.
+#
+#   python product_loader.py crawl.jsonl [--batch-size 500]
+import argparse
+import hashlib
+import json
+
+from neo4j_pool import run_query, session, close_driver
+from product_attributes import parse_product_attributes, create_product_indexes
+
+# Constraints the MERGE key relies on (a uniqueness constraint is also an index)
+PRODUCT_CONSTRAINT_QUERIES = [
+    "CREATE CONSTRAINT product_name_unique IF NOT EXISTS FOR (p:Product) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT catalog_version_id_unique IF NOT EXISTS FOR (c:CatalogVersion) REQUIRE c.id IS UNIQUE",
+]
+
+UPSERT_PRODUCTS_QUERY = '''
+UNWIND $batch AS row
+MERGE (p:Product {name: row.name})
+SET p += row, p.last_seen = coalesce(row.last_seen, timestamp())
+'''
+
+
+# Function to hash the listing-page fields; unchanged listings skip the detail fetch
+def listing_hash(listing):
+    return hashlib.sha1(f"{listing['name']}|{listing['price']}|{listing['url']}".encode('utf-8')).hexdigest()
+
+
+# Function to hash everything we store for a product; unchanged products are not rewritten
+def content_hash(product_data):
+    fields = [product_data[key] for key in ('name', 'price', 'img', 'url', 'additional_data')]
+    return hashlib.sha1('|'.join(str(field) for field in fields).encode('utf-8')).hexdigest()
+
+
+# Function to create the constraints and indexes product ingestion needs (idempotent)
+def ensure_product_schema():
+    for query in PRODUCT_CONSTRAINT_QUERIES:
+        run_query(query)
+    create_product_indexes(run_query)
+
+
+# Function to turn scraped product data into the full property map stored on a Product
+def product_row(product_data, last_seen=None):
+    row = {key: product_data[key] for key in ('name', 'price', 'img', 'url', 'additional_data')}
+    row.update(parse_product_attributes(product_data['name'], product_data['price'],
+                                        product_data['additional_data']))
+    row['listing_hash'] = listing_hash(product_data)
+    row['content_hash'] = content_hash(product_data)
+    row['last_seen'] = last_seen
+    return row
+
+
+# Function to write one chunk of rows in a single explicit transaction
+def write_batch(rows):
+    with session() as neo4j_session:
+        neo4j_session.execute_write(lambda tx: tx.run(UPSERT_PRODUCTS_QUERY, batch=rows).consume())
+
+
+# Buffers products and writes them in chunks. dry_run skips Neo4j entirely;
+# export_path appends every row to a JSONL file that load_jsonl() can replay.
+class ProductBulkLoader:
+    def __init__(self, batch_size=500, dry_run=False, export_path=None, last_seen=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.last_seen = last_seen
+        self.written = 0
+        self._buffer = []
+        self._export = open(export_path, 'w', encoding='utf-8') if export_path else None
+
+    def add(self, product_data):
+        self.add_row(product_row(product_data, self.last_seen))
+
+    def add_row(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        if self._export:
+            for row in rows:
+                self._export.write(json.dumps(row, ensure_ascii=False) + '\n')
+        if not self.dry_run:
+            write_batch(rows)
+        self.written += len(rows)
+
+    def close(self):
+        self.flush()
+        if self._export:
+            self._export.close()
+            self._export = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Function to load a crawl captured with export_path; returns the number of products
+def load_jsonl(path, batch_size=500):
+    ensure_product_schema()
+    with ProductBulkLoader(batch_size) as loader, open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                loader.add_row(json.loads(line))
+    return loader.written
+
+
+# Function to tell running bots that new product data is available.
+# Consumers compare the version number to know when to drop their caches.
+def publish_catalog_version():
+    query = '''
+    MERGE (c:CatalogVersion {id: 'products'})
+    SET c.version = coalesce(c.version, 0) + 1, c.updated_at = timestamp()
+    RETURN c.version AS version
+    '''
+    with session() as neo4j_session:
+        record = neo4j_session.run(query).single()
+        return record['version'] if record else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a captured crawl (JSONL) into Neo4j")
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    print(f"Loaded {load_jsonl(args.path, args.batch_size)} products from {args.path}")
+    print(f"Published catalog version {publish_catalog_version()}")
+    close_driver()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+from collections import OrderedDict, namedtuple
+import os
+import threading
+
+import numpy as np
+
+from product_attributes import parse_product_attributes
+from product_catalog import parse_price
+
+# Relative weight of each criterion in a product's score (override with environment variables)
+RankingWeights = namedtuple('RankingWeights', 'price vram value')
+DEFAULT_WEIGHTS = RankingWeights(
+    price=float(os.environ.get("RANK_WEIGHT_PRICE", "1.0")),  # Price close to the budget
+    vram=float(os.environ.get("RANK_WEIGHT_VRAM", "0.3")),  # VRAM above what was asked for
+    value=float(os.environ.get("RANK_WEIGHT_VALUE", "0.3")),  # Low price per GB of VRAM
+)
+RANKING_CACHE_SIZE = int(os.environ.get("RANKING_CACHE_SIZE", "512"))  # Ranked searches kept for paging
+
+
+# The ranked matches of one search. Only as much of the order as has been paged through is
+# sorted: each page extends it with a partial selection (np.partition) of the scores.
+class RankedResults:
+    def __init__(self, products, candidates, scores, version=None):
+        self.version = version  # Catalog version the products were ranked from
+        self._products = products
+        self._candidates = candidates  # Catalog rows that passed the filters
+        self._scores = scores
+        self._order = np.empty(0, dtype=np.intp)  # Best-first positions in candidates, sorted so far
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._candidates)
+
+    # Function to return products [offset, offset + size) of the ranking
+    def page(self, offset, size):
+        end = min(offset + size, len(self._candidates))
+        if offset >= end:
+            return []
+        with self._lock:
+            if len(self._order) < end:
+                # Sort twice as much as needed, so the next pages are usually ready
+                count = min(len(self._candidates), max(end, 2 * len(self._order)))
+                negated = -self._scores
+                if count < len(negated):
+                    # Everything tied with the count-th score as well, so the sorted part is
+                    # always a prefix of the same full order and served pages never change
+                    top = np.flatnonzero(negated <= np.partition(negated, count - 1)[count - 1])
+                else:
+                    top = np.arange(len(negated))
+                # Equal scores are ordered by catalog row
+                self._order = top[np.lexsort((self._candidates[top], negated[top]))]
+            rows = self._candidates[self._order[offset:end]]
+        return [self._products[row] for row in rows]
+
+
+# Catalog as columns (price, VRAM, brand, vendor) for filtering and scoring searches in one
+# vectorized pass. Rebuilt on every catalog refresh; ranked searches are cached for paging.
+class RankingEngine:
+    def __init__(self, weights=DEFAULT_WEIGHTS, cache_size=RANKING_CACHE_SIZE):
+        self.weights = weights
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._columns = None  # (products, price, vram, brand codes, vendor codes, codes by name, version)
+        self._cache = OrderedDict()  # (version, brand, max_price, min_vram, vendor) -> RankedResults
+        self.hits = 0
+        self.misses = 0
+
+    # Function to rebuild the columns from a freshly loaded catalog (ProductCatalog on_refresh hook)
+    def compile(self, products, version=None):
+        products = list(products)
+        price = np.empty(len(products), dtype=np.float64)
+        vram = np.zeros(len(products), dtype=np.float32)
+        brand = np.zeros(len(products), dtype=np.int16)
+        vendor = np.zeros(len(products), dtype=np.int16)
+        codes = {None: 0}  # Brand and vendor names -> small integers; 0 is unknown
+        for row, product in enumerate(products):
+            attributes = product
+            if product.get('vram_gb') is None or product.get('brand') is None:
+                # Scraped before the typed properties existed: parse them from the strings
+                attributes = parse_product_attributes(product.get('name'), product.get('price'),
+                                                      product.get('additional_data'))
+            price_thb = product.get('price_thb')
+            price[row] = (price_thb if price_thb is not None else parse_price(product.get('price'))) or 0
+            vram[row] = attributes.get('vram_gb') or 0
+            brand[row] = codes.setdefault(attributes.get('brand'), len(codes))
+            vendor[row] = codes.setdefault(attributes.get('vendor'), len(codes))
+        with self._lock:
+            self._columns = (products, price, vram, brand, vendor, codes, version)
+            self._cache.clear()
+
+    # Function to rank the products of a brand (None = any) priced at or below max_price
+    # with at least min_vram GB; cached per search and catalog version
+    def rank(self, brand, max_price, min_vram, vendor=None):
+        columns = self._columns
+        if columns is None:
+            return RankedResults([], np.empty(0, dtype=np.intp), np.empty(0))
+        products, price, vram, brand_codes, vendor_codes, codes, version = columns
+        key = (version, brand, max_price, min_vram, vendor)
+        with self._lock:
+            ranked = self._cache.get(key)
+            if ranked is not None and self._columns is columns:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return ranked
+            self.misses += 1
+
+        mask = (price <= max_price) & (vram >= min_vram)
+        for name, column in ((brand, brand_codes), (vendor, vendor_codes)):
+            if name is not None:
+                mask &= column == codes.get(name, -1)
+        candidates = np.flatnonzero(mask)
+        ranked = RankedResults(products, candidates, self._score(price[candidates], vram[candidates],
+                                                                 max_price, min_vram), version)
+
+        with self._lock:
+            if self._columns is columns:  # Not for a catalog that was replaced meanwhile
+                self._cache[key] = ranked
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return ranked
+
+    # Function to score candidates: each criterion is scaled to 0..1, then weighted
+    def _score(self, price, vram, max_price, min_vram):
+        if not len(price):
+            return np.empty(0)
+        weights = self.weights
+        proximity = price / max_price if max_price > 0 else np.zeros_like(price)  # 1 at the budget
+        surplus = vram - min_vram
+        surplus = surplus / max(float(surplus.max()), 1.0)
+        price_per_gb = price / np.maximum(vram, 1.0)
+        value = float(price_per_gb.min()) / np.maximum(price_per_gb, 1e-9)  # 1 for the cheapest GB
+        return weights.price * proximity + weights.vram * surplus + weights.value * value
+
+    def stats(self):
+        columns = self._columns
+        with self._lock:
+            return {'products': len(columns[0]) if columns else 0, 'cached_searches': len(self._cache),
+                    'hits': self.hits, 'misses': self.misses}
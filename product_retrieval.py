@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from atomic_file import write_atomically, write_temp
+
+MAX_DETAIL_CHARS = 300  # Spec text kept per product, both for embedding and for the prompt
+
+
+# Function to pick the identity of a product across scrapes
+def product_key(product):
+    return product.get('url') or product.get('name')
+
+
+# Function to build the text that represents a product in the vector index
+def product_text(product):
+    details = str(product.get('additional_data') or '')[:MAX_DETAIL_CHARS]
+    return f"{product.get('name', '')}\n{details}"
+
+
+def _content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _vectors_hash(vectors):
+    return hashlib.sha1(np.ascontiguousarray(vectors).tobytes()).hexdigest()
+
+
+# Vector index over the Product catalog. Vectors are stored as <path>.npy and opened
+# memory-mapped; <path>.json holds the matching keys and content hashes so a resync
+# only re-encodes products whose name/details changed, plus a hash of the vectors so a
+# .npy and .json written by two different workers are never used together.
+class ProductIndex:
+    def __init__(self, encode, path=None):
+        self._encode = encode  # list of texts -> 2D array of embeddings
+        self.path = path
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._keys = []
+        self._hashes = []
+        self._products = []
+        self.version = None  # Catalog version the index was last synced with
+        self.synced = False
+        self._pending_lock = threading.Lock()
+        self._pending = None  # Latest (products, version) waiting for the background sync
+        self._syncer = None
+        if path:
+            self._load()
+
+    def _embed(self, texts):
+        vectors = np.asarray(self._encode(list(texts)), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    # Function to bring the index in line with the catalog, encoding only what changed.
+    # Returns the number of products that were (re)encoded.
+    def sync(self, products, version=None):
+        with self._lock:
+            old_rows = {key: (row, content_hash) for row, (key, content_hash)
+                        in enumerate(zip(self._keys, self._hashes))}
+            keys, hashes, texts = [], [], []
+            for product in products:
+                text = product_text(product)
+                keys.append(product_key(product))
+                hashes.append(_content_hash(text))
+                texts.append(text)
+
+            reused = [i for i, key in enumerate(keys)
+                      if key in old_rows and old_rows[key][1] == hashes[i] and self._vectors is not None]
+            changed = sorted(set(range(len(keys))) - set(reused))
+
+            new_vectors = None
+            if changed:
+                new_vectors = self._embed([texts[i] for i in changed])
+            dim = new_vectors.shape[1] if new_vectors is not None else (
+                self._vectors.shape[1] if self._vectors is not None else 0)
+            vectors = np.zeros((len(keys), dim), dtype=np.float32)
+            if reused:
+                vectors[reused] = self._vectors[[old_rows[keys[i]][0] for i in reused]]
+            if changed:
+                vectors[changed] = new_vectors
+
+            self._vectors = vectors
+            self._keys = keys
+            self._hashes = hashes
+            self._products = list(products)
+            self.version = version
+            self.synced = True
+            self._save()
+            return len(changed)
+
+    # Function to sync on a background thread, so no request waits for the catalog to be
+    # encoded; calls made while a sync runs are merged into one sync with the latest catalog
+    def sync_in_background(self, products, version=None):
+        with self._pending_lock:
+            self._pending = (products, version)
+            if self._syncer is not None:
+                return
+            self._syncer = threading.Thread(target=self._sync_pending, name="product-index-sync", daemon=True)
+            self._syncer.start()
+
+    def _sync_pending(self):
+        while True:
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    self._syncer = None
+                    return
+            try:
+                changed = self.sync(*pending)
+                print(f"Product index synced, {changed} products encoded")
+            except Exception as e:
+                print(f"Product index sync failed: {e}")
+
+    # Function to give a forked worker fresh locks and no inherited sync thread
+    def restart_after_fork(self):
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._syncer = None
+
+    def _save(self):
+        if not self.path or self._vectors is None:
+            return
+        vectors = self._vectors
+        saved = write_temp(self.path + '.npy', lambda f: np.save(f, vectors, allow_pickle=False))
+        self._vectors = np.load(saved, mmap_mode='r')  # Mapped before the rename: stays this worker's file
+        os.replace(saved, self.path + '.npy')
+        write_atomically(self.path + '.json', lambda f: json.dump(
+            {'keys': self._keys, 'hashes': self._hashes, 'vectors_sha1': _vectors_hash(vectors)}, f,
+            ensure_ascii=False), mode='w')
+
+    def _load(self):
+        if not (os.path.exists(self.path + '.npy') and os.path.exists(self.path + '.json')):
+            return
+        try:
+            vectors = np.load(self.path + '.npy', mmap_mode='r')
+            with open(self.path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable product index {self.path}: {e}")
+            return
+        if len(vectors) == len(meta['keys']) and meta.get('vectors_sha1') == _vectors_hash(vectors):
+            self._vectors, self._keys, self._hashes = vectors, meta['keys'], meta['hashes']
+            # Product dicts arrive with the first sync(); only the vectors are reused until then
+
+    # Function to find the k products closest to an already-embedded question
+    def search_vector(self, vector, k=5):
+        vectors, products = self._vectors, self._products
+        if vectors is None or not products or len(products) != len(vectors):
+            return []
+        scores = vectors @ np.asarray(vector, dtype=np.float32)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]  # Unordered top-k without a full sort
+        top = top[np.argsort(-scores[top])]
+        return [products[i] for i in top]
+
+    # Function to find the k products closest to a question
+    def search(self, question, k=5):
+        return self.search_vector(self._embed([question])[0], k)
+
+
+# Function to turn retrieved products into compact prompt context (one line each)
+def build_product_context(products):
+    lines = []
+    for product in products:
+        details = ' '.join(str(product.get('additional_data') or '').split())[:MAX_DETAIL_CHARS // 2]
+        lines.append(f"- {product.get('name', '')} | {product.get('price', '')} | {details}")
+    return "\n".join(lines)
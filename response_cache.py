@@ -0,0 +1,211 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from atomic_file import write_atomically
+
+
+# Function to reduce a prompt to its cache key: same question, same key
+def normalize_prompt(text):
+    text = unicodedata.normalize('NFC', str(text)).casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' ?!.')
+
+
+# Function to build the cache key of a prompt answered with the given context (e.g. the
+# retrieved products): different products or prices in the context give a different key
+def cache_key(prompt, context=None):
+    key = normalize_prompt(prompt)
+    if context:
+        key += '\n' + hashlib.sha1(str(context).encode('utf-8')).hexdigest()[:16]
+    return key
+
+
+# A pending generation that other threads asking the same question wait on
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+# LRU cache with a TTL and a size bound, optional JSON persistence, and
+# single-flight coalescing of concurrent misses for the same key
+class ResponseCache:
+    def __init__(self, max_size=1000, ttl=3600, path=None, save_every=20, cacheable=bool):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.save_every = save_every  # Persist after this many new entries
+        self.cacheable = cacheable  # Whether a computed value may be stored (default: any non-empty one)
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._in_flight = {}
+        self._async_in_flight = {}  # key -> asyncio.Future, for coroutines on the event loop
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # One writer of the cache file at a time
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        if path:
+            self.load()
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _set_locked(self, key, value):
+        self._entries[key] = (value, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._unsaved += 1
+
+    # Function to look up a prompt without generating anything
+    def get(self, prompt, context=None):
+        with self._lock:
+            return self._get_locked(cache_key(prompt, context))
+
+    # Function to store an answer for a prompt
+    def set(self, prompt, value, context=None):
+        with self._lock:
+            self._set_locked(cache_key(prompt, context), value)
+        self._maybe_save()
+
+    def _maybe_save(self):
+        if self.path and self._unsaved >= self.save_every:
+            self.save()
+
+    # Function to return the cached answer, or run compute(prompt) once for all concurrent askers.
+    # Exceptions from compute are passed to every waiter and nothing is cached; neither is a
+    # value that is not cacheable (it is still returned to every waiter).
+    def get_or_compute(self, prompt, compute, context=None):
+        key = cache_key(prompt, context)
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            pending = self._in_flight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._in_flight[key] = _InFlight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = compute(prompt)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                if pending.error is None and self.cacheable(pending.value):
+                    self._set_locked(key, pending.value)
+                del self._in_flight[key]
+            pending.done.set()
+            self._maybe_save()
+        return pending.value
+
+    # Function to do what get_or_compute() does for asyncio code: concurrent coroutines asking
+    # the same question await one compute(prompt) coroutine instead of blocking a thread.
+    # If the leading coroutine is cancelled, the coroutines waiting on it are cancelled too.
+    async def get_or_compute_async(self, prompt, compute, context=None):
+        key = cache_key(prompt, context)
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            pending = self._async_in_flight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = self._async_in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute(prompt)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # Mark retrieved so an unawaited future does not log a warning
+            raise
+        else:
+            if self.cacheable(value):
+                with self._lock:
+                    self._set_locked(key, value)
+            pending.set_result(value)
+        finally:
+            del self._async_in_flight[key]
+        self._maybe_save()
+        return value
+
+    # Function to report hit/miss counters for sizing the cache
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # Function to write unexpired entries to disk so a restart keeps the cache warm
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            now = time.time()
+            entries = [[key, value, expires_at] for key, (value, expires_at) in self._entries.items()
+                       if expires_at >= now]
+            self._unsaved = 0
+        with self._save_lock:
+            # Atomic swap through a temp file of its own, never a half-written cache file
+            write_atomically(self.path, lambda f: json.dump(entries, f, ensure_ascii=False), mode='w')
+
+    # Function to load entries saved by a previous run
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable response cache {self.path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, value, expires_at in entries:
+                if expires_at >= now:
+                    self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,83 @@
+from collections import Counter
+from contextlib import contextmanager
+import os
+import random
+import sys
+import threading
+import time
+
+# Opt-in profiling of slow webhook events (override with environment variables)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))  # Fraction of events sampled, 0 = off
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "1000"))  # Keep only profiles of events slower than this
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))  # Time between stack samples
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "100"))  # Stop writing after this many
+
+
+# Samples the stack of a fraction of events from a helper thread and writes the samples of
+# the slow ones as collapsed stacks ("a;b;c count" lines, the input of flamegraph.pl and
+# speedscope). Unsampled events cost one random() call.
+class SlowRequestProfiler:
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, slow_seconds=PROFILE_SLOW_MS / 1000,
+                 interval=PROFILE_INTERVAL_MS / 1000, directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.captured = 0
+
+    # Function to profile the block when this event is sampled: with profiler.profile('handle_message'): ...
+    @contextmanager
+    def profile(self, name):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            yield
+            return
+
+        stacks = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stacks, stop),
+                                   name="profile-sampler", daemon=True)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stop.set()
+            sampler.join()
+            with self._lock:
+                self.sampled += 1
+                keep = elapsed >= self.slow_seconds and self.captured < self.max_files
+                if keep:
+                    self.captured += 1
+                    number = self.captured
+            if keep and stacks:
+                self._write(f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{number}", elapsed, stacks)
+
+    def _sample(self, thread_id, stacks, stop):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if names:
+                stacks[';'.join(reversed(names))] += 1
+
+    def _write(self, name, elapsed, stacks):
+        path = os.path.join(self.directory, f"{name}-{elapsed * 1000:.0f}ms.folded")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"Slow event ({elapsed * 1000:.0f} ms) profiled to {path}")
+        except OSError as e:
+            print(f"Failed to write profile {path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {'sample_rate': self.sample_rate, 'sampled': self.sampled, 'captured': self.captured}
@@ -1,19 +1,19 @@
 from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import requests
+import threading
 import time
 import re
-from neo4j import GraphDatabase
-
-# Neo4j connection
-URI = "neo4j://localhost"
-AUTH = ("neo4j", "PASSWORD")
-
-# Function to run a query in Neo4j
-def run_query(query, parameters=None):
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        with driver.session() as session:
-            session.run(query, parameters)
-    driver.close()
+from neo4j_pool import run_query, fetch_all, fetch_one, close_driver
+from product_loader import (
+    ProductBulkLoader, ensure_product_schema, listing_hash, content_hash, publish_catalog_version
+)
 
 # Function to delete all product nodes before scraping
 def delete_existing_products():
@@ -23,25 +23,54 @@ def delete_existing_products():
     '''
     run_query(query)
 
-# Function to store a product in Neo4j
-def save_product_to_neo4j(product_data):
+# Function to load the hashes stored by the previous run, keyed by product name
+def load_known_products():
     query = '''
-    MERGE (p:Product {name: $name})
-    SET p.price = $price, p.img = $img, p.url = $url, p.additional_data = $additional_data
+    MATCH (p:Product)
+    RETURN p.name AS name, p.listing_hash AS listing_hash, p.content_hash AS content_hash
     '''
-    run_query(query, product_data)
+    return {row['name']: row for row in fetch_all(query)}
 
-# URL of the webpage to scrape (main product listing page)
-url = 'https://ihavecpu.com/category/graphic-card'
+# Function to stamp every product still on the listing pages with this run's time
+def mark_products_seen(names, last_seen):
+    query = '''
+    UNWIND $names AS name
+    MATCH (p:Product {name: name})
+    SET p.last_seen = $last_seen
+    '''
+    run_query(query, {'names': names, 'last_seen': last_seen})
+
+# Function to delete, in one step, every product this run did not see
+def retire_missing_products(run_started):
+    query = '''
+    MATCH (p:Product)
+    WHERE p.last_seen IS NULL OR p.last_seen < $run_started
+    DETACH DELETE p
+    RETURN count(*) AS retired
+    '''
+    record = fetch_one(query, {'run_started': run_started})
+    return record['retired'] if record else 0
 
-# Set up the web driver
-driver = webdriver.Chrome()  # Ensure you have the correct driver installed
-driver.get(url)  # Open the webpage
+# Function to tell whether a product's detail page must be fetched: it is new, or its
+# name, price or URL on the listing changed since the previous run
+def listing_changed(known, listing):
+    previous = known.get(listing['name'])
+    return previous is None or previous['listing_hash'] != listing_hash(listing)
 
-# Give the page some time to fully load
-time.sleep(5)
+# Function to tell whether a scraped product differs from what the previous run saved
+def product_changed(known, product_data):
+    previous = known.get(product_data['name'])
+    return previous is None or previous['content_hash'] != content_hash(product_data)
 
-all_products = []
+# Function to end an incremental sync: stamp every listed product as seen and, only if the
+# listing reached its last page, retire the products it no longer shows. Returns the number retired.
+def finish_sync(listings, complete, run_started):
+    mark_products_seen([listing['name'] for listing in listings], run_started)
+    # Products on pages the crawl never reached are not gone from the shop
+    if complete and listings:
+        return retire_missing_products(run_started)
+    print("Listing incomplete, not retiring missing products this run.")
+    return 0
 
 # Function to format product data dynamically
 def format_product_data_dynamically(product_text):
@@ -59,101 +88,264 @@ def format_product_data_dynamically(product_text):
         # If no pattern is found, return the raw text
         return product_text
 
-# Delete existing product nodes before starting scraping
-delete_existing_products()
+# Site layout (class names of the ihavecpu.com listing and product pages)
+LISTING_PATH = '/category/graphic-card'
+LISTING_CONTAINER_CLASS = 'sc-499601bf-0 sc-a93f122a-0 iAXtGY lksMCx'
+LISTING_NAME_CLASS = 'sc-96a18268-0 gApukh'
+LISTING_PRICE_CLASS = 'sc-96a18268-0 cDBdbZ'
+PRODUCT_IMAGE_CLASS = 'sc-499601bf-0 edAFiM'
+PRODUCT_TABLE_CLASS = 'sc-86152792-0 WLBSm'
 
-print("Starting product scraping...")
 
-# Loop through all pages
-while True:
-    # Parse the main product listing page source with BeautifulSoup
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    
-    # Extract product name, price, and product link
-    product_containers = soup.find_all('div', class_='sc-499601bf-0 sc-a93f122a-0 iAXtGY lksMCx')  # Corrected class
-    
-    # Store the data
-    for container in product_containers:
-        # Safely extract product name
-        product_name_tag = container.find('h3', class_='sc-96a18268-0 gApukh')
-        product_name = product_name_tag.get_text(strip=True) if product_name_tag else 'N/A'  # Handle missing product name
-        
-        # Safely extract product price
-        product_price_tag = container.find('span', class_='sc-96a18268-0 cDBdbZ')
-        product_price = product_price_tag.get_text(strip=True) if product_price_tag else 'N/A'  # Handle missing price
-
-        # Safely extract product URL
-        product_url_tag = container.get('href')
-        product_url = "https://ihavecpu.com" + product_url_tag if product_url_tag else 'N/A'  # Handle missing URL
-        
-        if product_url != 'N/A':
-            # Open the individual product page to scrape the image
-            driver.execute_script("window.open('');")
-            driver.switch_to.window(driver.window_handles[1])  # Switch to the new tab
-            driver.get(product_url)  # Open product page
-            time.sleep(3)  # Give some time for the product page to load
-            
-            # Parse the product page with BeautifulSoup
-            product_soup = BeautifulSoup(driver.page_source, 'html.parser')
-            
-            # Scrape the image URL from the product page
-            image_containers = product_soup.find_all('div', class_='sc-499601bf-0 edAFiM')
-            product_img = 'N/A'
-            for img_container in image_containers:
-                img_tag = img_container.find('img')
-                product_img = img_tag['src'] if img_tag else 'N/A'  # Extract the src attribute
-            
-            # Scrape additional product details (if any)
-            table_div = product_soup.find('div', class_='sc-86152792-0 WLBSm')
-            if table_div:
-                table_data = table_div.get_text(strip=True)
-                # Format the data dynamically
-                formatted_table_data = format_product_data_dynamically(table_data)
-            else:
-                formatted_table_data = "N/A"  # If the table or div is not found
-            
-            # Add product data
-            product_data = {
-                'name': product_name,
-                'price': product_price,
-                'img': product_img,
-                'url': product_url,
-                'additional_data': formatted_table_data
-            }
-            
-            # Save product to Neo4j
-            save_product_to_neo4j(product_data)
-            
-            # Add all data to the product list
-            all_products.append(product_data)
-            
-            # Close the current tab and switch back to the original tab
-            driver.close()
-            driver.switch_to.window(driver.window_handles[0])  # Switch back to original tab
-    
-    # Check if the "Next" button is disabled
-    next_button_disabled = soup.find('li', class_='next disabled')
-    if next_button_disabled:
-        break  # Stop if the next button is disabled
+def _css(class_names):
+    return 'div.' + '.'.join(class_names.split())
+
+
+# Shared limit on how often page fetches may start, across all workers
+class RateLimiter:
+    def __init__(self, requests_per_second):
+        self._interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self._interval
+        time.sleep(max(0.0, start - now))
+
+
+# Function to start a Chrome instance (headless unless asked otherwise)
+def new_browser(headless=True):
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    return webdriver.Chrome(options=options)  # Ensure you have the correct driver installed
+
+
+# Function to collect name, price and URL of every product from the listing pages.
+# Returns (listings, complete); complete is False if a page failed to load before the last one.
+def collect_listing(browser, base_url, timeout):
+    browser.get(base_url + LISTING_PATH)
+    listings = []
+    complete = False  # Set once the last page was reached
+    while True:
+        # Wait for the product cards instead of sleeping a fixed time
+        WebDriverWait(browser, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, _css(LISTING_CONTAINER_CLASS))))
+        soup = BeautifulSoup(browser.page_source, 'html.parser')
+
+        for container in soup.find_all('div', class_=LISTING_CONTAINER_CLASS):
+            # Safely extract product name
+            product_name_tag = container.find('h3', class_=LISTING_NAME_CLASS)
+            product_name = product_name_tag.get_text(strip=True) if product_name_tag else 'N/A'  # Handle missing product name
+
+            # Safely extract product price
+            product_price_tag = container.find('span', class_=LISTING_PRICE_CLASS)
+            product_price = product_price_tag.get_text(strip=True) if product_price_tag else 'N/A'  # Handle missing price
+
+            # Safely extract product URL
+            product_url_tag = container.get('href')
+            if product_url_tag:
+                listings.append({'name': product_name, 'price': product_price, 'url': base_url + product_url_tag})
+
+        # Check if the "Next" button is disabled
+        if soup.find('li', class_='next disabled'):
+            complete = True
+            break
+
+        # Find the "Next" button and click it if available
+        try:
+            first_card = browser.find_element(By.CSS_SELECTOR, _css(LISTING_CONTAINER_CLASS))
+            next_link = browser.find_element('xpath', "//li[contains(@class, 'next')]/a")
+        except NoSuchElementException:
+            complete = True  # No "Next" button: this was the last page
+            break
+        try:
+            next_link.click()
+            WebDriverWait(browser, timeout).until(EC.staleness_of(first_card))  # Wait for the next page
+        except Exception as e:
+            print(f"Listing stopped after {len(listings)} products, next page did not load: {e}")
+            break
+    return listings, complete
+
+
+# Function to pull the image URL and spec table out of a product page
+def parse_product_page(html):
+    product_soup = BeautifulSoup(html, 'html.parser')
 
-    # Find the "Next" button and click it if available
+    # Scrape the image URL from the product page
+    product_img = 'N/A'
+    for img_container in product_soup.find_all('div', class_=PRODUCT_IMAGE_CLASS):
+        img_tag = img_container.find('img')
+        product_img = img_tag['src'] if img_tag else 'N/A'  # Extract the src attribute
+
+    # Scrape additional product details (if any)
+    table_div = product_soup.find('div', class_=PRODUCT_TABLE_CLASS)
+    if table_div:
+        formatted_table_data = format_product_data_dynamically(table_div.get_text(strip=True))
+    else:
+        formatted_table_data = "N/A"  # If the table or div is not found
+    return product_img, formatted_table_data
+
+
+# Fetches product pages on worker threads, either over plain HTTP (one pooled
+# session) or through one headless browser per worker thread
+class DetailFetcher:
+    def __init__(self, mode='http', timeout=15, headless=True):
+        self.mode = mode
+        self.timeout = timeout
+        self.headless = headless
+        self._local = threading.local()
+        self._browsers = []
+        self._browsers_lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; ihavecpu-gpu-bot)'
+
+    def _browser(self):
+        browser = getattr(self._local, 'browser', None)
+        if browser is None:
+            browser = self._local.browser = new_browser(self.headless)
+            with self._browsers_lock:
+                self._browsers.append(browser)
+        return browser
+
+    def fetch(self, url):
+        if self.mode == 'http':
+            response = self._session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.text
+        browser = self._browser()
+        browser.get(url)
+        try:
+            WebDriverWait(browser, self.timeout).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, _css(PRODUCT_TABLE_CLASS))))
+        except Exception:
+            pass  # Some products have no spec table; parse whatever loaded
+        return browser.page_source
+
+    def close(self):
+        for browser in self._browsers:
+            browser.quit()
+        self._session.close()
+
+
+# Function to fetch and parse one product page
+def scrape_product(fetcher, limiter, listing):
+    limiter.wait()
+    product_img, formatted_table_data = parse_product_page(fetcher.fetch(listing['url']))
+    return {
+        'name': listing['name'],
+        'price': listing['price'],
+        'img': product_img,
+        'url': listing['url'],
+        'additional_data': formatted_table_data
+    }
+
+
+# Function to scrape every product: listing pages first, then detail pages in parallel
+# Returns (listings, products, complete), where complete says the listing reached its last page;
+# should_fetch(listing) can skip detail pages that did not change.
+def scrape_all(base_url, concurrency, rate, mode, timeout, headless=True, on_product=None, should_fetch=None):
+    browser = new_browser(headless)
+    try:
+        listings, complete = collect_listing(browser, base_url, timeout)
+    finally:
+        browser.quit()
+    to_fetch = [listing for listing in listings if should_fetch is None or should_fetch(listing)]
+    print(f"Found {len(listings)} products, fetching {len(to_fetch)} detail pages with {concurrency} workers...")
+
+    fetcher = DetailFetcher(mode, timeout, headless)
+    limiter = RateLimiter(rate)
+    products = []
     try:
-        next_button = driver.find_element('xpath', "//li[contains(@class, 'next')]/a")
-        next_button.click()
-        time.sleep(5)  # Wait for the next page to load
-    except:
-        break  # Exit the loop if the "Next" button is not found
-
-# Close the web driver
-driver.quit()
-
-print("Scraping finished. All products have been saved to Neo4j.")
-
-# Print all products
-for product in all_products:
-    print(f"Product Name: {product['name']}")
-    print(f"Price: {product['price']}")
-    print(f"Image URL: {product['img']}")
-    print(f"URL: {product['url']}")
-    print(f"Additional Data: {product['additional_data']}")
-    print("\n")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(scrape_product, fetcher, limiter, listing): listing for listing in to_fetch}
+            for future in as_completed(futures):
+                try:
+                    product_data = future.result()
+                except Exception as e:
+                    print(f"Failed to scrape {futures[future]['url']}: {e}")
+                    continue
+                if on_product:
+                    on_product(product_data)
+                products.append(product_data)
+    finally:
+        fetcher.close()
+    return listings, products, complete
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape ihavecpu.com graphic cards into Neo4j")
+    parser.add_argument("--base-url", default="https://ihavecpu.com", help="site root (or a local fixture server)")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel product page fetches")
+    parser.add_argument("--rate", type=float, default=4.0, help="max page fetches per second (0 = unlimited)")
+    parser.add_argument("--mode", choices=["http", "browser"], default="http",
+                        help="fetch product pages over plain HTTP or with headless browsers")
+    parser.add_argument("--timeout", type=float, default=15, help="seconds to wait for a page element")
+    parser.add_argument("--show-browser", action="store_true", help="run Chrome with a window")
+    parser.add_argument("--full", action="store_true",
+                        help="delete all products and reload everything instead of an incremental sync")
+    parser.add_argument("--batch-size", type=int, default=200, help="products per UNWIND write")
+    parser.add_argument("--dry-run", action="store_true", help="scrape every product without touching Neo4j (use with --export)")
+    parser.add_argument("--export", metavar="PATH", help="also write every saved product to a JSONL file")
+    args = parser.parse_args()
+
+    scrape_options = dict(headless=not args.show_browser)
+    if not args.dry_run:
+        ensure_product_schema()  # Constraints and indexes the MERGE and the bot's search rely on
+
+    print("Starting product scraping...")
+    start = time.perf_counter()
+    retired = 0
+    loader = ProductBulkLoader(args.batch_size, dry_run=args.dry_run, export_path=args.export,
+                               last_seen=int(time.time() * 1000))
+
+    if args.full or args.dry_run:
+        # Full reload: delete everything, then re-scrape and re-save every product
+        if not args.dry_run:
+            delete_existing_products()
+        listings, all_products, complete = scrape_all(args.base_url, args.concurrency, args.rate, args.mode,
+                                                      args.timeout, on_product=loader.add, **scrape_options)
+        loader.close()
+    else:
+        # Incremental sync: the catalog stays complete while the crawl runs
+        run_started = loader.last_seen
+        known = load_known_products()
+
+        def save_if_changed(product_data):
+            if product_changed(known, product_data):
+                loader.add(product_data)
+
+        listings, all_products, complete = scrape_all(args.base_url, args.concurrency, args.rate, args.mode,
+                                                      args.timeout, on_product=save_if_changed,
+                                                      should_fetch=lambda listing: listing_changed(known, listing),
+                                                      **scrape_options)
+        loader.close()
+        retired = finish_sync(listings, complete, run_started)
+
+    print(f"Scraping finished in {time.perf_counter() - start:.1f}s. {len(listings)} listed, "
+          f"{len(all_products)} fetched, {loader.written} saved, {retired} retired.")
+    if args.export:
+        print(f"Products exported to {args.export}; load them with: python product_loader.py {args.export}")
+
+    # Let running bots reload their catalog index
+    if not args.dry_run and (loader.written or retired):
+        print(f"Published catalog version {publish_catalog_version()}")
+    close_driver()
+
+    # Print all products
+    for product in all_products:
+        print(f"Product Name: {product['name']}")
+        print(f"Price: {product['price']}")
+        print(f"Image URL: {product['img']}")
+        print(f"URL: {product['url']}")
+        print(f"Additional Data: {product['additional_data']}")
+        print("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from atomic_file import write_atomically
+
+
+# Cache of answered questions searched by meaning instead of exact text.
+# Question embeddings sit in one preallocated float32 matrix; a lookup is a single
+# matrix-vector product over the unit-normalized rows (cosine similarity).
+# Answers quote catalog products and prices, so they expire after ttl seconds and are all
+# dropped when the catalog version changes (set_version, from the catalog refresh hook).
+class SemanticCache:
+    def __init__(self, encode, threshold=0.85, max_size=2000, path=None, ttl=86400):
+        self._encode = encode  # list of texts -> 2D array of embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path  # Prefix for <path>.npy (vectors) and <path>.json (questions/answers)
+        self._lock = threading.Lock()
+        self._vectors = None  # Allocated on first store, once the embedding size is known
+        self._last_used = np.zeros(max_size, dtype=np.float64)
+        self._stored_at = np.zeros(max_size, dtype=np.float64)
+        self.version = None  # Catalog version the answers were given for
+        self._questions = []
+        self._answers = []
+        self._count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self.load()
+
+    # Function to embed texts as unit-length float32 rows
+    def embed(self, texts):
+        vectors = np.asarray(self._encode(list(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # Function to find the stored answer closest to a question.
+    # Returns (answer or None, similarity, question_vector); pass the vector on to store().
+    def lookup(self, question):
+        vector = self.embed([question])[0]
+        with self._lock:
+            if self._count == 0:
+                self.misses += 1
+                return None, 0.0, vector
+            scores = self._vectors[:self._count] @ vector
+            scores[self._stored_at[:self._count] < time.time() - self.ttl] = -1.0  # Expired
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity, vector
+            self.hits += 1
+            self._last_used[best] = time.time()
+            return self._answers[best], similarity, vector
+
+    # Function to remember an answer, evicting the least recently used entry when full
+    def store(self, question, answer, vector=None):
+        if vector is None:
+            vector = self.embed([question])[0]
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            if self._count < self.max_size:
+                slot = self._count
+                self._count += 1
+                self._questions.append(question)
+                self._answers.append(answer)
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._questions[slot] = question
+                self._answers[slot] = answer
+                self.evictions += 1
+            self._vectors[slot] = vector
+            self._last_used[slot] = self._stored_at[slot] = time.time()
+
+    # Function to drop every answer given for another catalog version
+    def set_version(self, version):
+        with self._lock:
+            if version == self.version:
+                return
+            if self._count:
+                print(f"Catalog version changed, dropping {self._count} cached answers")
+            self._questions, self._answers = [], []
+            self._count = 0
+            self.version = version
+
+    def __len__(self):
+        return self._count
+
+    # Function to report hit/miss counters
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': self._count,
+                'max_size': self.max_size,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # Function to persist the embedding matrix and its answers
+    def save(self):
+        if not self.path or self._count == 0:
+            return
+        with self._lock:
+            vectors = self._vectors[:self._count].copy()
+            entries = {
+                'questions': list(self._questions),
+                'answers': list(self._answers),
+                'last_used': self._last_used[:self._count].tolist(),
+                'stored_at': self._stored_at[:self._count].tolist(),
+                'version': self.version,
+                'vectors_sha1': _vectors_hash(vectors),  # Pairs the two files when workers save at once
+            }
+        write_atomically(self.path + '.npy', lambda f: np.save(f, vectors, allow_pickle=False))
+        write_atomically(self.path + '.json', lambda f: json.dump(entries, f, ensure_ascii=False), mode='w')
+
+    # Function to load a matrix saved by a previous run
+    def load(self):
+        if not (os.path.exists(self.path + '.npy') and os.path.exists(self.path + '.json')):
+            return
+        try:
+            vectors = np.load(self.path + '.npy', allow_pickle=False)
+            with open(self.path + '.json', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable semantic cache {self.path}: {e}")
+            return
+        if entries.get('vectors_sha1') != _vectors_hash(vectors):
+            print(f"Ignoring semantic cache {self.path}: vectors do not match the saved answers")
+            return
+        count = min(len(vectors), len(entries['answers']), self.max_size)
+        with self._lock:
+            self._vectors = np.zeros((self.max_size, vectors.shape[1]), dtype=np.float32)
+            self._vectors[:count] = vectors[:count]
+            self._questions = entries['questions'][:count]
+            self._answers = entries['answers'][:count]
+            self._last_used[:count] = entries['last_used'][:count]
+            self._stored_at[:count] = entries['stored_at'][:count]
+            self.version = entries['version']
+            self._count = count
+
+
+def _vectors_hash(vectors):
+    return hashlib.sha1(np.ascontiguousarray(vectors).tobytes()).hexdigest()
@@ -0,0 +1,233 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# The only conversation state kept per user; anything else is not stored
+SESSION_FIELDS = ('step', 'gpu_type', 'price', 'ram', 'result_offset')
+
+LOCK_STRIPES = 256
+
+# Guards opening a lock file in a new process: closing a second copy of it would drop every
+# record lock the process holds on the file
+_open_lock = threading.Lock()
+
+
+def _reset_open_lock():
+    global _open_lock
+    _open_lock = threading.Lock()  # A thread of the parent may have held it at fork
+
+
+os.register_at_fork(after_in_child=_reset_open_lock)
+
+
+def _to_record(state):
+    return tuple(state.get(field) for field in SESSION_FIELDS)
+
+
+def _to_state(record):
+    if record is None:
+        return {}
+    return {field: value for field, value in zip(SESSION_FIELDS, record) if value is not None}
+
+
+# Per-user locks without one lock object per user: a user always maps to the same stripe
+class _StripedLocks:
+    def __init__(self, stripes=LOCK_STRIPES):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+
+# Per-user locks shared by every process using the same lock file: one byte-range lock per
+# stripe, taken after the stripe's thread lock (record locks belong to the process, not the thread)
+class _FileStripedLocks:
+    def __init__(self, path, stripes=LOCK_STRIPES):
+        self.path = path
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._holds = [0] * stripes  # Nested holds of each stripe by the thread holding its lock
+        self._file = None
+        self._pid = None
+
+    def _fd(self):
+        if self._pid != os.getpid():  # Opened per process, never inherited across fork
+            with _open_lock:
+                if self._pid != os.getpid():
+                    self._file = open(self.path, 'a+b')
+                    self._pid = os.getpid()
+        return self._file.fileno()
+
+    @contextmanager
+    def __call__(self, key):
+        stripe = zlib.crc32(str(key).encode('utf-8')) % len(self._locks)  # Same stripe in every process
+        with self._locks[stripe]:
+            if not self._holds[stripe]:
+                fcntl.lockf(self._fd(), fcntl.LOCK_EX, 1, stripe)
+            self._holds[stripe] += 1
+            try:
+                yield
+            finally:
+                self._holds[stripe] -= 1
+                if not self._holds[stripe]:
+                    fcntl.lockf(self._fd(), fcntl.LOCK_UN, 1, stripe)
+
+
+# In-process store: compact tuple records in an LRU bounded by size, expired after ttl idle seconds
+class InMemorySessionStore:
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._records = OrderedDict()  # user_id -> (record, last_used)
+        self._lock = threading.Lock()
+        self._user_lock = _StripedLocks()
+        self.evictions = 0
+
+    def _load(self, user_id):
+        with self._lock:
+            entry = self._records.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] + self.ttl < time.time():
+                del self._records[user_id]
+                return None
+            return entry[0]
+
+    def _save(self, user_id, record):
+        with self._lock:
+            self._records[user_id] = (record, time.time())
+            self._records.move_to_end(user_id)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+                self.evictions += 1
+
+    # Function to read a user's state (a copy; changes are not saved)
+    def get(self, user_id):
+        return _to_state(self._load(user_id))
+
+    # Function to read-modify-write a user's state while holding that user's lock.
+    # If the block raises, the state is not saved: a half-handled message leaves the old state.
+    @contextmanager
+    def edit(self, user_id):
+        with self._user_lock(user_id):
+            state = _to_state(self._load(user_id))
+            yield state
+            self._save(user_id, _to_record(state))
+
+    # Function to replace a user's state (callers that serialize per user themselves, e.g. asyncio)
+    def put(self, user_id, state):
+        self._save(user_id, _to_record(state))
+
+    def delete(self, user_id):
+        with self._lock:
+            self._records.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._records)
+
+
+# Shared store for several processes/hosts on one disk: one SQLite row per user.
+# edit() holds the user's lock in every process sharing the database file, so concurrent
+# workers handling the same user do not lose each other's updates.
+class SQLiteSessionStore:
+    def __init__(self, path='sessions.db', ttl=3600, cleanup_every=500):
+        self.path = path
+        self.ttl = ttl
+        self.cleanup_every = cleanup_every  # Delete expired rows after this many writes
+        self._local = threading.local()
+        self._user_lock = _FileStripedLocks(path + '.lock')
+        self._writes = 0
+        # Connections are opened on first use, so a preloaded master does not hand one to its workers
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():  # Never one inherited across fork
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')  # Readers do not block the writer
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._create_schema(connection)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _create_schema(connection):
+        with _transaction(connection):
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id TEXT PRIMARY KEY,
+                    step INTEGER,
+                    gpu_type TEXT,
+                    price INTEGER,
+                    ram TEXT,
+                    result_offset INTEGER,
+                    updated_at REAL NOT NULL
+                )''')
+            connection.execute('CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)')
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(sessions)')]
+            if 'result_offset' not in columns:  # Database created before paging existed
+                connection.execute('ALTER TABLE sessions ADD COLUMN result_offset INTEGER')
+
+    def _load(self, user_id):
+        row = self._connection().execute(
+            'SELECT step, gpu_type, price, ram, result_offset FROM sessions WHERE user_id = ? AND updated_at >= ?',
+            (user_id, time.time() - self.ttl)).fetchone()
+        return row
+
+    def _save(self, user_id, record):
+        connection = self._connection()
+        self._writes += 1
+        with _transaction(connection):
+            connection.execute(
+                'INSERT OR REPLACE INTO sessions (user_id, step, gpu_type, price, ram, result_offset, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (user_id, *record, time.time()))
+            if self._writes % self.cleanup_every == 0:
+                connection.execute('DELETE FROM sessions WHERE updated_at < ?', (time.time() - self.ttl,))
+
+    def get(self, user_id):
+        return _to_state(self._load(user_id))
+
+    # Function to read-modify-write a user's state while holding that user's lock in every
+    # process; not saved if the block raises, like InMemorySessionStore.edit()
+    @contextmanager
+    def edit(self, user_id):
+        with self._user_lock(user_id):
+            state = _to_state(self._load(user_id))
+            yield state
+            self._save(user_id, _to_record(state))
+
+    def put(self, user_id, state):
+        self._save(user_id, _to_record(state))
+
+    def delete(self, user_id):
+        self._connection().execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM sessions').fetchone()[0]
+
+
+# Function to run statements on an autocommit connection as one write transaction
+@contextmanager
+def _transaction(connection):
+    connection.execute('BEGIN IMMEDIATE')  # Take the write lock up front instead of failing to upgrade
+    try:
+        yield
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+# Function to build the store selected by SESSION_BACKEND (memory or sqlite)
+def create_session_store():
+    ttl = float(os.environ.get("SESSION_TTL", "3600"))
+    backend = os.environ.get("SESSION_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.environ.get("SESSION_DB_PATH", "sessions.db"), ttl=ttl)
+    if backend == "memory":
+        return InMemorySessionStore(int(os.environ.get("SESSION_MAX_USERS", "10000")), ttl=ttl)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
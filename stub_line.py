@@ -0,0 +1,116 @@
+# Local stand-in for the LINE Messaging API reply/push endpoints, for benchmarks and
+# manual testing. Reply tokens starting with "expired" (or used twice) are rejected
+# the way LINE does, so the push fallback can be exercised. It can also fail a share of
+# calls with 500, answer 429 above a request rate, and deduplicates X-Line-Retry-Key.
+#
+#   python stub_line.py --port 8090 --delay 0.05 [--error-rate 0.1] [--max-rps 200]
+#   LINE_API_URL=http://127.0.0.1:8090 python line_main.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+
+
+def make_handler(delay=0.0, error_rate=0.0, max_rps=0, on_call=None):
+    lock = threading.Lock()
+    used_tokens = set()
+    accepted_retry_keys = set()
+    window = [0.0, 0]  # [second started, calls in that second]
+
+    class StubLineHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+        calls = []  # (path, payload) of every accepted call
+        rejected = {'server_error': 0, 'rate_limited': 0, 'duplicate': 0}
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            time.sleep(delay)  # Simulated API round-trip
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                self._send(401, {'message': 'Authentication failed'})
+                return
+            if max_rps:
+                with lock:
+                    now = time.monotonic()
+                    if now - window[0] >= 1.0:
+                        window[0], window[1] = now, 0
+                    window[1] += 1
+                    limited = window[1] > max_rps
+                    if limited:
+                        type(self).rejected['rate_limited'] += 1
+                if limited:
+                    self._send(429, {'message': 'The API rate limit has been exceeded. Try again later.'},
+                               {'Retry-After': '1'})
+                    return
+            if error_rate and random.random() < error_rate:
+                with lock:
+                    type(self).rejected['server_error'] += 1
+                self._send(500, {'message': 'Internal server error'})
+                return
+            retry_key = self.headers.get('X-Line-Retry-Key')
+            if retry_key:
+                with lock:
+                    duplicate = retry_key in accepted_retry_keys
+                    accepted_retry_keys.add(retry_key)
+                    if duplicate:
+                        type(self).rejected['duplicate'] += 1
+                if duplicate:
+                    self._send(409, {'message': 'The retry key is already accepted'})
+                    return
+            if len(payload.get('messages', [])) > 5:
+                self._send(400, {'message': 'The request body has 1 error(s)'})
+                return
+            if self.path == '/v2/bot/message/reply':
+                token = payload.get('replyToken', '')
+                with lock:
+                    invalid = token.startswith('expired') or token in used_tokens
+                    used_tokens.add(token)
+                if invalid:
+                    self._send(400, {'message': 'Invalid reply token'})
+                    return
+            elif self.path != '/v2/bot/message/push':
+                self._send(404, {'message': 'Not found'})
+                return
+            with lock:
+                type(self).calls.append((self.path, payload))
+            if on_call:
+                on_call(self.path, payload)  # e.g. a load test timing when each reply arrives
+            self._send(200, {})
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+    return StubLineHandler
+
+
+# Function to start the stub in a background thread; returns (server, base_url)
+def start_stub_line(port=0, delay=0.0, error_rate=0.0, max_rps=0, on_call=None):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(delay, error_rate, max_rps, on_call))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub LINE Messaging API server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds per API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 500")
+    parser.add_argument("--max-rps", type=int, default=0, help="answer 429 above this many calls per second")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args.delay, args.error_rate, args.max_rps))
+    server.daemon_threads = True
+    print(f"Stub LINE API listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,119 @@
+# In-process stand-in for the Neo4j driver, for load tests and manual testing without a
+# database. It answers the queries the bot runs (product list, catalog version, chat
+# history writes) from a generated catalog, after a configurable delay.
+# Install it before importing line_main.py:
+#
+#   from stub_neo4j import install_stub_neo4j
+#   install_stub_neo4j(delay=0.005)
+#   import line_main
+from contextlib import contextmanager
+import random
+import threading
+import time
+
+import neo4j_pool
+
+MODELS = {
+    'NVIDIA': ('RTX 3050', 'RTX 3060', 'RTX 4060', 'RTX 4060 Ti', 'RTX 4070', 'RTX 4070 SUPER', 'RTX 4080', 'RTX 4090'),
+    'AMD': ('RX 6500 XT', 'RX 6600', 'RX 7600', 'RX 7700 XT', 'RX 7800 XT', 'RX 7900 GRE', 'RX 7900 XTX'),
+}
+VENDORS = ('ASUS', 'MSI', 'GIGABYTE', 'ZOTAC', 'SAPPHIRE', 'POWERCOLOR', 'INNO3D')
+VRAM_SIZES = (4, 6, 8, 12, 16, 24)
+
+
+# Function to generate a catalog shaped like the scraper's Product nodes (same seed, same catalog)
+def generate_products(count=300, seed=7):
+    rng = random.Random(seed)
+    products = []
+    for index in range(count):
+        brand = rng.choice(tuple(MODELS))
+        model = rng.choice(MODELS[brand])
+        vram = rng.choice(VRAM_SIZES)
+        price = rng.randrange(5000, 100000, 10)
+        vendor = rng.choice(VENDORS)
+        products.append({
+            'name': f"{vendor} {brand} {model} {vram}GB",
+            'price': f"฿{price:,}",
+            'price_thb': float(price),
+            'brand': brand,
+            'vendor': vendor,
+            'vram_gb': vram,
+            'additional_data': f"Memory {vram}GB GDDR6, boost clock {rng.randrange(1500, 2700)} MHz",
+            'image': f"https://example.com/gpu/{index}.jpg",
+            'url': f"https://example.com/gpu/{index}",
+        })
+    return products
+
+
+class StubRecord(dict):
+    def data(self):
+        return dict(self)
+
+
+class StubResult:
+    def __init__(self, records):
+        self._records = records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def consume(self):
+        return None
+
+
+class StubSession:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def run(self, query, parameters=None, **kwargs):
+        time.sleep(self._driver.delay)  # Simulated round-trip and query time
+        return StubResult([StubRecord(row) for row in self._driver.answer(query, dict(parameters or {}, **kwargs))])
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+
+class StubDriver:
+    def __init__(self, products=None, delay=0.005, version=1):
+        self.products = generate_products() if products is None else products
+        self.delay = delay
+        self.version = version
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.history_rows = 0  # Chat history turns written
+
+    @contextmanager
+    def session(self, **kwargs):
+        yield StubSession(self)
+
+    def verify_connectivity(self):
+        return None
+
+    def close(self):
+        pass
+
+    # Function to answer one query with a list of row dicts, recognizing it by its text
+    def answer(self, query, parameters):
+        with self._lock:
+            self.queries += 1
+            if 'UNWIND $rows' in query:
+                self.history_rows += len(parameters.get('rows', ()))
+                return []
+        if 'CatalogVersion' in query:
+            return [{'version': self.version}]
+        if 'MATCH (p:Product)' in query:
+            return [dict(product) for product in self.products]
+        return []
+
+
+# Function to route neo4j_pool (and so the whole bot) to a stub driver; returns the driver
+def install_stub_neo4j(delay=0.005, products=None):
+    driver = StubDriver(products, delay)
+    neo4j_pool.use_driver(driver)
+    return driver
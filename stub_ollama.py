@@ -0,0 +1,150 @@
+# Local stand-in for Ollama's /api/generate, for benchmarks and manual testing.
+# Supports both "stream": false (one JSON body) and "stream": true (NDJSON chunks).
+# Optionally imitates a CPU-only host: with contention, every token takes as many times
+# longer as there are generations running, and a model that was unloaded after keep_alive
+# (5 minutes by default, like Ollama) takes load_delay seconds to load again.
+#
+#   python stub_ollama.py --port 11435 --delay 0.5 --token-delay 0.05 [--contention] [--load-delay 5]
+#   OLLAMA_URL=http://127.0.0.1:11435 python line_main.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import re
+import select
+import socket
+import threading
+import time
+
+DEFAULT_ANSWER = ("RTX 4060 เหมาะกับการเล่นเกมระดับ 1080p ได้อย่างลื่นไหล ใช้ไฟน้อย รองรับ DLSS 3 "
+                  "และ ray tracing คุ้มค่าสำหรับงบประมาณระดับกลาง ถ้าต้องการเล่นที่ 1440p ควรพิจารณา "
+                  "RTX 4070 หรือ RX 7800 XT ซึ่งมีหน่วยความจำมากกว่า และแรงกว่าในเกมใหม่ๆ ส่วนงานตัดต่อวิดีโอ "
+                  "การ์ดจอ NVIDIA มีตัวเข้ารหัส NVENC ที่ช่วยให้เรนเดอร์เร็วขึ้นมาก นอกจากนี้ควรตรวจสอบขนาดเคส "
+                  "และกำลังไฟของพาวเวอร์ซัพพลาย โดยทั่วไป RTX 4060 ใช้ไฟประมาณ 115 วัตต์ ในขณะที่ RTX 4070 "
+                  "ใช้ประมาณ 200 วัตต์ แนะนำพาวเวอร์ซัพพลายอย่างน้อย 550 ถึง 650 วัตต์ และเลือกรุ่นที่มีระบบระบายความร้อน "
+                  "แบบสามพัดลมหากเคสมีพื้นที่เพียงพอ เพื่อให้การ์ดจอทำงานได้เงียบและเย็นในระยะยาว")
+
+
+DEFAULT_KEEP_ALIVE = 300.0  # Seconds Ollama keeps an idle model loaded unless asked otherwise
+
+
+# Function to read an Ollama keep_alive value (seconds, or a duration such as "30m") as seconds
+def parse_keep_alive(value):
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = re.fullmatch(r'(-?\d+(?:\.\d+)?)(ms|s|m|h)?', str(value).strip())
+        if not match:
+            return DEFAULT_KEEP_ALIVE
+        seconds = float(match.group(1)) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}[match.group(2)]
+    return float('inf') if seconds < 0 else seconds  # Negative: keep the model loaded forever
+
+
+def make_handler(delay, answer, token_delay=0.0, contention=False, load_delay=0.0):
+    tokens = re.findall(r'\s*\S+', answer)  # Word-sized chunks that keep their leading space
+    lock = threading.Lock()
+    load_lock = threading.Lock()
+
+    class StubOllamaHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+        cancelled = 0  # Streams the client closed before the last token
+        in_flight = 0  # Generations running now
+        max_in_flight = 0
+        model_loads = 0
+        loaded_until = 0.0  # The model counts as unloaded after this time.monotonic()
+
+        def do_POST(self):
+            if self.path != '/api/generate':
+                self.send_error(404)
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            cls = type(self)
+            with load_lock:  # Requests that arrive while the model loads wait for that load
+                cls.requests_served += 1
+                if time.monotonic() > cls.loaded_until:
+                    cls.model_loads += 1
+                    time.sleep(load_delay)
+                cls.loaded_until = time.monotonic() + parse_keep_alive(payload.get('keep_alive'))
+
+            if not payload.get('prompt'):  # An empty prompt only loads the model
+                self._send_json({'model': payload.get('model'), 'response': '', 'done': True})
+                return
+
+            with lock:
+                cls.in_flight += 1
+                cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            try:
+                time.sleep(delay)  # Simulated prompt evaluation / time to first token
+                if payload.get('stream', True):
+                    self._stream(payload)
+                else:
+                    for _ in tokens:  # Whole generation before answering
+                        self._sleep_token()
+                    self._send_json({'model': payload.get('model'), 'response': answer, 'done': True})
+            finally:
+                with lock:
+                    cls.in_flight -= 1
+
+        # Function to wait for one token; with contention, running generations share the CPU
+        def _sleep_token(self):
+            time.sleep(token_delay * (max(1, type(self).in_flight) if contention else 1))
+
+        # Function to check whether the client closed the connection (readable with nothing to read)
+        def _client_gone(self):
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+
+        def _send_json(self, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, payload):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            self.close_connection = True  # Body ends when the connection closes
+            try:
+                for token in tokens:
+                    if self._client_gone():
+                        raise BrokenPipeError  # Ollama stops generating as soon as the client disconnects
+                    line = {'model': payload.get('model'), 'response': token, 'done': False}
+                    self.wfile.write(json.dumps(line, ensure_ascii=False).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+                    self._sleep_token()
+                self.wfile.write(json.dumps({'model': payload.get('model'), 'response': '', 'done': True}).encode() + b'\n')
+            except (BrokenPipeError, ConnectionResetError):
+                type(self).cancelled += 1
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+    return StubOllamaHandler
+
+
+# Function to start the stub in a background thread; returns (server, base_url)
+def start_stub_ollama(port=0, delay=0.5, answer=DEFAULT_ANSWER, token_delay=0.0, contention=False, load_delay=0.0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(delay, answer, token_delay, contention, load_delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds per generated token")
+    parser.add_argument("--contention", action="store_true", help="tokens slow down with every concurrent generation")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="seconds to load an unloaded model")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args.delay, DEFAULT_ANSWER, args.token_delay,
+                                                                        args.contention, args.load_delay))
+    server.daemon_threads = True
+    print(f"Stub Ollama listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
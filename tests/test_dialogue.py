@@ -0,0 +1,45 @@
+from dialogue import MENU, MORE_RESULTS, NO_SEARCH_YET, SEARCH, DialogueEngine
+
+
+def engine():
+    return DialogueEngine(is_gpu_related=lambda text: False, choose=lambda replies: replies[0])
+
+
+def test_more_results_after_a_brand_change_waits_for_the_new_search():
+    dialogue = engine()
+    state = {'step': MENU}
+    dialogue.handle(state, "การ์ดจอ NVDIA")
+    dialogue.handle(state, "10000 บาท")
+    assert dialogue.handle(state, "RAM 8 GB").action == SEARCH
+    state['result_offset'] = 10  # As left by the search after two pages
+
+    dialogue.handle(state, "การ์ดจอ AMD")
+    turn = dialogue.handle(state, MORE_RESULTS)
+    assert (turn.replies, turn.action) == ((NO_SEARCH_YET,), None)
+
+
+def test_more_results_after_a_price_change_waits_for_the_new_search():
+    dialogue = engine()
+    state = {'step': MENU}
+    dialogue.handle(state, "การ์ดจอ NVDIA")
+    state['result_offset'] = 5
+    dialogue.handle(state, "15000 บาท")
+    turn = dialogue.handle(state, MORE_RESULTS)
+    assert (turn.replies, turn.action) == ((NO_SEARCH_YET,), None)
+
+
+def test_more_results_before_any_search_does_not_search():
+    dialogue = engine()
+    state = {'step': MENU}
+    dialogue.handle(state, "การ์ดจอ NVDIA")
+    assert dialogue.handle(state, MORE_RESULTS).action is None  # No price or RAM to search with yet
+
+
+def test_the_new_search_starts_from_the_first_page():
+    dialogue = engine()
+    state = {'step': MENU, 'result_offset': 10}
+    dialogue.handle(state, "การ์ดจอ AMD")
+    dialogue.handle(state, "10000 บาท")
+    assert dialogue.handle(state, "RAM 8 GB").action == SEARCH
+    assert state['result_offset'] == 0
+    assert dialogue.handle(state, MORE_RESULTS).action == SEARCH
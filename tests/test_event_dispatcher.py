@@ -0,0 +1,56 @@
+import threading
+import time
+
+from event_dispatcher import EventDispatcher
+
+
+def test_events_of_one_user_run_one_at_a_time_in_order():
+    dispatcher = EventDispatcher(workers=4)
+    handled = {'a': [], 'b': []}
+    running = {'a': 0, 'b': 0}
+    overlaps = []
+    lock = threading.Lock()
+
+    def handle(user_id, number):
+        with lock:
+            running[user_id] += 1
+            if running[user_id] > 1:
+                overlaps.append((user_id, number))
+        time.sleep(0.001)
+        with lock:
+            running[user_id] -= 1
+            handled[user_id].append(number)
+
+    for number in range(50):
+        for user_id in ('a', 'b'):
+            dispatcher.submit(user_id, handle, user_id, number)
+    dispatcher.close()
+
+    assert handled == {'a': list(range(50)), 'b': list(range(50))}
+    assert overlaps == []
+    assert dispatcher.stats()['processed'] == 100
+
+
+def test_different_users_run_in_parallel():
+    dispatcher = EventDispatcher(workers=2)
+    both_started = threading.Barrier(2, timeout=5)
+    dispatcher.submit('a', both_started.wait)
+    dispatcher.submit('b', both_started.wait)  # Would time out if 'b' waited behind 'a'
+    dispatcher.close()
+
+    assert dispatcher.stats()['failed'] == 0
+
+
+def test_a_failing_event_does_not_stop_the_user_queue():
+    dispatcher = EventDispatcher(workers=1)
+    handled = []
+
+    def fail():
+        raise RuntimeError("handler failed")
+
+    dispatcher.submit('a', fail)
+    dispatcher.submit('a', handled.append, 'next')
+    dispatcher.close()
+
+    assert handled == ['next']
+    assert dispatcher.stats()['failed'] == 1
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+
+from intent_router import IntentRouter
+
+EXAMPLES = {'gpu_question': ["การ์ดจอตัวไหนดี", "RTX 4060 แรงไหม"], 'off_topic': ["สวัสดี", "อากาศดีไหม"]}
+
+
+# Function to build a router whose encoder counts its calls: text -> fixed pseudo-random vector
+def counting_router(cache_path, calls):
+    def encode(texts):
+        calls.append(len(texts))
+        return np.stack([np.random.default_rng(sum(map(ord, text))).normal(size=8) for text in texts])
+    return IntentRouter(encode, examples=EXAMPLES, cache_path=cache_path)
+
+
+def test_centroids_are_saved_once_and_loaded_from_the_same_npz(tmp_path):
+    calls = []
+    built = counting_router(str(tmp_path / 'intent_centroids'), calls).centroids()
+    assert os.listdir(tmp_path) == ['intent_centroids.npz']  # No temp file left behind
+
+    loaded = counting_router(str(tmp_path / 'intent_centroids.npz'), calls).centroids()
+    assert calls == [4]  # The second router read the cache instead of encoding
+    np.testing.assert_array_equal(built, loaded)
+
+
+def test_unreadable_cache_is_rebuilt(tmp_path):
+    path = tmp_path / 'intent_centroids.npz'
+    path.write_bytes(b'half a zip file')
+    calls = []
+    counting_router(str(path), calls).centroids()
+    assert calls == [4]
+    calls.clear()
+    counting_router(str(path), calls).centroids()
+    assert calls == []  # Replaced by a complete file
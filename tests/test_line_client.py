@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from line_client import MAX_MESSAGES_PER_CALL, LineApiError, Outbox
+
+
+# Records the calls an Outbox makes; reply() fails with the given error, if any
+class FakeClient:
+    def __init__(self, reply_error=None):
+        self.reply_error = reply_error
+        self.calls = []
+
+    def reply(self, reply_token, messages):
+        self.calls.append(('reply', reply_token, len(messages)))
+        if self.reply_error:
+            raise self.reply_error
+
+    def push(self, to, messages):
+        self.calls.append(('push', to, len(messages)))
+
+
+def test_one_reply_carries_up_to_five_messages():
+    client = FakeClient()
+    outbox = Outbox(client, 'user', 'token', time.time() * 1000)
+    outbox.add(*[{'type': 'text', 'text': str(n)} for n in range(MAX_MESSAGES_PER_CALL)])
+
+    assert outbox.flush() == 1
+    assert client.calls == [('reply', 'token', MAX_MESSAGES_PER_CALL)]
+
+
+def test_messages_beyond_the_reply_are_pushed():
+    client = FakeClient()
+    outbox = Outbox(client, 'user', 'token', time.time() * 1000)
+    outbox.add(*[{'type': 'text', 'text': str(n)} for n in range(MAX_MESSAGES_PER_CALL + 2)])
+
+    assert outbox.flush() == 2
+    assert client.calls == [('reply', 'token', MAX_MESSAGES_PER_CALL), ('push', 'user', 2)]
+
+
+def test_expired_reply_token_falls_back_to_push():
+    client = FakeClient(reply_error=LineApiError(400, "Invalid reply token"))
+    outbox = Outbox(client, 'user', 'token', time.time() * 1000)
+    outbox.add({'type': 'text', 'text': "hello"})
+
+    outbox.flush()
+    assert client.calls == [('reply', 'token', 1), ('push', 'user', 1)]
+
+
+def test_old_event_skips_the_reply():
+    client = FakeClient()
+    outbox = Outbox(client, 'user', 'token', (time.time() - 120) * 1000, reply_window=50)
+    outbox.add({'type': 'text', 'text': "hello"})
+
+    assert outbox.flush() == 1
+    assert client.calls == [('push', 'user', 1)]
+
+
+def test_other_reply_errors_are_raised():
+    client = FakeClient(reply_error=LineApiError(500, "Internal error"))
+    outbox = Outbox(client, 'user', 'token', time.time() * 1000)
+    outbox.add({'type': 'text', 'text': "hello"})
+
+    with pytest.raises(LineApiError):
+        outbox.flush()
+    assert client.calls == [('reply', 'token', 1)]
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ollama_scheduler import OllamaBusy, OllamaScheduler
+
+
+# Function to ask for a slot on a thread and wait until the question is queued
+def queue_question(scheduler, user_id, granted, release):
+    queued = scheduler.stats()['queued']
+
+    def ask():
+        with scheduler.slot(user_id):
+            granted.append(user_id)
+            release.wait(5)
+
+    thread = threading.Thread(target=ask)
+    thread.start()
+    while scheduler.stats()['queued'] == queued:
+        time.sleep(0.001)
+    return thread
+
+
+def test_waiting_questions_are_granted_round_robin_across_users():
+    scheduler = OllamaScheduler(concurrency=1, deadline=5, max_queue=10)
+    granted = []
+    release = threading.Event()
+    release.set()  # Every granted question finishes right away
+    with scheduler.slot('busy'):
+        threads = [queue_question(scheduler, user_id, granted, release) for user_id in ('a', 'a', 'a', 'b', 'c')]
+    for thread in threads:
+        thread.join()
+
+    assert granted == ['a', 'b', 'c', 'a', 'a']
+    assert scheduler.stats()['in_flight'] == 0
+
+
+def test_question_past_the_deadline_is_turned_away():
+    scheduler = OllamaScheduler(concurrency=1, deadline=0.05, max_queue=10)
+    with scheduler.slot('a'):
+        with pytest.raises(OllamaBusy) as busy:
+            with scheduler.slot('b'):
+                pass
+    assert busy.value.position == 1
+    stats = scheduler.stats()
+    assert (stats['timed_out'], stats['queued'], stats['in_flight']) == (1, 0, 0)
+
+
+def test_full_queue_turns_questions_away_up_front():
+    scheduler = OllamaScheduler(concurrency=1, deadline=5, max_queue=1)
+    granted = []
+    release = threading.Event()
+    with scheduler.slot('a'):
+        thread = queue_question(scheduler, 'b', granted, release)
+        with pytest.raises(OllamaBusy) as busy:
+            with scheduler.slot('c'):
+                pass
+        release.set()
+    thread.join()
+
+    assert busy.value.position is None
+    assert granted == ['b']
+    assert scheduler.stats()['rejected'] == 1
+
+
+def test_expected_wait_past_the_deadline_is_turned_away_up_front():
+    scheduler = OllamaScheduler(concurrency=1, deadline=0.5, max_queue=10)
+    with scheduler.slot('a'):
+        time.sleep(0.6)  # The average generation now takes longer than the deadline
+    with scheduler.slot('a'):
+        started = time.monotonic()
+        with pytest.raises(OllamaBusy):
+            with scheduler.slot('b'):
+                pass
+        assert time.monotonic() - started < 0.5
+    assert scheduler.stats()['rejected'] == 1
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    async def run():
+        scheduler = OllamaScheduler(concurrency=1, deadline=5, max_queue=10)
+
+        async def ask():
+            async with scheduler.slot_async('b'):
+                pass
+
+        async with scheduler.slot_async('a'):
+            waiter = asyncio.create_task(ask())
+            await asyncio.sleep(0.01)
+            assert scheduler.stats()['queued'] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.stats()['queued'] == 0
+        async with scheduler.slot_async('c'):  # The slot was freed, not lost
+            pass
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert (stats['in_flight'], stats['served']) == (0, 2)
@@ -0,0 +1,57 @@
+import random
+
+from product_ranking import RankingEngine
+
+
+# Function to build a catalog where many products share a price and VRAM size, so scores tie
+def tied_catalog(count, seed):
+    rng = random.Random(seed)
+    return [{'name': f"GPU {index}", 'price': '', 'price_thb': float(rng.choice((9000, 10000, 12000))),
+             'brand': rng.choice(('NVIDIA', 'AMD')), 'vendor': 'ASUS', 'vram_gb': rng.choice((8, 12))}
+            for index in range(count)]
+
+
+def test_pages_show_every_match_exactly_once_with_tied_scores():
+    for seed in range(50):
+        products = tied_catalog(200, seed)
+        engine = RankingEngine(cache_size=0)
+        engine.compile(products, version=1)
+        ranked = engine.rank('NVIDIA', 15000.0, 8)
+        rng = random.Random(seed)
+
+        shown = []
+        while len(shown) < len(ranked):
+            shown += ranked.page(len(shown), rng.randint(1, 12))
+
+        expected = [product for product in products if product['brand'] == 'NVIDIA']
+        assert sorted(product['name'] for product in shown) == sorted(product['name'] for product in expected)
+        assert len({product['name'] for product in shown}) == len(shown)
+
+
+def test_pages_follow_the_full_ranking():
+    products = tied_catalog(300, seed=1)
+    engine = RankingEngine(cache_size=0)
+    engine.compile(products, version=1)
+    paged = engine.rank(None, 12000.0, 8)
+    full = engine.rank(None, 12000.0, 8)
+
+    everything = full.page(0, len(full))
+    pages = [product for offset in range(0, len(paged), 10) for product in paged.page(offset, 10)]
+    assert pages == everything
+
+
+def test_page_past_the_end_is_empty():
+    engine = RankingEngine(cache_size=0)
+    engine.compile(tied_catalog(5, seed=2), version=1)
+    ranked = engine.rank(None, 100000.0, 0)
+    assert len(ranked.page(0, 10)) == 5
+    assert ranked.page(5, 10) == []
+
+
+def test_searches_carry_the_catalog_version_they_were_ranked_from():
+    engine = RankingEngine()
+    engine.compile(tied_catalog(20, seed=2), version=1)
+    before = engine.rank(None, 12000.0, 8)
+    engine.compile(tied_catalog(20, seed=3), version=2)
+    after = engine.rank(None, 12000.0, 8)
+    assert (before.version, after.version) == (1, 2)
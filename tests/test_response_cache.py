@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def test_concurrent_threads_share_one_computation():
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def compute(prompt):
+        calls.append(prompt)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("Which GPU?", compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced'] < 7:
+        time.sleep(0.001)  # Every other thread waits on the first one's generation
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["Which GPU?"]
+    assert results == ["answer"] * 8
+    assert cache.get("which gpu") == "answer"
+
+
+def test_computation_error_reaches_every_thread_and_is_not_cached():
+    cache = ResponseCache()
+    release = threading.Event()
+
+    def compute(prompt):
+        release.wait(5)
+        raise RuntimeError("Ollama down")
+
+    errors = []
+
+    def ask():
+        try:
+            cache.get_or_compute("Which GPU?", compute)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4
+    assert cache.get("Which GPU?") is None
+
+
+def test_values_that_are_not_cacheable_are_returned_but_not_stored():
+    cache = ResponseCache(cacheable=lambda value: value != "busy")
+    assert cache.get_or_compute("Which GPU?", lambda prompt: "busy") == "busy"
+    assert cache.get("Which GPU?") is None
+
+    cache = ResponseCache()
+    assert cache.get_or_compute("Which GPU?", lambda prompt: "") == ""  # Empty is not cached by default
+    assert cache.get("Which GPU?") is None
+
+
+def test_same_question_with_other_context_is_computed_again():
+    cache = ResponseCache()
+    cache.get_or_compute("Which GPU?", lambda prompt: "old prices", context="RTX 4060 | 10990")
+    assert cache.get_or_compute("Which GPU?", lambda prompt: "new prices", context="RTX 4060 | 9990") == "new prices"
+
+
+def test_concurrent_coroutines_share_one_computation():
+    async def run():
+        cache = ResponseCache()
+        calls = []
+
+        async def compute(prompt):
+            calls.append(prompt)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*[cache.get_or_compute_async("Which GPU?", compute) for _ in range(8)])
+        return cache, calls, results
+
+    cache, calls, results = asyncio.run(run())
+    assert calls == ["Which GPU?"]
+    assert results == ["answer"] * 8
+    assert cache.stats()['coalesced'] == 7
+    assert cache.get("Which GPU?") == "answer"
+
+
+def test_cancelling_the_leading_coroutine_cancels_its_followers():
+    async def run():
+        cache = ResponseCache()
+        started = asyncio.Event()
+
+        async def compute(prompt):
+            started.set()
+            await asyncio.sleep(5)
+            return "answer"
+
+        leader = asyncio.create_task(cache.get_or_compute_async("Which GPU?", compute))
+        await started.wait()
+        followers = [asyncio.create_task(cache.get_or_compute_async("Which GPU?", compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.wait_for(asyncio.gather(leader, *followers, return_exceptions=True), 1)
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert cache.get("Which GPU?") is None
+    assert cache._async_in_flight == {}  # The next asker starts a new generation
+
+
+def test_async_computation_error_reaches_every_coroutine():
+    async def run():
+        cache = ResponseCache()
+
+        async def compute(prompt):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("Ollama down")
+
+        return await asyncio.gather(*[cache.get_or_compute_async("Which GPU?", compute) for _ in range(3)],
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [RuntimeError] * 3
+
+
+def test_answers_cut_off_or_not_from_the_model_are_not_cacheable():
+    ollama_client = pytest.importorskip("ollama_client")  # Needs requests
+    budget = ollama_client.AnswerBudget()
+    budget.deadline = 0  # The total timeout has passed
+    assert budget.add(" RTX")
+    assert isinstance(budget.answer(), ollama_client.IncompleteAnswer)
+    assert isinstance(ollama_client.AnswerBudget().answer(), ollama_client.IncompleteAnswer)  # Nothing generated
+
+    assert not ollama_client.is_cacheable(ollama_client.IncompleteAnswer("cut off"))
+    assert not ollama_client.is_cacheable(ollama_client.FALLBACK_REPLY)
+    assert not ollama_client.is_cacheable("")
+    assert ollama_client.is_cacheable("RTX 4060 คำตอบจาก Ollama")
@@ -0,0 +1,147 @@
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from selenium.webdriver.common.by import By
+
+import scraping_neo
+from product_loader import content_hash, listing_hash
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ihavecpu')
+LISTING_PAGES = ('listing_page1.html', 'listing_page2.html')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+# Stands in for Chrome on the listing pages: serves the saved pages in order, one per "Next"
+# click; with stuck_on_page set, clicking "Next" on that page never loads the next one
+class FixtureBrowser:
+    def __init__(self, pages=LISTING_PAGES, stuck_on_page=None):
+        self._pages = [read_fixture(name) for name in pages]
+        self._stuck_on_page = stuck_on_page
+        self.index = 0
+
+    def get(self, url):
+        self.index = 0
+
+    @property
+    def page_source(self):
+        return self._pages[self.index]
+
+    def find_element(self, by, value):
+        if by == By.CSS_SELECTOR:
+            return FixtureElement(self, self.index)
+        if 'class="next"' not in self.page_source:
+            raise NoSuchElementException(value)
+        return FixtureElement(self, self.index)
+
+    def quit(self):
+        pass
+
+
+class FixtureElement:
+    def __init__(self, browser, index):
+        self._browser = browser
+        self._index = index
+
+    def click(self):
+        if self._browser.index != self._browser._stuck_on_page:
+            self._browser.index += 1
+
+    def is_enabled(self):
+        if self._browser.index != self._index:
+            raise StaleElementReferenceException("page changed")
+        return True
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves the fixture pages over HTTP, like the shop (scrape_all --base-url)
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=FIXTURES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_listing_walks_every_page():
+    listings, complete = scraping_neo.collect_listing(FixtureBrowser(), 'https://shop', timeout=1)
+    assert complete
+    assert [listing['name'] for listing in listings] == [
+        "MSI GeForce RTX 4060 VENTUS 2X 8G", "SAPPHIRE PULSE Radeon RX 7600 8GB",
+        "ASUS DUAL GeForce RTX 4070 SUPER 12GB"]
+    assert listings[0] == {'name': "MSI GeForce RTX 4060 VENTUS 2X 8G", 'price': "฿10,990",
+                           'url': 'https://shop/product/rtx-4060.html'}
+
+
+def test_listing_that_stops_before_the_last_page_is_incomplete():
+    listings, complete = scraping_neo.collect_listing(FixtureBrowser(stuck_on_page=0), 'https://shop', timeout=0.2)
+    assert not complete
+    assert len(listings) == 2
+
+
+def test_product_page_is_parsed():
+    image, details = scraping_neo.parse_product_page(read_fixture('product/rtx-4060.html'))
+    assert image == 'https://img.example/rtx-4060.jpg'
+    assert '8 GB' in details and '2460 MHz' in details
+
+
+def test_only_new_or_changed_listings_are_fetched(site, monkeypatch):
+    monkeypatch.setattr(scraping_neo, 'new_browser', lambda headless=True: FixtureBrowser())
+    listings, _ = scraping_neo.collect_listing(FixtureBrowser(), site, timeout=1)
+    unchanged, repriced = listings[0], dict(listings[1], price="฿9,990")  # Previous run's listing
+    known = {listing['name']: {'listing_hash': listing_hash(listing), 'content_hash': None}
+             for listing in (unchanged, repriced)}  # The RTX 4070 SUPER is new
+
+    listings, products, complete = scraping_neo.scrape_all(
+        site, concurrency=2, rate=0, mode='http', timeout=1,
+        should_fetch=lambda listing: scraping_neo.listing_changed(known, listing))
+
+    assert complete and len(listings) == 3
+    assert sorted(product['name'] for product in products) == [
+        "ASUS DUAL GeForce RTX 4070 SUPER 12GB", "SAPPHIRE PULSE Radeon RX 7600 8GB"]
+    new = next(product for product in products if product['name'].startswith("ASUS"))
+    assert new['img'] == 'https://img.example/rtx-4070-super.jpg'
+    assert '12 GB' in new['additional_data']
+
+
+def test_product_is_saved_only_when_its_content_changed():
+    product = {'name': "RTX 4060", 'price': "฿10,990", 'img': 'a.jpg', 'url': 'u', 'additional_data': "Memory Size: 8 GB"}
+    known = {"RTX 4060": {'listing_hash': None, 'content_hash': content_hash(product)}}
+    assert not scraping_neo.product_changed(known, product)
+    assert scraping_neo.product_changed(known, dict(product, additional_data="Memory Size: 16 GB"))
+    assert scraping_neo.product_changed({}, product)
+
+
+@pytest.fixture
+def sync_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scraping_neo, 'mark_products_seen', lambda names, at: calls.append(('seen', names, at)))
+    monkeypatch.setattr(scraping_neo, 'retire_missing_products', lambda at: calls.append(('retire', at)) or 4)
+    return calls
+
+
+def test_missing_products_are_retired_after_a_complete_listing(sync_calls):
+    listings = [{'name': "RTX 4060"}, {'name': "RX 7600"}]
+    assert scraping_neo.finish_sync(listings, True, 1000) == 4
+    assert sync_calls == [('seen', ["RTX 4060", "RX 7600"], 1000), ('retire', 1000)]
+
+
+def test_partial_listing_retires_nothing(sync_calls):
+    assert scraping_neo.finish_sync([{'name': "RTX 4060"}], False, 1000) == 0
+    assert sync_calls == [('seen', ["RTX 4060"], 1000)]
+
+
+def test_empty_listing_retires_nothing(sync_calls):
+    assert scraping_neo.finish_sync([], True, 1000) == 0
+    assert [call[0] for call in sync_calls] == ['seen']
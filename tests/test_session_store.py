@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return InMemorySessionStore(**kwargs)
+        return SQLiteSessionStore(str(tmp_path / 'sessions.db'), **kwargs)
+    return make
+
+
+def test_edit_saves_the_state(make_store):
+    store = make_store()
+    with store.edit('a') as state:
+        state.update(step=2, gpu_type="การ์ดจอ AMD", price=10000, result_offset=None)
+    assert store.get('a') == {'step': 2, 'gpu_type': "การ์ดจอ AMD", 'price': 10000}
+    assert store.get('b') == {}
+
+
+def test_edit_that_raises_keeps_the_old_state(make_store):
+    store = make_store()
+    store.put('a', {'step': 2})
+    with pytest.raises(RuntimeError):
+        with store.edit('a') as state:
+            state['step'] = 3
+            raise RuntimeError("handler failed")
+    assert store.get('a') == {'step': 2}
+
+
+def test_idle_state_expires(make_store):
+    store = make_store(ttl=0.05)
+    store.put('a', {'step': 2})
+    time.sleep(0.1)
+    assert store.get('a') == {}
+
+
+def test_threads_editing_one_user_do_not_lose_updates(make_store):
+    store = make_store()
+    store.put('a', {'price': 0})
+
+    def add(times):
+        for _ in range(times):
+            with store.edit('a') as state:
+                price = state['price']
+                time.sleep(0)  # Let another thread in between the read and the write
+                state['price'] = price + 1
+
+    threads = [threading.Thread(target=add, args=(50,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get('a') == {'price': 200}
+
+
+def test_least_recently_used_user_is_evicted():
+    store = InMemorySessionStore(max_size=2)
+    store.put('a', {'step': 1})
+    store.put('b', {'step': 1})
+    store.get('a')  # Reading does not count as use
+    with store.edit('a'):
+        pass
+    store.put('c', {'step': 1})
+    assert (store.get('a'), store.get('b'), len(store), store.evictions) == ({'step': 1}, {}, 2, 1)
+
+
+def _add_in_process(path, times):
+    store = SQLiteSessionStore(path)
+    for _ in range(times):
+        with store.edit('a') as state:
+            state['price'] = state['price'] + 1
+
+
+def test_processes_editing_one_user_do_not_lose_updates(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SQLiteSessionStore(path)
+    store.put('a', {'price': 0})
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_add_in_process, args=(path, 50)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+    assert store.get('a') == {'price': 200}
+
+
+def test_lock_file_is_opened_once_per_process(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    locks = store._user_lock
+    files = set()
+    barrier = threading.Barrier(8)
+
+    def open_lock_file():
+        barrier.wait()
+        locks._fd()
+        files.add(id(locks._file))
+
+    threads = [threading.Thread(target=open_lock_file) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(files) == 1